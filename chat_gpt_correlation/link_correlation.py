@@ -1,5 +1,6 @@
 import pandas as pd
 import os
+import sys
 import concurrent.futures
 import multiprocessing
 from read_file import read_file
@@ -7,6 +8,9 @@ from chatgpt_correlation import calculate_correlation_batch
 from column_mapping import get_ai_column_mapping, apply_mapping
 import traceback
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data_analysis'))
+from change_coordinates_from_ITM import itm2wgs84
+
 
 def find_best_metadata_match(raw_data_row, metadata_files_folder, correlation_threshold=0.85, target_correlation=0.9,
                              batch_size=3):
@@ -92,13 +96,26 @@ def find_best_metadata_match(raw_data_row, metadata_files_folder, correlation_th
     return best_metadata, best_correlation, best_metadata_file, best_explanation, best_matching_points
 
 
-def process_raw_data_parallel(raw_data_path, metadata_folder, example_metadata_path, output_path, max_workers=4):
+def process_raw_data_parallel(raw_data_path, metadata_folder, example_metadata_path, output_path, max_workers=4,
+                              convert_itm=False):
     """
     Process raw data in parallel, with metadata batching
+
+    The ITMX/ITMY columns of the raw data are read column-wise once. By default
+    they are stored as-is in the Near coordinate columns, for process_csv to
+    convert later; with convert_itm they are converted to WGS84 here in one
+    vectorized itm2wgs84 call.
     """
     raw_data = read_file(raw_data_path)
     example_metadata = read_file(example_metadata_path)
 
+    # Near coordinates of every raw row as (latitude, longitude) columns
+    near_coordinates = None
+    if 'ITMX' in raw_data and 'ITMY' in raw_data:
+        itm_x = pd.to_numeric(raw_data['ITMX'], errors='coerce').to_numpy()
+        itm_y = pd.to_numeric(raw_data['ITMY'], errors='coerce').to_numpy()
+        near_coordinates = itm2wgs84(itm_x, itm_y) if convert_itm else (itm_y, itm_x)
+
     # Store all processed rows in a list first
     processed_rows = []
 
@@ -110,7 +127,7 @@ def process_raw_data_parallel(raw_data_path, metadata_folder, example_metadata_p
             futures.append((future, raw_row))
 
         completed = 0
-        for future, raw_row in futures:
+        for position, (future, raw_row) in enumerate(futures):
             try:
                 metadata_row, correlation, metadata_file, explanation, matching_points = future.result()
                 if metadata_row is not None:
@@ -135,12 +152,9 @@ def process_raw_data_parallel(raw_data_path, metadata_folder, example_metadata_p
                                         print(f"Error mapping link number from metadata: {str(e)}")
 
                     # Coordinates from raw data
-                    if 'ITMX' in raw_row and 'ITMY' in raw_row:
-                        try:
-                            new_row['NearLongitude_DecDeg'] = pd.to_numeric(raw_row['ITMX'], errors='coerce')
-                            new_row['NearLatitude_DecDeg'] = pd.to_numeric(raw_row['ITMY'], errors='coerce')
-                        except Exception as e:
-                            print(f"Error mapping coordinates: {str(e)}")
+                    if near_coordinates is not None:
+                        new_row['NearLongitude_DecDeg'] = near_coordinates[1][position]
+                        new_row['NearLatitude_DecDeg'] = near_coordinates[0][position]
 
                     # RxLevel and TxLevel from raw data
                     if 'RxLevel' in raw_row:
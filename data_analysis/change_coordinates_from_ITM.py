@@ -1,11 +1,25 @@
+import numpy as np
 import pandas as pd
-import math
 
-import pandas as pd
-import math
+
+NEAR_COLUMNS = ('NearLongitude_DecDeg', 'NearLatitude_DecDeg')
+FAR_COLUMNS = ('FarLongitude_DecDeg', 'FarLatitude_DecDeg')
 
 
 def itm2wgs84(X, Y):
+    """
+    Convert ITM grid coordinates to WGS84 latitude/longitude.
+
+    Works element-wise on scalars, NumPy arrays or pandas columns, so a whole
+    catalog converts in one call; NaN coordinates stay NaN.
+
+    Args:
+        X: ITM easting(s) in meters
+        Y: ITM northing(s) in meters
+
+    Returns:
+        Tuple: Latitude(s) and longitude(s) in degrees, shaped like X and Y
+    """
     # ITM Grid to WGS84 conversion constants
     a = 6378137.0  # Semi-major axis
     e2 = 0.00669437999013  # Square of eccentricity
@@ -21,18 +35,18 @@ def itm2wgs84(X, Y):
 
     # Initial values
     phi = phi0 + (y / 6366197.724)
-    nu = a / (math.sqrt(1 - (e2 * math.pow(math.sin(phi), 2))))
+    nu = a / (np.sqrt(1 - (e2 * np.power(np.sin(phi), 2))))
 
     # First iteration
     phi = phi0 + (y / 6366197.724) + \
-          (math.pow(x / nu, 2) * math.tan(phi0)) / 2
+          (np.power(x / nu, 2) * np.tan(phi0)) / 2
 
     # Calculate longitude
-    lambda_ = lambda0 + (x / (nu * math.cos(phi0)))
+    lambda_ = lambda0 + (x / (nu * np.cos(phi0)))
 
     # Convert to degrees
-    lat = phi * 180 / math.pi
-    lon = lambda_ * 180 / math.pi
+    lat = phi * 180 / np.pi
+    lon = lambda_ * 180 / np.pi
 
     return lat, lon
 
@@ -41,21 +55,14 @@ def process_csv(input_file, output_file):
     # Read the CSV file
     df = pd.read_csv(input_file)
 
-    # Convert Near coordinates
-    near_converted_coords = [itm2wgs84(row['NearLongitude_DecDeg'], row['NearLatitude_DecDeg'])
-                             for _, row in df.iterrows()]
-
-    # Convert Far coordinates
-    far_converted_coords = [itm2wgs84(row['FarLongitude_DecDeg'], row['FarLatitude_DecDeg'])
-                            for _, row in df.iterrows()]
-
-    # Update Near coordinate columns
-    df['NearLatitude_DecDeg'] = [coord[0] for coord in near_converted_coords]
-    df['NearLongitude_DecDeg'] = [coord[1] for coord in near_converted_coords]
+    # Convert Near and Far coordinates in one call (the *Longitude/*Latitude columns hold ITM X/Y)
+    X = np.concatenate([df[NEAR_COLUMNS[0]].to_numpy(dtype=np.float64), df[FAR_COLUMNS[0]].to_numpy(dtype=np.float64)])
+    Y = np.concatenate([df[NEAR_COLUMNS[1]].to_numpy(dtype=np.float64), df[FAR_COLUMNS[1]].to_numpy(dtype=np.float64)])
+    lat, lon = itm2wgs84(X, Y)
 
-    # Update Far coordinate columns
-    df['FarLatitude_DecDeg'] = [coord[0] for coord in far_converted_coords]
-    df['FarLongitude_DecDeg'] = [coord[1] for coord in far_converted_coords]
+    # Update Near and Far coordinate columns
+    df['NearLatitude_DecDeg'], df['FarLatitude_DecDeg'] = np.split(lat, 2)
+    df['NearLongitude_DecDeg'], df['FarLongitude_DecDeg'] = np.split(lon, 2)
 
     # Save to new CSV file
     df.to_csv(output_file, index=False)
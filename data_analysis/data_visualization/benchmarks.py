@@ -0,0 +1,171 @@
+import numpy as np
+import os
+import subprocess
+import sys
+import time
+
+from rolling_windows import BACKENDS, rolling_std
+
+
+def make_synthetic_attenuation(num_times=1440, num_links=100, missing=0.01, seed=0):
+    """
+    (time, link) attenuation shaped like the operator data: a dry baseline of a
+    few tens of dB with 0.1 dB noise, rain bursts of a few dB and missing readings.
+
+    Args:
+        num_times (int): Number of one-minute samples
+        num_links (int): Number of links
+        missing (float): Fraction of missing (NaN) samples
+        seed (int): Random seed
+
+    Returns:
+        np.ndarray: Attenuation in dB
+    """
+    rng = np.random.default_rng(seed)
+    attenuation = rng.uniform(40, 70, num_links) + rng.normal(0, 0.1, (num_times, num_links))
+    rain = rng.random((num_times, num_links)) < 0.002
+    attenuation += np.convolve(rain.ravel(), np.hanning(60), mode='same').reshape(rain.shape) * 3
+    attenuation[rng.random(attenuation.shape) < missing] = np.nan
+    return np.round(attenuation, 1)
+
+
+def _rolling_std_torch_loop(data, window_size):
+    """The original rolling_std of StatisticalWetDryClassifier (torch, float32, one std per time index),
+    kept here only for comparison"""
+    import torch
+
+    data_tensor = torch.tensor(data, dtype=torch.float32)
+    if len(data_tensor.shape) == 1:
+        data_tensor = data_tensor.unsqueeze(0)
+
+    padding = window_size // 2
+    padded_data = torch.nn.functional.pad(data_tensor, (padding, padding), mode='replicate')
+
+    std_vector = torch.zeros_like(data_tensor)
+    for i in range(data_tensor.shape[1]):
+        window = padded_data[:, i:i + window_size]
+        std_vector[:, i] = torch.std(window, dim=1)
+
+    return std_vector.numpy()
+
+
+def _rolling_std_loop(data, window_size):
+    """_rolling_std_torch_loop on NumPy in float64, the reference when torch is not installed"""
+    data = np.atleast_2d(data)
+    padding = window_size // 2
+    padded_data = np.pad(data, ((0, 0), (padding, padding)), mode='edge')
+
+    std_vector = np.zeros_like(data)
+    for i in range(data.shape[1]):
+        window = padded_data[:, i:i + window_size]
+        std_vector[:, i] = np.std(window, axis=1, ddof=1)
+    return std_vector
+
+
+def benchmark_rolling_std(num_times=10080, num_links=50, window_size=8):
+    """
+    Compare the per-index rolling_std loop with the cumulative-sum kernel on a (time, link) matrix.
+
+    The loop runs link by link, one classifier call per link as process_cml_data
+    did; the kernel labels the whole matrix in one call. The original torch loop
+    is timed when torch is installed, its NumPy port always. With the 'propagate'
+    policy all must agree, NaNs included (the torch loop to float32 precision).
+
+    Args:
+        num_times (int): Number of samples (10080 = a week of 1-minute data)
+        num_links (int): Number of links
+        window_size (int): Rolling window in samples
+
+    Returns:
+        dict: Seconds per path
+    """
+    attenuation = make_synthetic_attenuation(num_times, num_links)
+
+    results = {}
+    try:
+        start_time = time.time()
+        original = np.column_stack([_rolling_std_torch_loop(series, window_size)[0] for series in attenuation.T])
+        results['torch loop'] = time.time() - start_time
+    except ImportError:
+        print("torch is not installed, timing the NumPy port of the original loop only")
+        original = None
+
+    start_time = time.time()
+    expected = np.column_stack([_rolling_std_loop(series, window_size)[0] for series in attenuation.T])
+    results['numpy loop'] = time.time() - start_time
+    if original is not None:
+        np.testing.assert_allclose(original, expected, rtol=1e-4, atol=1e-4)
+
+    for nan_policy in ['propagate', 'omit']:
+        start_time = time.time()
+        std = rolling_std(attenuation, window_size, nan_policy=nan_policy)
+        results[nan_policy] = time.time() - start_time
+        if nan_policy == 'propagate':
+            np.testing.assert_allclose(std, expected, rtol=1e-9, atol=1e-8)
+
+    print(f"{num_times} samples x {num_links} links, window {window_size}")
+    for name, seconds in results.items():
+        print(f"{name:>10}: {seconds:.3f} s")
+    baseline = 'torch loop' if 'torch loop' in results else 'numpy loop'
+    print(f"Speed-up over the {baseline}: {results[baseline] / results['propagate']:.1f}x")
+    return results
+
+
+def _startup_seconds(backend, window_size):
+    """Wall time of a fresh interpreter importing the classifier and labelling a short series with a backend"""
+    script = (
+        "import numpy as np\n"
+        "from wet_and_dry_classification import StatisticalWetDryClassifier\n"
+        f"StatisticalWetDryClassifier(window_size={window_size}, backend='{backend}').classify(np.zeros(100))\n"
+    )
+    start_time = time.time()
+    subprocess.run([sys.executable, '-c', script], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return time.time() - start_time
+
+
+def benchmark_backends(num_times=43200, num_links=100, window_size=8, repeats=3):
+    """
+    Compare startup time and throughput of the rolling std backends.
+
+    Startup is a fresh interpreter importing the classifier and classifying a
+    short series, so it includes importing the backend (and numba's JIT
+    compilation). Throughput is the best of `repeats` warm calls on a
+    (time, link) matrix. Backends whose package is not installed are skipped.
+
+    Args:
+        num_times (int): Number of samples
+        num_links (int): Number of links
+        window_size (int): Rolling window in samples
+        repeats (int): Warm calls timed per backend
+
+    Returns:
+        dict: (startup seconds, samples per second) per available backend
+    """
+    attenuation = make_synthetic_attenuation(num_times, num_links)
+    expected = rolling_std(attenuation, window_size)
+
+    results = {}
+    for backend in BACKENDS:
+        try:
+            rolling_std(attenuation[:window_size], window_size, backend=backend)
+        except ImportError as e:
+            print(f"{backend:>6}: skipped ({e})")
+            continue
+
+        startup = _startup_seconds(backend, window_size)
+        timings = []
+        for _ in range(repeats):
+            start_time = time.time()
+            std = rolling_std(attenuation, window_size, backend=backend)
+            timings.append(time.time() - start_time)
+        np.testing.assert_allclose(std, expected, rtol=1e-7, atol=1e-6)
+
+        results[backend] = (startup, attenuation.size / min(timings))
+        print(f"{backend:>6}: startup {startup:6.2f} s, {results[backend][1]:,.0f} samples/s")
+
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_rolling_std()
+    benchmark_backends()
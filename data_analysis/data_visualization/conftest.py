@@ -0,0 +1,23 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+
+@pytest.fixture
+def network_files(tmp_path):
+    """A small dense link NetCDF file of 1-minute readings and its metadata CSV"""
+    rng = np.random.default_rng(0)
+    links = np.arange(1000, 1006)
+    times = pd.date_range('2023-01-01 00:37', periods=600, freq='min')
+    rx = np.round(rng.normal(-50, 1, (len(times), len(links))), 1)
+    tx = rx + 20 + rng.normal(0, 0.5, rx.shape)
+    rx[rng.random(rx.shape) < 0.05] = np.nan
+
+    netcdf_file, metadata_file = str(tmp_path / 'links.nc'), str(tmp_path / 'metadata.csv')
+    xr.Dataset({'RxLevel': (['time', 'link'], rx), 'TxLevel': (['time', 'link'], tx)},
+               coords={'time': times, 'link': links}).to_netcdf(netcdf_file)
+    pd.DataFrame({'Link': links, 'NearLongitude_DecDeg': 34.8, 'NearLatitude_DecDeg': 32.1,
+                  'FarLongitude_DecDeg': 34.9, 'FarLatitude_DecDeg': 32.2, 'Frequency_GHz': 18.0,
+                  'Length_km': rng.uniform(1, 9, len(links)), 'Polarization': 'V'}).to_csv(metadata_file, index=False)
+    return netcdf_file, metadata_file
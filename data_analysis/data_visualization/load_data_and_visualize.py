@@ -2,14 +2,142 @@ import xarray as xr
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
+import os
+import sys
+from collections import OrderedDict
+from collections.abc import Mapping
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'net_cdf'))
+from create_netcdf_file import normalize_link_ids
+from link_index import build_link_index, file_links, links_covering, load_link_index
+from read_netcdf_file import read_link_window, select_window, time_window
+from sparse_storage import open_link_dataset
+from rolling_windows import rolling_extrema, window_samples
+
+
+COORD_COLUMNS = ['NearLongitude_DecDeg', 'NearLatitude_DecDeg', 'FarLongitude_DecDeg', 'FarLatitude_DecDeg']
+ATTRIBUTE_COLUMNS = ['Frequency_GHz', 'Length_km', 'Polarization']
+METADATA_DUPLICATES = ('first', 'last', 'error')
+
+
+def join_link_metadata(file_links, metadata, duplicates='first'):
+    """
+    Attach the metadata of every link of a NetCDF file in one keyed join.
+
+    Both sides are keyed on the normalized link id (see normalize_link_ids), so
+    1234, '1234', ' 1234' and 1234.0 match. Links missing from either side are
+    dropped. A link with several metadata rows is resolved with `duplicates`:
+        'first' - the first row of the metadata file is used
+        'last'  - the last row of the metadata file is used
+        'error' - a ValueError listing the repeated links is raised
+    A link repeated on the link axis of the file (e.g. a file not yet cleaned with
+    remove_duplicates) keeps its first position, with a warning.
+
+    Args:
+        file_links (array-like): Link axis of the NetCDF file, in file order
+        metadata (pd.DataFrame): Metadata with a 'Link' column, COORD_COLUMNS and ATTRIBUTE_COLUMNS
+        duplicates (str): One of METADATA_DUPLICATES
+
+    Returns:
+        pd.DataFrame: One row per common link, indexed by the int link ID in ascending
+            order, with COORD_COLUMNS, ATTRIBUTE_COLUMNS and the link's 'position' in the file
+    """
+    if duplicates not in METADATA_DUPLICATES:
+        raise ValueError(f"Unknown duplicates policy '{duplicates}', expected one of {METADATA_DUPLICATES}")
+
+    attributes = metadata[COORD_COLUMNS + ATTRIBUTE_COLUMNS].assign(link=normalize_link_ids(metadata['Link']).values)
+    repeated = attributes['link'].duplicated(keep=False)
+    if repeated.any():
+        if duplicates == 'error':
+            raise ValueError(f"Links with several metadata rows: {sorted(attributes.loc[repeated, 'link'].unique())}")
+        print(f"{attributes.loc[repeated, 'link'].nunique()} links have several metadata rows, keeping the {duplicates}")
+        attributes = attributes.drop_duplicates('link', keep=duplicates)
+
+    positions = pd.DataFrame({'link': normalize_link_ids(file_links).values, 'position': np.arange(len(file_links))})
+    repeated = positions['link'].duplicated()
+    if repeated.any():
+        print(f"{positions.loc[repeated, 'link'].nunique()} links are repeated in the file, "
+              f"keeping their first position (run remove_duplicates to merge them)")
+        positions = positions[~repeated]
+    table = positions.merge(attributes, on='link', how='inner', validate='one_to_one')
+    table.index = table.pop('link').astype(np.int64).rename('Link')
+    return table[COORD_COLUMNS + ATTRIBUTE_COLUMNS + ['position']].sort_index()
+
+
+class LinkRecords(Mapping):
+    """
+    Read-only mapping of link ID -> link record, materialized on access.
+
+    Only the compact link table is kept up front. The Rx/Tx arrays of a link are
+    read when its record is first requested and kept in an LRU cache of
+    cache_size records, so iterating over the whole network holds at most
+    cache_size links in memory.
+    """
+
+    def __init__(self, table, load_arrays, cache_size=128):
+        """
+        Args:
+            table (pd.DataFrame): Link table of join_link_metadata
+            load_arrays (callable): position -> (rx, tx) DataArrays loaded in memory
+            cache_size (int): Number of link records kept in memory
+        """
+        self.table = table
+        self._load_arrays = load_arrays
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __getitem__(self, link_id):
+        link_id = int(link_id)
+        if link_id in self._cache:
+            self._cache.move_to_end(link_id)
+            return self._cache[link_id]
+
+        row = self.table.loc[link_id]
+        rx, tx = self._load_arrays(int(row['position']))
+        record = {
+            'coords': tuple(row[COORD_COLUMNS]),
+            'freq': row['Frequency_GHz'],
+            'length': row['Length_km'],
+            'polarization': row['Polarization'],
+            'rx': rx,
+            'tx': tx
+        }
+
+        self._cache[link_id] = record
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return record
+
+    def __iter__(self):
+        return iter(self.table.index)
+
+    def __len__(self):
+        return len(self.table)
+
+    def __contains__(self, link_id):
+        try:
+            return int(link_id) in self.table.index
+        except (TypeError, ValueError):
+            return False
 
 
 class LinkDataset:
-    def __init__(self, netcdf_file, metadata_file):
+    def __init__(self, netcdf_file, metadata_file, t_start=None, t_end=None, cache_size=128,
+                 metadata_duplicates='first'):
         """
         Initialize the LinkDataset with NetCDF and metadata files
+
+        t_start/t_end restrict every link to that time window; only the window is read from disk.
+        Link arrays are loaded on access, keeping the last cache_size links in memory.
+        metadata_duplicates is the policy for links with several metadata rows, see join_link_metadata.
         """
-        self.data = xr.open_dataset(netcdf_file)
+        self.netcdf_file = netcdf_file
+        self.t_start = t_start
+        self.t_end = t_end
+        self.cache_size = cache_size
+        self.metadata_duplicates = metadata_duplicates
+        self.data = open_link_dataset(netcdf_file)
+        self.link_index = load_link_index(netcdf_file)
         self.metadata = pd.read_csv(metadata_file)
 
         # Debug information
@@ -18,53 +146,30 @@ class LinkDataset:
         print("\nFirst few rows of metadata:")
         print(self.metadata.head())
 
-        # Convert link IDs to integers in both sources
-        self.netcdf_links = self.data.link.values.astype(int)
-        self.metadata_links = self.metadata['Link'].values.astype(int)
+        # Link IDs in file order (from the sidecar index when there is one)
+        self.netcdf_links = file_links(netcdf_file, self.data)
+        self.metadata_links = self.metadata['Link'].values
 
-        print("\nFirst few NetCDF link IDs (converted to int):", self.netcdf_links[:5])
+        print("\nFirst few NetCDF link IDs:", self.netcdf_links[:5])
         print("First few metadata link IDs:", self.metadata_links[:5])
 
         self.links = self._match_data_with_metadata()
 
     def _match_data_with_metadata(self):
-        """Match time series data with link characteristics"""
-        links = {}
-
-        # Find common links between NetCDF and metadata
-        common_links = np.intersect1d(self.netcdf_links, self.metadata_links)
-        print(f"\nFound {len(common_links)} common links between NetCDF and metadata")
-
-        for link_id in common_links:
-            try:
-                # Convert link_id to int for metadata lookup
-                metadata_matches = self.metadata[self.metadata['Link'] == int(link_id)]
-                if len(metadata_matches) == 0:
-                    print(f"No metadata found for link {link_id}")
-                    continue
-
-                metadata_row = metadata_matches.iloc[0]
-
-                # Convert link_id to str for NetCDF lookup
-                links[int(link_id)] = {
-                    'coords': (
-                        metadata_row['NearLongitude_DecDeg'],
-                        metadata_row['NearLatitude_DecDeg'],
-                        metadata_row['FarLongitude_DecDeg'],
-                        metadata_row['FarLatitude_DecDeg']
-                    ),
-                    'freq': metadata_row['Frequency_GHz'],
-                    'length': metadata_row['Length_km'],
-                    'polarization': metadata_row['Polarization'],
-                    'rx': self.data['RxLevel'].sel(link=str(link_id)),  # Convert back to str for NetCDF
-                    'tx': self.data['TxLevel'].sel(link=str(link_id))
-                }
-            except Exception as e:
-                print(f"Error processing link {link_id}: {str(e)}")
-                continue
-
-        print(f"\nSuccessfully processed {len(links)} links")
-        return links
+        """Match time series data with link characteristics, as a lazily loaded LinkRecords mapping"""
+        # Columnar link table: metadata of every common link and its position in the file
+        self.link_table = join_link_metadata(self.netcdf_links, self.metadata, self.metadata_duplicates)
+        print(f"\nFound {len(self.link_table)} common links between NetCDF and metadata")
+
+        # The time window is located once; link arrays are read on access
+        self.time_bounds = time_window(self.data.time.values, self.t_start, self.t_end)
+
+        return LinkRecords(self.link_table, self._load_link_arrays, self.cache_size)
+
+    def _load_link_arrays(self, position):
+        """Rx/Tx DataArrays of the link at a position of the file, over the dataset window"""
+        window = select_window(self.data, *self.time_bounds, np.array([position])).isel(link=0).load()
+        return window['RxLevel'], window['TxLevel']
 
     def plot_links(self, scale=True, scale_factor=1):
         """Plot all links on a map"""
@@ -72,9 +177,9 @@ class LinkDataset:
             print("No links to plot!")
             return
 
+        # Coordinates come from the link table, no link arrays are loaded
         plt.figure(figsize=(12, 8))
-        for link_id, link_data in self.links.items():
-            start_x, start_y, end_x, end_y = link_data['coords']
+        for start_x, start_y, end_x, end_y in self.link_table[COORD_COLUMNS].values:
             plt.plot([start_x, end_x], [start_y, end_y], 'b-', alpha=0.5)
 
         if scale:
@@ -84,6 +189,18 @@ class LinkDataset:
         plt.ylabel('Latitude')
         plt.title(f'Link Network Layout ({len(self.links)} links)')
 
+    def get_window(self, link_ids=None, t_start=None, t_end=None):
+        """RxLevel/TxLevel of some links over a time window (defaults to the dataset window), read lazily"""
+        return read_link_window(self.netcdf_file, t_start if t_start is not None else self.t_start,
+                                t_end if t_end is not None else self.t_end, link_ids)
+
+    def links_in_period(self, start=None, end=None):
+        """Link IDs with readings between start and end, answered from the link index"""
+        if self.link_index is None:
+            print("No link index found, building it once...")
+            self.link_index = build_link_index(self.netcdf_file)
+        return links_covering(self.link_index, start, end)
+
     def get_link(self, link_id):
         """Get data for a specific link"""
         return self.links.get(int(link_id))
@@ -145,7 +262,7 @@ class LinkDataset:
             plt.tight_layout()
             plt.show()  # Show each plot separately
 
-    def calculate_attenuation(self, link_id):
+    def calculate_attenuation(self, link_id, window=60):
         """Calculate attenuation for a specific link"""
         link = self.links.get(int(link_id))
         if link is None:
@@ -156,11 +273,39 @@ class LinkDataset:
         time = link['rx'].time
 
         # Calculate rolling maximum and minimum
-        window = 60  # Adjust window size as needed
-        A_max = pd.Series(attenuation).rolling(window=window, center=True).max()
-        A_min = pd.Series(attenuation).rolling(window=window, center=True).min()
+        A_max, A_min = rolling_extrema(attenuation, window_samples(window, time.values))
 
-        return time, A_max, A_min
+        return time, pd.Series(A_max), pd.Series(A_min)
+
+    def calculate_attenuation_batch(self, link_ids=None, window=60, t_start=None, t_end=None, center=True):
+        """
+        Attenuation and its rolling envelopes for many links at once
+
+        The window of all requested links is read in one go and the rolling
+        maximum/minimum are computed on the whole (time, link) matrix in O(n).
+
+        Args:
+            link_ids (array-like, optional): Links to process, all links of the link table if None
+            window (int, str or pd.Timedelta): Rolling window in samples, or a duration such as '1h'
+            t_start (str or datetime, optional): Start of the period, defaults to the dataset window
+            t_end (str or datetime, optional): End of the period, defaults to the dataset window
+            center (bool): Label each window by its centre, like calculate_attenuation
+
+        Returns:
+            xr.Dataset: 'attenuation', 'A_max' and 'A_min' over (time, link)
+        """
+        if link_ids is None:
+            link_ids = self.link_table.index.values
+        data = self.get_window(link_ids, t_start, t_end).load()
+
+        attenuation = data['TxLevel'].values - data['RxLevel'].values
+        A_max, A_min = rolling_extrema(attenuation, window_samples(window, data.time.values), center=center)
+
+        dims = ['time', 'link']
+        return xr.Dataset(
+            {'attenuation': (dims, attenuation), 'A_max': (dims, A_max), 'A_min': (dims, A_min)},
+            coords={'time': data.time.values, 'link': data.link.values}
+        )
 
     def plot_attenuation(self, link_id):
         """Plot attenuation analysis for a specific link"""
@@ -181,23 +326,22 @@ class LinkDataset:
         plt.tight_layout()
 
 
-
-
-dataset = LinkDataset(r"D:\final_project\analysis_files\filtered_netcdf.nc", r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv")
-# Plot network layout
-#dataset.plot_links()
-#plt.show()
-dataset.plot_first_n_links(num_links=1)
-plt.show()
-first_link_id = 679
-
-dataset.plot_attenuation(first_link_id)
-plt.show()
-# Print first available link ID for testing
-#if dataset.links:
-#    first_link_id = next(iter(dataset.links.keys()))
-#    print(f"\nPlotting data for first available link: {first_link_id}")
-#    dataset.plot_link_data(first_link_id)
-#    plt.show()
-#else:
-#    print("No valid links found!")
\ No newline at end of file
+if __name__ == "__main__":
+    dataset = LinkDataset(r"D:\final_project\analysis_files\filtered_netcdf.nc", r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv")
+    # Plot network layout
+    #dataset.plot_links()
+    #plt.show()
+    dataset.plot_first_n_links(num_links=1)
+    plt.show()
+    first_link_id = 679
+
+    dataset.plot_attenuation(first_link_id)
+    plt.show()
+    # Print first available link ID for testing
+    #if dataset.links:
+    #    first_link_id = next(iter(dataset.links.keys()))
+    #    print(f"\nPlotting data for first available link: {first_link_id}")
+    #    dataset.plot_link_data(first_link_id)
+    #    plt.show()
+    #else:
+    #    print("No valid links found!")
\ No newline at end of file
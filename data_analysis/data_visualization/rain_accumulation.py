@@ -0,0 +1,178 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+from netCDF4 import Dataset
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'net_cdf'))
+from netcdf_layout import read_region
+from read_netcdf_file import link_positions, time_window
+
+
+DEFAULT_RESOLUTIONS = ('1h', '1D')
+
+
+def _decode_times(nc):
+    """Time axis of a rain file (integer seconds in TIME_UNITS) as datetime64[ns]"""
+    return np.asarray(nc['time'][:]).astype('datetime64[s]').astype('datetime64[ns]')
+
+
+def aggregate_names(resolution):
+    """Dimension and variable names of the accumulation aggregate of a resolution"""
+    return f'time_{resolution}', f'rain_accumulation_{resolution}'
+
+
+def add_accumulation_aggregates(rain_path, resolutions=DEFAULT_RESOLUTIONS, block_links=1024):
+    """
+    Store the rain accumulation of every link at the end of each period of coarser resolutions.
+
+    For a resolution such as '1h' the file gains a 'time_1h' axis holding the
+    start of every hour with data and 'rain_accumulation_1h' over ('time_1h', 'link')
+    holding the accumulation at the last sample of that hour, so hourly or daily
+    totals are differences of consecutive rows of a small variable.
+
+    Args:
+        rain_path (str): Output of run_rain_pipeline
+        resolutions (iterable): Fixed pandas frequencies ('15min', '1h', '1D', ...)
+        block_links (int): Number of links copied at once
+    """
+    with Dataset(rain_path, 'a') as nc:
+        times = pd.DatetimeIndex(_decode_times(nc))
+        accumulation = nc['rain_accumulation']
+        n_links = len(nc.dimensions['link'])
+
+        for resolution in resolutions:
+            dim, name = aggregate_names(resolution)
+            if name in nc.variables:
+                print(f"{name} already exists, skipping")
+                continue
+
+            periods = times.floor(resolution)
+            # Last sample of every period
+            ends = np.flatnonzero(np.r_[periods[1:] != periods[:-1], len(periods) > 0])
+
+            nc.createDimension(dim, len(ends))
+            period_var = nc.createVariable(dim, 'i8', (dim,))
+            period_var.units = nc['time'].units
+            period_var.calendar = 'proleptic_gregorian'
+            period_var[:] = periods[ends].values.astype('datetime64[s]').astype(np.int64)
+
+            var = nc.createVariable(name, 'f8', (dim, 'link'), fill_value=np.nan, zlib=True, complevel=4)
+            var.units = 'mm'
+            var.long_name = f'Rain accumulated since the start of the file, at the end of each {resolution} period'
+            for start in range(0, n_links, block_links):
+                links = slice(start, min(start + block_links, n_links))
+                var[:, links] = read_region(accumulation, (ends, links))
+
+            print(f"Added {name}: {len(ends)} periods")
+
+
+class RainAccumulation:
+    def __init__(self, rain_path):
+        """
+        Rain totals of a rain file over arbitrary periods, answered from its prefix sums.
+
+        run_rain_pipeline stores the accumulation of every link since the first
+        time step, so the total of [t1, t2] is the accumulation at the last sample
+        up to t2 minus the one before t1: two reads per link, whatever the length
+        of the period. Only the time and link axes are held in memory.
+
+        Args:
+            rain_path (str): Output of run_rain_pipeline
+        """
+        self.rain_path = rain_path
+        self.nc = Dataset(rain_path, 'r')
+        self.times = _decode_times(self.nc)
+        self.links = np.asarray(self.nc['link'][:])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.nc.close()
+
+    def _columns(self, link_ids):
+        """Positions of link IDs on the link axis, all links if None"""
+        if link_ids is None:
+            return np.arange(len(self.links))
+        return link_positions(self.links, link_ids)
+
+    def _read(self, name, rows, columns):
+        """(rows, columns) of a (time, link) variable, columns in any order"""
+        unique_columns, inverse = np.unique(columns, return_inverse=True)
+        if not len(unique_columns):
+            return np.zeros((len(np.arange(len(self.nc[name]))[rows]), 0))
+        return read_region(self.nc[name], (rows, unique_columns))[:, inverse]
+
+    def _accumulation_at(self, rows, columns):
+        """Accumulation at some time rows of some link columns; row -1 is the zero before the first sample"""
+        unique_rows, inverse = np.unique(rows, return_inverse=True)
+        values = np.zeros((len(unique_rows), len(columns)))
+        stored = unique_rows >= 0
+        if stored.any():
+            values[stored] = self._read('rain_accumulation', unique_rows[stored], columns)
+        return values[inverse]
+
+    def window_totals(self, windows, link_ids=None):
+        """
+        Rain totals of many periods
+
+        Args:
+            windows (iterable): (t_start, t_end) pairs, bounds included, None for open ends
+            link_ids (array-like, optional): Links to report, all links if None
+
+        Returns:
+            pd.DataFrame: Total rain in mm, one row per window and one column per link
+        """
+        windows = list(windows)
+        columns = self._columns(link_ids)
+        bounds = np.array([time_window(self.times, t_start, t_end) for t_start, t_end in windows],
+                          dtype=np.int64).reshape(-1, 2)
+
+        # A window [start, stop) sums the samples after row start - 1 up to row stop - 1
+        values = self._accumulation_at(np.concatenate([bounds[:, 1] - 1, bounds[:, 0] - 1]), columns)
+        totals = values[:len(windows)] - values[len(windows):]
+        totals[bounds[:, 1] == bounds[:, 0]] = 0.0
+        return pd.DataFrame(totals, index=pd.MultiIndex.from_tuples(windows, names=['t_start', 't_end'])
+                            if windows else None, columns=pd.Index(self.links[columns], name='link'))
+
+    def total(self, t_start=None, t_end=None, link_ids=None):
+        """
+        Rain total of one period
+
+        Returns:
+            pd.Series: Total rain in mm per link
+        """
+        return self.window_totals([(t_start, t_end)], link_ids).iloc[0]
+
+    def period_totals(self, resolution, link_ids=None, t_start=None, t_end=None):
+        """
+        Rain totals of every period of a stored resolution, see add_accumulation_aggregates
+
+        Args:
+            resolution (str): Resolution of an aggregate of the file, e.g. '1h'
+            link_ids (array-like, optional): Links to report, all links if None
+            t_start (str or datetime, optional): First period to report (by period start)
+            t_end (str or datetime, optional): Last period to report (by period start)
+
+        Returns:
+            pd.DataFrame: Total rain in mm, one row per period and one column per link
+        """
+        dim, name = aggregate_names(resolution)
+        if name not in self.nc.variables:
+            raise KeyError(f"{self.rain_path} has no {resolution} aggregate, see add_accumulation_aggregates")
+
+        periods = np.asarray(self.nc[dim][:]).astype('datetime64[s]').astype('datetime64[ns]')
+        first, last = time_window(periods, t_start, t_end)
+        columns = self._columns(link_ids)
+
+        # One extra period before the first one reported is the base of its difference
+        if first > 0:
+            totals = np.diff(self._read(name, slice(first - 1, last), columns), axis=0)
+        else:
+            totals = np.diff(self._read(name, slice(0, last), columns), axis=0, prepend=0)
+        return pd.DataFrame(totals, index=pd.DatetimeIndex(periods[first:last], name='time'),
+                            columns=pd.Index(self.links[columns], name='link'))
@@ -3,6 +3,29 @@ import xarray as xr
 import pandas as pd
 import matplotlib.pyplot as plt
 from typing import Tuple, Dict
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'net_cdf'))
+from create_netcdf_file import normalize_link_ids
+from link_index import file_links
+from read_netcdf_file import link_positions, read_link_window
+from sparse_storage import open_link_dataset
+from load_data_and_visualize import join_link_metadata
+from wet_and_dry_classification import StatisticalWetDryClassifier
+
+
+FREQUENCY_BANDS = ('low', 'medium', 'high')
+BAND_EDGES_GHZ = [10, 20]  # Lower edges of the 'medium' and 'high' bands
+H_POLARIZATION_ALPHA_FACTOR = 1.2
+MAX_RAIN_RATE = 200  # mm/hr, sanity cap of the estimates
+
+
+def sampling_interval_hours(times):
+    """Median step of a time axis in hours, the duration every rain rate sample stands for (0 for one sample)"""
+    if len(times) < 2:
+        return 0.0
+    return pd.Series(np.diff(np.asarray(times).astype('datetime64[ns]'))).median() / pd.Timedelta(hours=1)
 
 
 class RainfallEstimator:
@@ -34,20 +57,29 @@ class RainfallEstimator:
         Returns:
             Tuple[float, float]: α and β parameters
         """
-        # Select base parameters based on frequency
-        if frequency < 10:
-            alpha = self.power_law_params['alpha']['low']
-            beta = self.power_law_params['beta']['low']
-        elif frequency < 20:
-            alpha = self.power_law_params['alpha']['medium']
-            beta = self.power_law_params['beta']['medium']
-        else:
-            alpha = self.power_law_params['alpha']['high']
-            beta = self.power_law_params['beta']['high']
+        alpha, beta = self.get_power_law_params_batch([frequency], [polarization])
+        return float(alpha[0]), float(beta[0])
+
+    def get_power_law_params_batch(self, frequencies, polarizations) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get α and β parameters of many links at once.
+
+        Args:
+            frequencies (array-like): Link frequencies in GHz
+            polarizations (array-like): Link polarizations ('V' or 'H')
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: α and β per link
+        """
+        # Select base parameters based on frequency (f < 10, 10 ≤ f < 20, f ≥ 20 GHz; NaN falls in the last band)
+        band = np.digitize(np.asarray(frequencies, dtype=np.float64), BAND_EDGES_GHZ)
+        band[np.isnan(np.asarray(frequencies, dtype=np.float64))] = len(BAND_EDGES_GHZ)
+        alpha = np.array([self.power_law_params['alpha'][name] for name in FREQUENCY_BANDS])[band]
+        beta = np.array([self.power_law_params['beta'][name] for name in FREQUENCY_BANDS])[band]
 
         # Adjust for polarization (horizontal polarization typically has higher attenuation)
-        if polarization.upper() == 'H':
-            alpha *= 1.2
+        horizontal = np.char.upper(np.asarray(polarizations, dtype=str)) == 'H'
+        alpha = np.where(horizontal, alpha * H_POLARIZATION_ALPHA_FACTOR, alpha)
 
         return alpha, beta
 
@@ -66,60 +98,92 @@ class RainfallEstimator:
         Returns:
             np.ndarray: Estimated rainfall intensity in mm/hr
         """
-        alpha, beta = self.get_power_law_params(frequency, polarization)
+        attenuation = np.asarray(attenuation, dtype=np.float64)
+        rainfall = self.calculate_rainfall_batch(attenuation.reshape(len(attenuation), -1),
+                                                 np.asarray(wet_periods).reshape(len(attenuation), -1),
+                                                 [link_length], [frequency], [polarization])
+        return rainfall.reshape(attenuation.shape)
+
+    def calculate_rainfall_batch(self, attenuation: np.ndarray, wet_periods: np.ndarray, link_lengths,
+                                 frequencies, polarizations) -> np.ndarray:
+        """
+        Calculate rainfall intensity of many links at once using the power-law model.
+
+        Args:
+            attenuation (np.ndarray): (time, link) measured attenuation
+            wet_periods (np.ndarray): (time, link) wet-dry classification (1 for wet, 0 for dry)
+            link_lengths (array-like): Length of every link in km
+            frequencies (array-like): Frequency of every link in GHz
+            polarizations (array-like): Polarization of every link
 
-        # Initialize rainfall array
-        rainfall = np.zeros_like(attenuation)
+        Returns:
+            np.ndarray: (time, link) estimated rainfall intensity in mm/hr, 0 in dry periods
+                and where the attenuation is negative, NaN where it is missing in a wet period
+        """
+        alpha, beta = self.get_power_law_params_batch(frequencies, polarizations)
+        link_lengths = np.asarray(link_lengths, dtype=np.float64)
 
         # Calculate rainfall only for wet periods
         # Using the power-law model: R = (A/(α*L))^(1/β)
-        wet_mask = wet_periods == 1
-        normalized_attenuation = attenuation[wet_mask] / link_length
+        normalized_attenuation = np.clip(attenuation / link_lengths, 0, None)
+        rainfall = np.power(normalized_attenuation / alpha, 1 / beta)
+        rainfall = np.where(np.asarray(wet_periods) == 1, rainfall, 0.0)
 
-        rainfall[wet_mask] = np.power(normalized_attenuation / alpha, 1 / beta)
+        # Cap unrealistic high values as sanity check
+        return np.minimum(rainfall, MAX_RAIN_RATE)
+
+    @staticmethod
+    def accumulate_rainfall(rainfall: np.ndarray, sample_hours: float, initial=0.0) -> np.ndarray:
+        """
+        Rain accumulated along time of a (time, link) rain rate matrix, missing estimates counted as no rain
 
-        # Remove negative values and unrealistic high values
-        rainfall[rainfall < 0] = 0
-        rainfall[rainfall > 200] = 200  # Cap at 200 mm/hr as sanity check
+        Args:
+            rainfall (np.ndarray): Rain rates in mm/hr
+            sample_hours (float): Sampling interval in hours, see sampling_interval_hours
+            initial (float or np.ndarray): Accumulation of every link before the first row, in mm
 
-        return rainfall
+        Returns:
+            np.ndarray: Accumulated rain in mm (rate times sampling interval, summed)
+        """
+        return initial + np.cumsum(np.nan_to_num(rainfall, nan=0.0) * sample_hours, axis=0)
 
 
-def process_and_plot_rainfall(netcdf_path: str, metadata_path: str, link_id):
+def process_and_plot_rainfall(netcdf_path: str, metadata_path: str, link_id, t_start=None, t_end=None,
+                              backend: str = 'numpy'):
     """
     Process CML data and estimate rainfall using the power-law model.
 
     Args:
         netcdf_path (str): Path to NetCDF file
         metadata_path (str): Path to metadata CSV file
-        link_id (str, optional): Specific link ID to process
+        link_id (str or int, optional): Specific link ID to process, the first link if None; KeyError if
+            the file has no such link
+        t_start (str or datetime, optional): Start of the period to process, only this window is read
+        t_end (str or datetime, optional): End of the period to process
+        backend (str): Compute backend of the wet-dry classifier
     """
     # Load data
-    ds = xr.open_dataset(netcdf_path)
+    ds = open_link_dataset(netcdf_path)
     metadata = pd.read_csv(metadata_path)
 
-    # Get available links
-    available_links = ds.link.values
-    if link_id is None:
-        link_id = available_links[0]
-    elif link_id not in available_links:
-        print(f"Link ID '{link_id}' not found. Using first available link: {available_links[0]}")
-        link_id = available_links[0]
+    # Get available links (from the sidecar link index when there is one)
+    available_links = file_links(netcdf_path, ds)
+    # '8394' and 8394 name the same link; an unknown id raises KeyError
+    link_id = available_links[0] if link_id is None else available_links[link_positions(available_links, link_id)[0]]
 
     # Get link metadata
-    metadata['Link'] = metadata['Link'].astype(str)
-    link_meta = metadata[metadata['Link'] == link_id].iloc[0]
+    link_meta = metadata[normalize_link_ids(metadata['Link']).values == str(link_id)].iloc[0]
 
-    # Get link data
-    rx_data = ds.RxLevel.sel(link=link_id).values
-    tx_data = ds.TxLevel.sel(link=link_id).values
+    # Get link data, reading only the requested time window
+    window = read_link_window(netcdf_path, t_start, t_end, link_id)
+    rx_data = window.RxLevel.values
+    tx_data = window.TxLevel.values
 
     # Calculate attenuation
     attenuation = tx_data - rx_data
 
     # Perform wet-dry classification
-    from wet_and_dry_classification import StatisticalWetDryClassifier
-    classifier = StatisticalWetDryClassifier()
+    classifier = StatisticalWetDryClassifier(backend=backend)
     wet_dry_classification, _ = classifier.classify(attenuation)
 
     # Initialize rainfall estimator
@@ -138,8 +202,8 @@ def process_and_plot_rainfall(netcdf_path: str, metadata_path: str, link_id):
         polarization=str(link_meta['Polarization'])
     )
 
-    # Calculate cumulative rainfall
-    cumulative_rainfall = np.cumsum(rainfall)
+    # Calculate cumulative rainfall in mm
+    cumulative_rainfall = estimator.accumulate_rainfall(rainfall, sampling_interval_hours(window.time.values))
 
     # Plotting
     plt.figure(figsize=(12, 6))
@@ -154,8 +218,63 @@ def process_and_plot_rainfall(netcdf_path: str, metadata_path: str, link_id):
 
     return cumulative_rainfall, rainfall
 
-cumulative_rainfall, rainfall = process_and_plot_rainfall(
-     r"D:\final_project\analysis_files\filtered_netcdf.nc",
-     r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv",
-     link_id="8394"
- )
\ No newline at end of file
+
+def estimate_network_rainfall(netcdf_path: str, metadata_path: str, link_ids=None, t_start=None, t_end=None,
+                              backend: str = 'numpy', metadata_duplicates: str = 'first') -> xr.Dataset:
+    """
+    Estimate rainfall of many links over a period in one pass.
+
+    The NetCDF window and the metadata are read once, the whole (time, link)
+    attenuation matrix is classified in one call and the rainfall of every link
+    comes from per-link α/β vectors.
+
+    Args:
+        netcdf_path (str): Path to NetCDF file
+        metadata_path (str): Path to metadata CSV file
+        link_ids (array-like, optional): Links to process, all links with metadata if None
+        t_start (str or datetime, optional): Start of the period to process
+        t_end (str or datetime, optional): End of the period to process
+        backend (str): Compute backend of the wet-dry classifier
+        metadata_duplicates (str): Policy for links with several metadata rows, see join_link_metadata
+
+    Returns:
+        xr.Dataset: 'attenuation', 'wet', 'rainfall' (mm/hr) and 'cumulative_rainfall' (mm, rate times
+            the sampling interval accumulated from the first time step, like rain_pipeline's
+            'rain_accumulation') over (time, link)
+    """
+    netcdf_links = file_links(netcdf_path)
+
+    link_table = join_link_metadata(netcdf_links, pd.read_csv(metadata_path), metadata_duplicates)
+    if link_ids is not None:
+        link_table = link_table.loc[np.asarray(link_ids).astype(np.int64)]
+    print(f"Estimating rainfall for {len(link_table)} links")
+
+    window = read_link_window(netcdf_path, t_start, t_end, netcdf_links[link_table['position'].values]).load()
+    attenuation = window.TxLevel.values - window.RxLevel.values
+
+    classifier = StatisticalWetDryClassifier(backend=backend)
+    wet, _ = classifier.classify(attenuation)
+
+    estimator = RainfallEstimator()
+    rainfall = estimator.calculate_rainfall_batch(attenuation, wet, link_table['Length_km'].values,
+                                                  link_table['Frequency_GHz'].values,
+                                                  link_table['Polarization'].values)
+
+    dims = ['time', 'link']
+    return xr.Dataset(
+        {
+            'attenuation': (dims, attenuation),
+            'wet': (dims, wet.astype(np.int8)),
+            'rainfall': (dims, rainfall),
+            'cumulative_rainfall': (dims, estimator.accumulate_rainfall(rainfall,
+                                                                        sampling_interval_hours(window.time.values)))
+        },
+        coords={'time': window.time.values, 'link': link_table.index.values}
+    )
+
+if __name__ == "__main__":
+    cumulative_rainfall, rainfall = process_and_plot_rainfall(
+         r"D:\final_project\analysis_files\filtered_netcdf.nc",
+         r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv",
+         link_id="8394"
+     )
\ No newline at end of file
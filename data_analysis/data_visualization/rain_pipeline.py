@@ -0,0 +1,223 @@
+import numpy as np
+import pandas as pd
+import os
+import sys
+import time
+import concurrent.futures
+from collections import deque
+from datetime import datetime
+from netCDF4 import Dataset
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'net_cdf'))
+from link_index import file_links
+from netcdf_layout import TIME_UNITS, variable_storage, write_region
+from read_netcdf_file import select_window, time_window
+from sparse_storage import open_link_dataset
+from load_data_and_visualize import join_link_metadata
+from rain_accumulation import DEFAULT_RESOLUTIONS, add_accumulation_aggregates
+from rain_estimator import RainfallEstimator, sampling_interval_hours
+from wet_and_dry_classification import StatisticalWetDryClassifier
+from wet_events import event_runs, event_table, merge_event_runs, write_wet_events
+
+
+RAIN_VARIABLES = {
+    # name: (datatype, units, long_name)
+    'rain_rate': ('f8', 'mm/hr', 'Estimated rain rate'),
+    'rain_accumulation': ('f8', 'mm', 'Rain accumulated since the start of the file'),
+    'wet': ('i1', '1', 'Wet-dry classification (1 for wet, 0 for dry)')
+}
+BLOCK_CELL_BYTES = 96  # Rx, Tx, attenuation, padded copies, std, wet and rain rate per (time, link) cell
+
+
+def _create_rain_netcdf(path, times, links, time_chunk, compression_level, source_file):
+    """
+    Create the output NetCDF of the rain pipeline with its time and link axes filled in
+
+    Returns:
+        Dataset: The open netCDF4 dataset
+    """
+    nc = Dataset(path, 'w', format='NETCDF4')
+    nc.createDimension('time', len(times))
+    nc.createDimension('link', len(links))
+
+    time_var = nc.createVariable('time', 'i8', ('time',))
+    time_var.units = TIME_UNITS
+    time_var.calendar = 'proleptic_gregorian'
+    time_var[:] = np.asarray(times).astype('datetime64[s]').astype(np.int64)
+    nc.createVariable('link', 'i8', ('link',))[:] = links
+
+    # Chunks span one time block of one link, so every block write fills whole chunks
+    storage = variable_storage(len(times), len(links), 'per_link', compression_level, time_chunk=time_chunk)
+    for name, (datatype, units, long_name) in RAIN_VARIABLES.items():
+        fill_value = np.nan if datatype.startswith('f') else -1
+        var = nc.createVariable(name, datatype, ('time', 'link'), fill_value=fill_value, **storage)
+        var.units = units
+        var.long_name = long_name
+
+    nc.description = 'Rain estimated from radio link attenuation'
+    nc.created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    nc.source_file = os.path.basename(source_file)
+    return nc
+
+
+def _rain_block(nc_file_path, positions, lengths, frequencies, polarizations, read_start, start, stop, read_stop,
+                classifier_params):
+    """
+    Attenuation -> wet/dry -> rain rate of one (time block, link block)
+
+    The block is read with the window overlap of the classifier on both sides
+    (read_start:read_stop around start:stop), so its labels equal those of a
+    classification of the whole series; only start:stop is returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, tuple]: (time, link) wet flags, rain rates in mm/hr
+            and the wet runs of the block (see event_runs)
+    """
+    with open_link_dataset(nc_file_path) as ds:
+        block = select_window(ds, read_start, read_stop, positions).load()
+    attenuation = block['TxLevel'].values - block['RxLevel'].values
+
+    wet, _ = StatisticalWetDryClassifier(**classifier_params).classify(attenuation)
+    inner = slice(start - read_start, stop - read_start)
+    attenuation, wet = attenuation[inner], wet[inner]
+
+    rain_rate = RainfallEstimator().calculate_rainfall_batch(attenuation, wet, lengths, frequencies, polarizations)
+    return wet.astype(np.int8), rain_rate, event_runs(wet, attenuation)
+
+
+def _ordered_results(tasks, max_workers):
+    """Results of _rain_block tasks in task order, with at most 2 * max_workers tasks in flight"""
+    if not max_workers or max_workers <= 1:
+        for task in tasks:
+            yield _rain_block(*task)
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(_rain_block, *task))
+            if len(pending) >= 2 * max_workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def run_rain_pipeline(nc_file_path, metadata_path, output_path, link_ids=None, t_start=None, t_end=None,
+                      link_block=256, time_block=None, memory_budget_mb=256, max_workers=None,
+                      threshold=0.1, window_size=8, nan_policy='omit', backend='numpy',
+                      compression_level=4, metadata_duplicates='first', aggregates=DEFAULT_RESOLUTIONS):
+    """
+    Estimate rain for a whole network, streaming the data in (time, link) blocks.
+
+    Every block goes through Tx - Rx attenuation, StatisticalWetDryClassifier and
+    RainfallEstimator on a process pool, with the classifier's window overlap
+    read around it, and is written to output_path as soon as it is done. Blocks
+    are written in order, carrying the rain accumulation of every link from one
+    time block to the next. Only the blocks in flight (2 per worker) are held in
+    memory, so the network never has to fit in memory.
+
+    The output holds 'rain_rate' (mm/hr), 'rain_accumulation' (mm, rate times the
+    sampling interval accumulated from the first time step) and 'wet' over
+    (time, link), for the links with metadata, ordered by link ID. The accumulation
+    is a per-link prefix sum: RainAccumulation answers the total of any period
+    from two of its rows, and the coarser aggregates listed in `aggregates` are
+    added with add_accumulation_aggregates. The wet periods are also written as a
+    run-length encoded event table next to the output, see load_wet_events.
+
+    Args:
+        nc_file_path (str): Dense or ragged link NetCDF file
+        metadata_path (str): Path to metadata CSV file
+        output_path (str): NetCDF file to write
+        link_ids (array-like, optional): Links to process, all links with metadata if None
+        t_start (str or datetime, optional): Start of the period to process
+        t_end (str or datetime, optional): End of the period to process
+        link_block (int): Number of links per block
+        time_block (int, optional): Number of time steps per block, derived from memory_budget_mb if None
+        memory_budget_mb (float): Upper bound for one block in a worker
+        max_workers (int, optional): Size of the process pool, all cores if None; 1 runs in this process
+        threshold (float): Wet-dry threshold, see StatisticalWetDryClassifier
+        window_size (int): Wet-dry rolling window in samples
+        nan_policy (str): Wet-dry NaN policy
+        backend (str): Compute backend of the classifier
+        compression_level (int): zlib level 1-9 of the output, 0 disables compression
+        metadata_duplicates (str): Policy for links with several metadata rows, see join_link_metadata
+        aggregates (iterable): Resolutions of the stored accumulation aggregates, e.g. ('1h', '1D'); empty for none
+
+    Returns:
+        dict: Summary with the number of links, time steps, blocks and the elapsed seconds
+    """
+    start_time = time.time()
+
+    with open_link_dataset(nc_file_path) as ds:
+        times = ds.time.values
+        netcdf_links = file_links(nc_file_path, ds)
+
+    link_table = join_link_metadata(netcdf_links, pd.read_csv(metadata_path), metadata_duplicates)
+    if link_ids is not None:
+        link_table = link_table.loc[np.sort(np.asarray(link_ids).astype(np.int64))]
+
+    first, last = time_window(times, t_start, t_end)
+    times = times[first:last]
+    n_times, n_links = len(times), len(link_table)
+    link_block = max(1, min(link_block, n_links))
+    if time_block is None:
+        time_block = int(memory_budget_mb * 1024 ** 2) // (BLOCK_CELL_BYTES * link_block)
+    time_block = max(window_size, min(time_block, n_times))
+    max_workers = max_workers or os.cpu_count()
+
+    # Window overlap of the classifier: samples before and after a block its labels depend on
+    lead = window_size // 2
+    trail = window_size - 1 - lead
+    sample_hours = sampling_interval_hours(times)
+
+    classifier_params = {'threshold': threshold, 'window_size': window_size, 'nan_policy': nan_policy,
+                         'backend': backend}
+    blocks = [(link_start, min(link_start + link_block, n_links), start, min(start + time_block, n_times))
+              for link_start in range(0, n_links, link_block) for start in range(0, n_times, time_block)]
+    tasks = (
+        (nc_file_path, link_table['position'].values[l0:l1], link_table['Length_km'].values[l0:l1],
+         link_table['Frequency_GHz'].values[l0:l1], link_table['Polarization'].values[l0:l1],
+         first + max(0, t0 - lead), first + t0, first + t1, first + min(n_times, t1 + trail), classifier_params)
+        for l0, l1, t0, t1 in blocks
+    )
+
+    print(f"Estimating rain for {n_links} links x {n_times} time steps in {len(blocks)} block(s) "
+          f"of up to {time_block} x {link_block} on {max_workers} worker(s)...")
+
+    accumulation = np.zeros(n_links)
+    runs = []
+    nc = _create_rain_netcdf(output_path, times, link_table.index.values, time_block, compression_level,
+                             nc_file_path)
+    try:
+        for (l0, l1, t0, t1), (wet, rain_rate, block_runs) in zip(blocks, _ordered_results(tasks, max_workers)):
+            block_accumulation = RainfallEstimator.accumulate_rainfall(rain_rate, sample_hours, accumulation[l0:l1])
+            accumulation[l0:l1] = block_accumulation[-1]
+
+            region = (slice(t0, t1), slice(l0, l1))
+            write_region(nc['wet'], region, wet)
+            write_region(nc['rain_rate'], region, rain_rate)
+            write_region(nc['rain_accumulation'], region, block_accumulation)
+
+            columns, starts, stops, peaks = block_runs
+            runs.append((columns + l0, starts + t0, stops + t0, peaks))
+    finally:
+        nc.close()
+
+    if aggregates:
+        add_accumulation_aggregates(output_path, aggregates)
+
+    # Runs cut by time block boundaries are joined back into whole events
+    runs = [np.concatenate(parts) for parts in zip(*runs)] if runs else [np.zeros(0, dtype=np.int64)] * 4
+    write_wet_events(output_path, event_table(*merge_event_runs(*runs), times, link_table.index.values))
+
+    elapsed = time.time() - start_time
+    print(f"Rain estimates written to {output_path} in {elapsed:.1f} s")
+    return {'links': n_links, 'time_steps': n_times, 'blocks': len(blocks), 'seconds': elapsed}
+
+
+if __name__ == "__main__":
+    run_rain_pipeline(
+        r"D:\final_project\analysis_files\filtered_netcdf_cleaned.nc",
+        r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv",
+        r"D:\final_project\analysis_files\rain_estimates.nc"
+    )
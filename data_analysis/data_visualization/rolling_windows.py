@@ -0,0 +1,245 @@
+import numbers
+import numpy as np
+import pandas as pd
+
+
+def window_samples(window, times=None):
+    """
+    Length in samples of a rolling window given in samples or in time units.
+
+    Args:
+        window (int, str or pd.Timedelta): Number of samples, or a duration such as '1h'; a whole
+            float such as 60.0 counts samples too
+        times (array-like, optional): Regular time axis, needed when window is a duration
+
+    Returns:
+        int: Number of samples covered by the window (at least 1)
+    """
+    if isinstance(window, numbers.Real):
+        # pd.Timedelta would read a bare number as nanoseconds, so numbers are always sample counts
+        if not float(window).is_integer():
+            raise ValueError(f"A window given as a number must be a whole number of samples, got {window}")
+        if window < 1:
+            raise ValueError(f"Window must cover at least one sample, got {window}")
+        return int(window)
+
+    if times is None or len(times) < 2:
+        raise ValueError("A window given in time units needs a time axis with at least two timestamps")
+    step = pd.Series(np.diff(np.asarray(times).astype('datetime64[ns]'))).median()
+    return max(1, int(round(pd.Timedelta(window) / step)))
+
+
+def _trailing_extremum(values, window, reduce):
+    """
+    reduce (np.maximum or np.minimum) over the trailing window of every row of a 2-D array.
+
+    Van Herk/Gil-Werman: the time axis is cut into blocks of `window` rows; every
+    window spans the suffix of one block and the prefix of the next, so two
+    accumulate passes and one elementwise reduce give all windows in O(n)
+    regardless of the window length. NaN propagates, so a window holding a NaN
+    yields NaN. Rows before the first full window are NaN.
+    """
+    n_times, n_columns = values.shape
+    result = np.full((n_times, n_columns), np.nan)
+    if window > n_times:
+        return result
+
+    n_blocks = -(-n_times // window)
+    padded = np.full((n_blocks * window, n_columns), np.nan)
+    padded[:n_times] = values
+    blocks = padded.reshape(n_blocks, window, n_columns)
+
+    prefix = reduce.accumulate(blocks, axis=1).reshape(-1, n_columns)
+    suffix = reduce.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].reshape(-1, n_columns)
+
+    # The window ending at row j starts at j - window + 1: suffix of its block, prefix up to j
+    result[window - 1:] = reduce(suffix[:n_times - window + 1], prefix[window - 1:n_times])
+    return result
+
+
+def rolling_extrema(values, window, center=True):
+    """
+    Rolling maximum and minimum of every column of a (time, link) array.
+
+    Matches pandas rolling(window, center=center).max()/min(): a window must be
+    complete and free of NaN, otherwise the result is NaN.
+
+    Args:
+        values (np.ndarray): 1-D series or (time, link) array
+        window (int): Window length in samples
+        center (bool): Label each window by its centre instead of its last sample
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Rolling maximum and minimum, shaped like values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    matrix = values.reshape(len(values), -1)
+
+    extrema = []
+    for reduce in (np.maximum, np.minimum):
+        result = _trailing_extremum(matrix, window, reduce)
+        if center:
+            # Shift the labels back by the trailing part of a centred window
+            shift = (window - 1) // 2
+            centred = np.full_like(result, np.nan)
+            centred[:max(0, len(result) - shift)] = result[shift:]
+            result = centred
+        extrema.append(result.reshape(values.shape))
+    return tuple(extrema)
+
+
+NAN_POLICIES = ('omit', 'propagate')
+BACKENDS = ('numpy', 'numba', 'torch')
+_WINDOW_SUM_KERNELS = {}
+
+
+def _window_sums(values, window):
+    """
+    Sums of every `window` consecutive rows of a 2-D array, one per window start.
+
+    The same block split as _trailing_extremum: a window is the suffix sum of one
+    block plus the prefix sum of the next, both cumulated inside a block only.
+    Rounding errors therefore stay at the scale of one window instead of growing
+    with the length of the series as a global running sum would.
+    """
+    n_rows, n_columns = values.shape
+    n_blocks = -(-n_rows // window)
+    padded = np.zeros((n_blocks * window, n_columns))
+    padded[:n_rows] = values
+    blocks = padded.reshape(n_blocks, window, n_columns)
+
+    prefix = np.cumsum(blocks, axis=1)
+    suffix = np.cumsum(blocks[:, ::-1], axis=1)[:, ::-1]
+    # A window aligned on a block is that block's prefix alone
+    suffix[:, 0] = 0
+
+    n_windows = n_rows - window + 1
+    return suffix.reshape(-1, n_columns)[:n_windows] + prefix.reshape(-1, n_columns)[window - 1:n_rows]
+
+
+def _numba_window_sums():
+    """_window_sums compiled with numba: one pass of running sums, restarted from scratch at every block"""
+    import numba
+
+    @numba.njit
+    def window_sums(values, window):
+        n_rows, n_columns = values.shape
+        n_windows = n_rows - window + 1
+        sums = np.zeros((n_windows, n_columns))
+        running = np.zeros(n_columns)
+        for i in range(n_windows):
+            if i % window == 0:
+                running[:] = 0.0
+                for k in range(i, i + window):
+                    running += values[k]
+            else:
+                running += values[i + window - 1] - values[i - 1]
+            sums[i] = running
+        return sums
+
+    return window_sums
+
+
+def _torch_window_sums():
+    """_window_sums on torch CPU tensors: every window summed directly from an unfolded view"""
+    import torch
+
+    def window_sums(values, window):
+        return torch.from_numpy(values).unfold(0, window, 1).sum(dim=-1).numpy()
+
+    return window_sums
+
+
+def window_sum_kernel(backend='numpy'):
+    """
+    Window-sum kernel of a compute backend, the only backend-specific part of rolling_std.
+
+    Optional backends are imported the first time they are selected (numba then
+    compiles on the first call), so importing this module never loads numba or torch.
+
+    Backends:
+        'numpy' - block-local cumulative sums, no extra dependency
+        'numba' - JIT-compiled running sums restarted at every block
+        'torch' - torch CPU sums over unfolded windows
+
+    Args:
+        backend (str): One of BACKENDS
+
+    Returns:
+        callable: (values, window) -> sums of every `window` consecutive rows
+
+    Raises:
+        ImportError: If the package of the backend is not installed
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend '{backend}', expected one of {BACKENDS}")
+
+    if backend not in _WINDOW_SUM_KERNELS:
+        loaders = {'numpy': lambda: _window_sums, 'numba': _numba_window_sums, 'torch': _torch_window_sums}
+        try:
+            _WINDOW_SUM_KERNELS[backend] = loaders[backend]()
+        except ImportError as e:
+            raise ImportError(f"The '{backend}' backend needs the {backend} package: {e}") from e
+    return _WINDOW_SUM_KERNELS[backend]
+
+
+def rolling_std(values, window, ddof=1, nan_policy='omit', backend='numpy'):
+    """
+    Rolling standard deviation of every column of a (time, link) array.
+
+    The window of sample i covers samples i - window // 2 to i - window // 2 + window - 1,
+    with the first and last samples repeated past the ends of the series (the
+    replicate padding of the wet/dry classifier). Window sums of the counts,
+    values and squared values come from block-local cumulative sums (see
+    _window_sums and window_sum_kernel for the other backends), so the cost is
+    O(n) whatever the window length. Every column
+    is centred on its mean before summing, which keeps the sum of squares from
+    cancelling catastrophically on attenuation levels of tens of dB with sub-dB
+    fluctuations.
+
+    NaN policies:
+        'omit'      - the std of the non-NaN samples of the window, NaN when the
+                      window holds ddof or fewer of them
+        'propagate' - NaN whenever the window holds a NaN
+
+    Args:
+        values (np.ndarray): 1-D series or (time, link) array
+        window (int): Window length in samples
+        ddof (int): Delta degrees of freedom, 1 for the sample std
+        nan_policy (str): One of NAN_POLICIES
+        backend (str): Compute backend of the window sums, one of BACKENDS
+
+    Returns:
+        np.ndarray: Rolling std, shaped like values
+    """
+    if nan_policy not in NAN_POLICIES:
+        raise ValueError(f"Unknown NaN policy '{nan_policy}', expected one of {NAN_POLICIES}")
+
+    values = np.asarray(values, dtype=np.float64)
+    matrix = values.reshape(len(values), -1)
+    n_times = len(matrix)
+    if n_times == 0:
+        return values.copy()
+
+    # Replicate padding expressed as an index into the series
+    padding = window // 2
+    padded = matrix[np.clip(np.arange(-padding, n_times - padding + window - 1), 0, n_times - 1)]
+
+    valid = ~np.isnan(padded)
+    column_counts = np.maximum((~np.isnan(matrix)).sum(axis=0), 1)
+    centre = np.nansum(matrix, axis=0) / column_counts
+    shifted = np.where(valid, padded - centre, 0.0)
+
+    window_sums = window_sum_kernel(backend)
+    count = window_sums(valid.astype(np.float64), window)
+    total = window_sums(shifted, window)
+    squares = window_sums(shifted ** 2, window)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        variance = (squares - total ** 2 / count) / (count - ddof)
+    std = np.sqrt(np.clip(variance, 0, None))
+
+    std[count <= ddof] = np.nan
+    if nan_policy == 'propagate':
+        std[count < window] = np.nan
+    return std.reshape(values.shape)
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from load_data_and_visualize import COORD_COLUMNS, LinkDataset, join_link_metadata
+
+
+def _metadata(links):
+    """One metadata row per link, with coordinates derived from the link id"""
+    links = np.asarray(links)
+    return pd.DataFrame({'Link': links,
+                         **{column: links + offset for offset, column in enumerate(COORD_COLUMNS)},
+                         'Frequency_GHz': 18.0, 'Length_km': 2.5, 'Polarization': 'V'})
+
+
+def test_join_keeps_first_position_of_repeated_file_links():
+    table = join_link_metadata(np.array([5, 3, 5, 7, 3]), _metadata([3, 5, 7, 9]))
+
+    assert table.index.tolist() == [3, 5, 7]
+    assert table['position'].tolist() == [1, 0, 3]
+
+
+def test_join_still_applies_metadata_policy():
+    with pytest.raises(ValueError):
+        join_link_metadata(np.array([5, 3, 5]), _metadata([3, 5, 5]), duplicates='error')
+
+
+def test_link_dataset_on_file_with_repeated_links(tmp_path):
+    rng = np.random.default_rng(0)
+    links = np.array([5, 3, 5, 7, 3])
+    rx = np.round(rng.normal(-50, 5, size=(30, len(links))), 1)
+    times = pd.date_range('2023-01-01', periods=30, freq='min')
+    netcdf_file, metadata_file = str(tmp_path / 'filtered_netcdf.nc'), str(tmp_path / 'metadata.csv')
+    xr.Dataset({'RxLevel': (['time', 'link'], rx), 'TxLevel': (['time', 'link'], rx + 60)},
+               coords={'time': times, 'link': links}).to_netcdf(netcdf_file)
+    _metadata([3, 5, 7]).to_csv(metadata_file, index=False)
+
+    dataset = LinkDataset(netcdf_file, metadata_file)
+
+    assert sorted(dataset.links) == [3, 5, 7]
+    np.testing.assert_array_equal(dataset.get_link(5)['rx'].values, rx[:, 0])
+    np.testing.assert_array_equal(dataset.get_link(3)['rx'].values, rx[:, 1])
@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from rain_accumulation import RainAccumulation, add_accumulation_aggregates
+from rain_pipeline import run_rain_pipeline
+
+WINDOWS = [('2023-01-01 03:00', '2023-01-01 05:30'), (None, '2023-01-01 01:00'), ('2023-01-01 08:00', None),
+           ('2022-01-01', '2022-06-01'), (None, None), ('2023-01-01 03:00:30', '2023-01-01 03:00:40')]
+
+
+@pytest.fixture
+def rain_file(network_files, tmp_path):
+    """Pipeline output of the small network, in several time blocks, and its rain per sample in mm"""
+    netcdf_file, metadata_file = network_files
+    output = str(tmp_path / 'rain.nc')
+    run_rain_pipeline(netcdf_file, metadata_file, output, max_workers=1, time_block=150, threshold=0.3,
+                      aggregates=('1h', '15min'))
+    with xr.open_dataset(output) as rain:
+        interval_hours = float(np.diff(rain.time.values).mean() / np.timedelta64(1, 'h'))
+        rain_mm = (rain['rain_rate'].fillna(0) * interval_hours).to_pandas()
+    assert rain_mm.values.sum() > 0
+    return output, rain_mm
+
+
+def test_window_totals_match_direct_sums(rain_file):
+    output, rain_mm = rain_file
+    with RainAccumulation(output) as accumulation:
+        totals = accumulation.window_totals(WINDOWS, [1003, 1001])
+        for row, (t_start, t_end) in enumerate(WINDOWS):
+            expected = rain_mm.loc[t_start:t_end, [1003, 1001]].sum()
+            np.testing.assert_allclose(totals.iloc[row].values, expected.values, atol=1e-9)
+        np.testing.assert_allclose(accumulation.total().values, rain_mm.sum().values, atol=1e-9)
+
+
+@pytest.mark.parametrize('resolution', ['1h', '15min', '1D'])
+def test_period_totals_match_direct_sums(rain_file, resolution):
+    output, rain_mm = rain_file
+    if resolution == '1D':
+        add_accumulation_aggregates(output, (resolution,))
+    expected = rain_mm.groupby(rain_mm.index.floor(resolution)).sum()
+
+    with RainAccumulation(output) as accumulation:
+        totals = accumulation.period_totals(resolution)
+        np.testing.assert_allclose(totals.values, expected.values, atol=1e-9)
+        assert (totals.index == expected.index).all()
+
+        subset = accumulation.period_totals(resolution, [1005, 1000], t_start='2023-01-01 02:00',
+                                            t_end='2023-01-01 07:00')
+        np.testing.assert_allclose(subset.values,
+                                   expected.loc['2023-01-01 02:00':'2023-01-01 07:00', [1005, 1000]].values,
+                                   atol=1e-9)
+
+
+def test_period_totals_need_the_aggregate(rain_file):
+    output, _ = rain_file
+    with RainAccumulation(output) as accumulation:
+        with pytest.raises(KeyError):
+            accumulation.period_totals('2h')
@@ -0,0 +1,31 @@
+import pandas as pd
+import xarray as xr
+
+from rain_pipeline import run_rain_pipeline
+from wet_events import load_wet_events
+
+
+def test_all_dry_network(network_files, tmp_path):
+    netcdf_file, metadata_file = network_files
+    output = str(tmp_path / 'rain.nc')
+
+    summary = run_rain_pipeline(netcdf_file, metadata_file, output, max_workers=1, threshold=1e9)
+
+    assert summary['links'] == 6
+    assert len(load_wet_events(output)) == 0
+    with xr.open_dataset(output) as rain:
+        assert int(rain['wet'].sum()) == 0
+        assert float(rain['rain_accumulation'].max()) == 0
+
+
+def test_metadata_without_common_links(network_files, tmp_path):
+    netcdf_file, metadata_file = network_files
+    other_metadata = str(tmp_path / 'other_metadata.csv')
+    metadata = pd.read_csv(metadata_file)
+    metadata.assign(Link=metadata['Link'] + 100).to_csv(other_metadata, index=False)
+    output = str(tmp_path / 'rain.nc')
+
+    summary = run_rain_pipeline(netcdf_file, other_metadata, output, max_workers=1)
+
+    assert summary['links'] == 0
+    assert len(load_wet_events(output)) == 0
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from rolling_windows import window_samples
+
+
+def test_numeric_windows_count_samples():
+    times = pd.date_range('2023-01-01', periods=10, freq='min').values
+
+    assert window_samples(60) == 60
+    assert window_samples(60.0, times) == 60
+    assert window_samples(np.float32(3)) == 3
+    assert window_samples('2min', times) == 2
+
+
+@pytest.mark.parametrize('window', [2.5, float('nan'), 0.0])
+def test_invalid_numeric_windows(window):
+    with pytest.raises(ValueError):
+        window_samples(window)
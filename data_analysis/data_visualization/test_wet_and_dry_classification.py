@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+from wet_and_dry_classification import StatisticalWetDryClassifier, StreamingWetDryClassifier
+
+WINDOW = 8
+
+
+def _attenuation(num_times=600, num_links=5, seed=3):
+    """Noisy attenuation with missing readings, a link that starts late and a link without readings"""
+    rng = np.random.default_rng(seed)
+    attenuation = 60 + rng.normal(0, 0.1, (num_times, num_links))
+    attenuation[200:260, 0] += rng.normal(0, 1.0, 60)
+    attenuation[rng.random(attenuation.shape) < 0.05] = np.nan
+    attenuation[:20, 1] = np.nan
+    attenuation[:, 4] = np.nan
+    return attenuation
+
+
+@pytest.mark.parametrize('nan_policy', ['omit', 'propagate'])
+def test_streaming_matches_batch_with_lag(nan_policy):
+    attenuation = _attenuation()
+    streaming = StreamingWetDryClassifier(np.arange(attenuation.shape[1]), window_size=WINDOW,
+                                          nan_policy=nan_policy)
+    labels, std = streaming.update_block(attenuation)
+    batch_labels, batch_std = StatisticalWetDryClassifier(window_size=WINDOW, nan_policy=nan_policy) \
+        .classify(attenuation)
+
+    # Sample i of the stream is labelled like sample i - lag of the batch, once the first window is full
+    lag = WINDOW - 1 - WINDOW // 2
+    n_times = len(attenuation)
+    np.testing.assert_allclose(std[WINDOW:], batch_std[WINDOW - lag:n_times - lag], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(labels[WINDOW:], batch_labels[WINDOW - lag:n_times - lag])
+    assert labels[WINDOW:, 0].any()
+
+
+@pytest.mark.parametrize('nan_policy', ['omit', 'propagate'])
+def test_save_and_load_resume_exactly(tmp_path, nan_policy):
+    attenuation = _attenuation()
+    links = np.array([f'L{link}' for link in range(attenuation.shape[1])], dtype=object)
+    uninterrupted = StreamingWetDryClassifier(links, window_size=WINDOW, nan_policy=nan_policy)
+    expected_labels, expected_std = uninterrupted.update_block(attenuation)
+
+    first = StreamingWetDryClassifier(links, window_size=WINDOW, nan_policy=nan_policy)
+    labels, std = first.update_block(attenuation[:301])
+    path = str(tmp_path / 'state.npz')
+    first.save(path)
+    resumed = StreamingWetDryClassifier.load(path)
+    more_labels, more_std = resumed.update_block(attenuation[301:])
+
+    assert (resumed.window_size, resumed.nan_policy) == (WINDOW, nan_policy)
+    np.testing.assert_array_equal(np.vstack([labels, more_labels]), expected_labels)
+    np.testing.assert_array_equal(np.vstack([std, more_std]), expected_std)
+    for name in StreamingWetDryClassifier.STATE_ARRAYS:
+        np.testing.assert_array_equal(getattr(resumed, name), getattr(uninterrupted, name))
+
+
+def test_update_of_some_links():
+    classifier = StreamingWetDryClassifier([1, 2, 3], window_size=4)
+    for value in range(10):
+        classifier.update([float(value)], links=[2])
+
+    _, std = classifier.update([1.0, 2.0], links=[3, 1])
+    assert np.isnan(std).all()
+    with pytest.raises(ValueError):
+        classifier.update([1.0, 2.0], links=[2, 2])
+    with pytest.raises(KeyError):
+        classifier.update([1.0], links=[9])
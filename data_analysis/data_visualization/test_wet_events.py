@@ -0,0 +1,22 @@
+import numpy as np
+import pandas as pd
+
+from wet_events import EVENT_COLUMNS, WetEventIndex, merge_event_runs
+
+
+def test_merge_event_runs_without_runs():
+    empty = np.zeros(0, dtype=np.int64)
+    merged = merge_event_runs(empty, empty, empty, np.zeros(0))
+
+    assert [len(part) for part in merged] == [0, 0, 0, 0]
+
+
+def test_empty_wet_event_index():
+    events = pd.DataFrame({column: [] for column in EVENT_COLUMNS}).astype(
+        {'start': 'datetime64[ns]', 'end': 'datetime64[ns]', 'duration': 'timedelta64[ns]'})
+    index = WetEventIndex(events)
+
+    assert len(index) == 0
+    assert index.query('2023-01-01', '2023-01-02', min_duration='5min').empty
+    assert index.query().empty
+    assert len(index.wet_links('2023-01-01 12:00')) == 0
@@ -1,22 +1,36 @@
 import numpy as np
-import xarray as xr
 import pandas as pd
 import matplotlib.pyplot as plt
 from typing import Tuple, Optional
-import torch
+import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'net_cdf'))
+from link_index import file_links
+from read_netcdf_file import link_positions, read_link_window
+from sparse_storage import open_link_dataset
+from rolling_windows import NAN_POLICIES, rolling_std
+from wet_events import wet_events
 
 
 class StatisticalWetDryClassifier:
-    def __init__(self, threshold: float = 0.1, window_size: int = 8):
+    def __init__(self, threshold: float = 0.1, window_size: int = 8, nan_policy: str = 'omit',
+                 backend: str = 'numpy'):
         """
         Initialize the wet-dry classifier.
 
         Args:
             threshold (float): Threshold for wet classification
             window_size (int): Size of the rolling window for standard deviation calculation
+            nan_policy (str): 'omit' computes the std of the readings of each window,
+                'propagate' gives NaN (classified dry) for any window holding a missing reading
+            backend (str): Compute backend of the rolling std, 'numpy', 'numba' or 'torch';
+                numba and torch are imported only when selected
         """
         self.threshold = threshold
         self.window_size = window_size
+        self.nan_policy = nan_policy
+        self.backend = backend
 
     def calculate_attenuation(self, rx_level: np.ndarray, tx_level: np.ndarray) -> np.ndarray:
         """
@@ -35,76 +49,240 @@ class StatisticalWetDryClassifier:
         """
         Calculate rolling standard deviation.
 
+        Computed in O(n) for every link at once, with replicate padding at the ends
+        of the series and NaN handled according to nan_policy.
+
         Args:
-            data (np.ndarray): Input attenuation data
+            data (np.ndarray): Attenuation series, or a (time, link) attenuation matrix
 
         Returns:
-            np.ndarray: Rolling standard deviation
+            np.ndarray: Rolling standard deviation, shaped (1, time) for a series
+                and (time, link) for a matrix
         """
-        # Convert to tensor and ensure correct dimensions
-        data_tensor = torch.tensor(data, dtype=torch.float32)
-        if len(data_tensor.shape) == 1:
-            data_tensor = data_tensor.unsqueeze(0)
-
-        padding = self.window_size // 2
-        padded_data = torch.nn.functional.pad(data_tensor, (padding, padding), mode='replicate')
-
-        # Calculate rolling standard deviation
-        std_vector = torch.zeros_like(data_tensor)
-        for i in range(data_tensor.shape[1]):
-            window = padded_data[:, i:i + self.window_size]
-            std_vector[:, i] = torch.std(window, dim=1)
-
-        return std_vector.numpy()
+        data = np.asarray(data, dtype=np.float64)
+        std_vector = rolling_std(data, self.window_size, nan_policy=self.nan_policy, backend=self.backend)
+        return std_vector[np.newaxis] if data.ndim == 1 else std_vector
 
     def classify(self, attenuation: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
         """
         Perform wet-dry classification.
 
         Args:
-            attenuation (np.ndarray): Attenuation data
+            attenuation (np.ndarray): Attenuation series, or a (time, link) matrix to label the whole network
 
         Returns:
-            Tuple[np.ndarray, np.ndarray]: Classification results and standard deviation vector
+            Tuple[np.ndarray, np.ndarray]: Classification results and standard deviation vector,
+                shaped like the output of rolling_std; windows without a std are dry
         """
         std_vector = self.rolling_std(attenuation)
         classification = (std_vector > self.threshold).astype(int)
         return classification, std_vector
 
+    def classify_events(self, attenuation: np.ndarray, times, links) -> pd.DataFrame:
+        """
+        Perform wet-dry classification and keep only the wet events.
+
+        Args:
+            attenuation (np.ndarray): (time, link) attenuation matrix
+            times (array-like): Time axis of the rows
+            links (array-like): Link IDs of the columns
+
+        Returns:
+            pd.DataFrame: One row per wet event with link, start, end, duration and
+                peak attenuation, see wet_events.WetEventIndex for queries
+        """
+        attenuation = np.asarray(attenuation, dtype=np.float64).reshape(len(attenuation), -1)
+        classification, _ = self.classify(attenuation)
+        return wet_events(classification, attenuation, times, links)
+
+
+class StreamingWetDryClassifier:
+    STATE_ARRAYS = ('links', 'buffer', 'reference', 'count', 'total', 'squares', 'n_seen')
+
+    def __init__(self, links, threshold: float = 0.1, window_size: int = 8, nan_policy: str = 'omit'):
+        """
+        Online wet-dry classifier fed one attenuation sample per link at a time.
+
+        Every link keeps the last window_size samples in a row of one (link, window)
+        ring buffer, plus running count/sum/sum of squares of its valid samples,
+        so a new sample costs O(1) per link whatever the network size. The sums
+        are taken relative to the first reading of each link and rebuilt from the
+        buffer every window_size samples, so rounding errors do not accumulate.
+
+        A sample is labelled from the trailing window ending at it: the std that
+        StatisticalWetDryClassifier assigns window_size - 1 - window_size // 2 samples
+        earlier, available as soon as the sample arrives. nan_policy is applied as
+        in the batch classifier; 'propagate' also leaves the first window_size - 1
+        samples of a link without a std.
+
+        Args:
+            links (array-like): IDs of the links fed to the classifier
+            threshold (float): Threshold for wet classification
+            window_size (int): Number of samples of the rolling window
+            nan_policy (str): 'omit' or 'propagate', see StatisticalWetDryClassifier
+        """
+        if nan_policy not in NAN_POLICIES:
+            raise ValueError(f"Unknown NaN policy '{nan_policy}', expected one of {NAN_POLICIES}")
+        self.threshold = threshold
+        self.window_size = window_size
+        self.nan_policy = nan_policy
+
+        n_links = len(links)
+        self.links = np.asarray(links)
+        if self.links.dtype == object:
+            # Text IDs are kept as a fixed-width string array so the state saves without pickling
+            self.links = self.links.astype(str)
+        self.buffer = np.full((n_links, window_size), np.nan)
+        self.reference = np.full(n_links, np.nan)
+        self.count = np.zeros(n_links)
+        self.total = np.zeros(n_links)
+        self.squares = np.zeros(n_links)
+        self.n_seen = np.zeros(n_links, dtype=np.int64)
+        self._positions = pd.Index(self.links)
+
+    def _link_rows(self, links):
+        """Rows of the state arrays of some link IDs"""
+        if links is None:
+            return np.arange(len(self.links))
+        rows = self._positions.get_indexer(np.asarray(links))
+        if (rows < 0).any():
+            raise KeyError(f"Links not known to the classifier: {list(np.asarray(links)[rows < 0])}")
+        if len(np.unique(rows)) < len(rows):
+            raise ValueError("Each link can receive at most one sample per update")
+        return rows
+
+    def _accumulate(self, rows, values, sign):
+        """Add (sign=1) or remove (sign=-1) one sample per row from the running sums"""
+        valid = ~np.isnan(values)
+        deviation = np.where(valid, values - self.reference[rows], 0.0)
+        self.count[rows] += sign * valid
+        self.total[rows] += sign * deviation
+        self.squares[rows] += sign * deviation ** 2
+
+    def _rebuild(self, rows):
+        """Recompute the running sums of some rows from their ring buffers"""
+        valid = ~np.isnan(self.buffer[rows])
+        deviation = np.where(valid, self.buffer[rows] - self.reference[rows, np.newaxis], 0.0)
+        self.count[rows] = valid.sum(axis=1)
+        self.total[rows] = deviation.sum(axis=1)
+        self.squares[rows] = (deviation ** 2).sum(axis=1)
+
+    def update(self, attenuation, links=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Feed the next attenuation sample of some links.
+
+        Args:
+            attenuation (np.ndarray): One sample per link, NaN for a missing reading
+            links (array-like, optional): IDs of the links the samples belong to, all
+                links in classifier order if None; each link at most once
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Wet-dry label and std of the new sample of each link
+        """
+        rows = self._link_rows(links)
+        attenuation = np.asarray(attenuation, dtype=np.float64).reshape(len(rows))
+
+        # Links see their first reading: it becomes the reference of their sums
+        first = np.isnan(self.reference[rows]) & ~np.isnan(attenuation)
+        self.reference[rows[first]] = attenuation[first]
+
+        slots = self.n_seen[rows] % self.window_size
+        self._accumulate(rows, self.buffer[rows, slots], -1)
+        self._accumulate(rows, attenuation, 1)
+        self.buffer[rows, slots] = attenuation
+        self.n_seen[rows] += 1
+
+        wrapped = rows[self.n_seen[rows] % self.window_size == 0]
+        if len(wrapped):
+            self._rebuild(wrapped)
+
+        count = self.count[rows]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            variance = (self.squares[rows] - self.total[rows] ** 2 / count) / (count - 1)
+        std = np.sqrt(np.clip(variance, 0, None))
+        std[count <= 1] = np.nan
+        if self.nan_policy == 'propagate':
+            std[count < self.window_size] = np.nan
+
+        classification = (std > self.threshold).astype(int)
+        return classification, std
+
+    def update_block(self, attenuation: np.ndarray, links=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Feed consecutive samples of some links, as a (time, link) block
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: (time, link) labels and std, one row per sample
+        """
+        results = [self.update(samples, links) for samples in np.asarray(attenuation, dtype=np.float64)]
+        if not results:
+            n_links = len(self._link_rows(links))
+            return np.zeros((0, n_links), dtype=int), np.zeros((0, n_links))
+        classification, std = zip(*results)
+        return np.stack(classification), np.stack(std)
+
+    def state_dict(self) -> dict:
+        """Parameters and state arrays of the classifier, enough to resume it with from_state"""
+        state = {name: getattr(self, name) for name in self.STATE_ARRAYS}
+        state.update(threshold=self.threshold, window_size=self.window_size, nan_policy=self.nan_policy)
+        return state
+
+    @classmethod
+    def from_state(cls, state: dict) -> 'StreamingWetDryClassifier':
+        """Classifier resumed from a state_dict"""
+        classifier = cls(state['links'], float(state['threshold']), int(state['window_size']),
+                         str(state['nan_policy']))
+        for name in cls.STATE_ARRAYS[1:]:
+            getattr(classifier, name)[:] = state[name]
+        return classifier
+
+    def save(self, path: str):
+        """Write the state to an .npz file"""
+        np.savez(path, **self.state_dict())
+
+    @classmethod
+    def load(cls, path: str) -> 'StreamingWetDryClassifier':
+        """Classifier resumed from a file written by save"""
+        with np.load(path, allow_pickle=False) as state:
+            return cls.from_state(dict(state))
+
 
-def process_cml_data(netcdf_path: str, metadata_path: str, link_id: Optional[str] = None):
+def process_cml_data(netcdf_path: str, metadata_path: str, link_id: Optional[str] = None, t_start=None, t_end=None,
+                     backend: str = 'numpy'):
     """
     Process CML data and perform wet-dry classification.
 
     Args:
         netcdf_path (str): Path to NetCDF file
         metadata_path (str): Path to metadata CSV file
-        link_id (str, optional): Specific link ID to process. If None, processes first link.
+        link_id (str or int, optional): Specific link ID to process. If None, processes first link.
+            Raises KeyError if the file has no such link.
+        t_start (str or datetime, optional): Start of the period to process, only this window is read
+        t_end (str or datetime, optional): End of the period to process
+        backend (str): Compute backend of the classifier
     """
     # Load data
-    ds = xr.open_dataset(netcdf_path)
+    ds = open_link_dataset(netcdf_path)
     metadata = pd.read_csv(metadata_path)
 
     # Print available link IDs for debugging
-    available_links = ds.link.values
+    available_links = file_links(netcdf_path, ds)
     print("Available link IDs in NetCDF file:", available_links)
 
     # Convert metadata link IDs to strings if necessary
     metadata['Link'] = metadata['Link'].astype(str)
 
     # Select link to process
-    if link_id is None:
-        link_id = available_links[0]
-    elif link_id not in available_links:
-        print(f"Link ID '{link_id}' not found. Using first available link: {available_links[0]}")
-        link_id = available_links[0]
+    # '8394' and 8394 name the same link; an unknown id raises KeyError
+    link_id = available_links[0] if link_id is None else available_links[link_positions(available_links, link_id)[0]]
 
-    # Get link data
-    rx_data = ds.RxLevel.sel(link=link_id).values
-    tx_data = ds.TxLevel.sel(link=link_id).values
+    # Get link data, reading only the requested time window
+    window = read_link_window(netcdf_path, t_start, t_end, link_id)
+    rx_data = window.RxLevel.values
+    tx_data = window.TxLevel.values
 
     # Initialize classifier
-    classifier = StatisticalWetDryClassifier()
+    classifier = StatisticalWetDryClassifier(backend=backend)
 
     # Calculate attenuation and perform classification
     attenuation = classifier.calculate_attenuation(rx_data, tx_data)
@@ -147,9 +325,10 @@ def process_cml_data(netcdf_path: str, metadata_path: str, link_id: Optional[str
     plt.show()
 
     return classification, std_vector, attenuation
-# Usage example:
-classification, std_vector, attenuation = process_cml_data(
-     r"D:\final_project\analysis_files\filtered_netcdf_cleaned.nc",
-     r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv",
-     link_id='8394'  # Optional: specify link ID
- )
\ No newline at end of file
+if __name__ == "__main__":
+    # Usage example:
+    classification, std_vector, attenuation = process_cml_data(
+         r"D:\final_project\analysis_files\filtered_netcdf_cleaned.nc",
+         r"D:\final_project\analysis_files\final_metadata_with_normal_coordinates.csv",
+         link_id='8394'  # Optional: specify link ID
+     )
\ No newline at end of file
@@ -0,0 +1,189 @@
+import numpy as np
+import pandas as pd
+import os
+
+
+WET_EVENTS_SUFFIX = '.events.csv'
+EVENT_COLUMNS = ['link', 'start', 'end', 'duration', 'peak_attenuation']
+
+
+def wet_events_path(rain_path):
+    """Path of the sidecar wet-event table of a rain file"""
+    return rain_path + WET_EVENTS_SUFFIX
+
+
+def event_runs(wet, attenuation):
+    """
+    Run-length encode the wet periods of every column of a (time, link) wet/dry matrix
+
+    Args:
+        wet (np.ndarray): (time, link) wet-dry classification (1 for wet, 0 for dry)
+        attenuation (np.ndarray): (time, link) attenuation, for the peak of every run
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: Column, first row, row after
+            the last one and peak attenuation (NaN if it has no reading) of every run,
+            ordered by column then start
+    """
+    wet = np.asarray(wet).reshape(len(wet), -1).astype(bool)
+    n_times = len(wet)
+    edges = np.diff(wet.astype(np.int8), axis=0, prepend=0, append=0).T
+
+    # Column-major, so starts and stops of the same column pair up in order
+    columns, starts = np.nonzero(edges == 1)
+    _, stops = np.nonzero(edges == -1)
+
+    if not len(starts):
+        return columns, starts, stops, np.zeros(0)
+
+    # Peak of [start, stop) of every run on the column-major flattening, NaN sentinel past the end
+    flat = np.append(np.asarray(attenuation, dtype=np.float64).reshape(n_times, -1).T.ravel(), np.nan)
+    bounds = np.column_stack([columns * n_times + starts, columns * n_times + stops]).ravel()
+    peaks = np.fmax.reduceat(flat, bounds)[::2]
+    return columns, starts, stops, peaks
+
+
+def merge_event_runs(columns, starts, stops, peaks):
+    """
+    Join runs of the same column that continue each other (stop of one is start of the next),
+    as produced by encoding consecutive time blocks separately
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]: The merged runs, see event_runs
+    """
+    if not len(starts):
+        return columns, starts, stops, peaks
+
+    order = np.lexsort((starts, columns))
+    columns, starts, stops, peaks = columns[order], starts[order], stops[order], peaks[order]
+
+    new_event = np.ones(len(starts), dtype=bool)
+    new_event[1:] = (columns[1:] != columns[:-1]) | (starts[1:] != stops[:-1])
+    group_starts = np.flatnonzero(new_event)
+    group_stops = np.r_[group_starts[1:], len(starts)] - 1
+
+    return columns[group_starts], starts[group_starts], stops[group_stops], np.fmax.reduceat(peaks, group_starts)
+
+
+def event_table(columns, starts, stops, peaks, times, links):
+    """
+    Wet events as a table, one row per event
+
+    The end of an event is the time of its last wet sample and its duration the
+    number of wet samples times the sampling interval.
+
+    Args:
+        columns, starts, stops, peaks (np.ndarray): Runs, see event_runs
+        times (np.ndarray): Time axis of the rows
+        links (np.ndarray): Link IDs of the columns
+
+    Returns:
+        pd.DataFrame: EVENT_COLUMNS sorted by start
+    """
+    times = np.asarray(times).astype('datetime64[ns]')
+    step = pd.Series(np.diff(times)).median() if len(times) > 1 else pd.Timedelta(0)
+    events = pd.DataFrame({
+        'link': np.asarray(links)[columns],
+        'start': times[starts],
+        'end': times[stops - 1],
+        'duration': pd.to_timedelta((stops - starts) * step),
+        'peak_attenuation': peaks
+    }, columns=EVENT_COLUMNS)
+    return events.sort_values(['start', 'link'], kind='stable').reset_index(drop=True)
+
+
+def wet_events(wet, attenuation, times, links):
+    """
+    Wet events of a (time, link) wet/dry matrix
+
+    Returns:
+        pd.DataFrame: EVENT_COLUMNS sorted by start, see event_table
+    """
+    return event_table(*event_runs(wet, attenuation), times, links)
+
+
+def write_wet_events(rain_path, events):
+    """Write a wet-event table next to its rain file and return it"""
+    events.assign(duration=events['duration'].dt.total_seconds()).rename(columns={'duration': 'duration_s'}) \
+        .to_csv(wet_events_path(rain_path), index=False, date_format='%Y-%m-%dT%H:%M:%S')
+    print(f"{len(events)} wet events written to {wet_events_path(rain_path)}")
+    return events
+
+
+def load_wet_events(rain_path):
+    """
+    Load the sidecar wet-event table of a rain file
+
+    Returns:
+        WetEventIndex: The events, or None if the rain file has no event table
+    """
+    path = wet_events_path(rain_path)
+    if not os.path.exists(path):
+        return None
+    events = pd.read_csv(path, parse_dates=['start', 'end'])
+    events['duration'] = pd.to_timedelta(events.pop('duration_s'), unit='s')
+    return WetEventIndex(events[EVENT_COLUMNS])
+
+
+class WetEventIndex:
+    def __init__(self, events):
+        """
+        Wet events indexed for period and instant queries.
+
+        Events are kept sorted by start together with the running maximum of
+        their ends. The events overlapping [t1, t2] are then the slice between the
+        first event whose running end reaches t1 and the last event starting by
+        t2, both found by binary search, so a query scans only candidate events
+        instead of the whole table.
+
+        Args:
+            events (pd.DataFrame): EVENT_COLUMNS, see wet_events
+        """
+        self.events = events.sort_values(['start', 'link'], kind='stable').reset_index(drop=True)
+        self._starts = self.events['start'].values.astype('datetime64[ns]')
+        self._ends = self.events['end'].values.astype('datetime64[ns]')
+        self._running_end = np.maximum.accumulate(self._ends) if len(self._ends) else self._ends
+
+    def __len__(self):
+        return len(self.events)
+
+    def _candidates(self, t_start, t_end):
+        """Slice of the events that may overlap [t_start, t_end]"""
+        first = 0 if t_start is None else \
+            int(np.searchsorted(self._running_end, np.datetime64(pd.Timestamp(t_start)), 'left'))
+        last = len(self.events) if t_end is None else \
+            int(np.searchsorted(self._starts, np.datetime64(pd.Timestamp(t_end)), 'right'))
+        return slice(first, max(first, last))
+
+    def query(self, t_start=None, t_end=None, min_duration=None, link_ids=None):
+        """
+        Events overlapping a period
+
+        Args:
+            t_start (str or datetime, optional): Start of the period, open if None
+            t_end (str or datetime, optional): End of the period, open if None
+            min_duration (str or pd.Timedelta, optional): Only events lasting at least this long
+            link_ids (array-like, optional): Only events of these links
+
+        Returns:
+            pd.DataFrame: Matching events, EVENT_COLUMNS sorted by start
+        """
+        candidates = self._candidates(t_start, t_end)
+        events = self.events.iloc[candidates]
+        keep = np.ones(len(events), dtype=bool)
+        if t_start is not None:
+            keep &= self._ends[candidates] >= np.datetime64(pd.Timestamp(t_start))
+        if min_duration is not None:
+            keep &= (events['duration'] >= pd.Timedelta(min_duration)).values
+        if link_ids is not None:
+            keep &= events['link'].isin(np.asarray(link_ids)).values
+        return events[keep]
+
+    def wet_links(self, t):
+        """
+        Links wet at an instant
+
+        Returns:
+            np.ndarray: IDs of the links with an event covering t
+        """
+        return np.unique(self.query(t, t)['link'].values)
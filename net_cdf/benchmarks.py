@@ -0,0 +1,284 @@
+import pandas as pd
+import xarray as xr
+import numpy as np
+import os
+import time
+import tempfile
+
+from create_netcdf_file import DATETIME_FORMAT, GridAccumulator, chunk_to_indices
+from netcdf_layout import INT16_SCALE_FACTOR, PACKINGS, xarray_encoding
+from remove_duplicates import group_links, merge_duplicate_links
+
+
+def make_synthetic_csv(path, num_times=1440, num_links=200, coverage=0.8, seed=0):
+    """
+    Write a tab-separated raw data file shaped like the operator dumps.
+
+    Args:
+        path (str): Where to write the file
+        num_times (int): Number of one-minute timestamps
+        num_links (int): Number of links
+        coverage (float): Fraction of (time, link) cells that have a reading
+        seed (int): Random seed
+
+    Returns:
+        int: Number of rows written
+    """
+    rng = np.random.default_rng(seed)
+    times = pd.date_range('2023-01-01', periods=num_times, freq='min')
+    time_idx, link_idx = np.nonzero(rng.random((num_times, num_links)) < coverage)
+
+    df = pd.DataFrame({
+        'DATETIME_ID': times[time_idx].strftime(DATETIME_FORMAT),
+        'KEY10NEW': (1000 + link_idx).astype(str),
+        'RxLevel': np.round(rng.normal(-50, 5, len(time_idx)), 1),
+        'TxLevel': np.round(rng.normal(10, 1, len(time_idx)), 1)
+    })
+    df.to_csv(path, sep='\t', index=False)
+    return len(df)
+
+
+def _read_grid_axes(csv_file, chunk_size):
+    """First pass shared by both ingest paths"""
+    times_set = set()
+    links_set = set()
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t'):
+        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+        times_set.update(chunk['DATETIME_ID'])
+        links_set.update(chunk['KEY10NEW'])
+    return sorted(times_set), sorted(links_set)
+
+
+def _fill_iterrows(csv_file, times, links, chunk_size):
+    """The original per-row fill loop, kept here only for comparison"""
+    ds = xr.Dataset(
+        {
+            'RxLevel': (['time', 'link'], np.full((len(times), len(links)), np.nan)),
+            'TxLevel': (['time', 'link'], np.full((len(times), len(links)), np.nan))
+        },
+        coords={'time': times, 'link': links}
+    )
+    times_dict = {t: idx for idx, t in enumerate(times)}
+    link_to_idx = {link: idx for idx, link in enumerate(links)}
+
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t'):
+        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+        for _, row in chunk.iterrows():
+            time_idx = times_dict[row['DATETIME_ID']]
+            link_idx = link_to_idx[row['KEY10NEW']]
+            ds['RxLevel'][time_idx, link_idx] = row['RxLevel']
+            ds['TxLevel'][time_idx, link_idx] = row['TxLevel']
+
+    return ds['RxLevel'].values, ds['TxLevel'].values
+
+
+def _fill_vectorized(csv_file, times, links, chunk_size, duplicates='last'):
+    """The chunk scatter used by memory_efficient_csv_to_netcdf"""
+    time_index = pd.DatetimeIndex(times)
+    link_index = pd.Index(links)
+    grid = GridAccumulator((len(times), len(links)), duplicates=duplicates)
+
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t'):
+        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+        time_idx, link_idx = chunk_to_indices(chunk, time_index, link_index)
+        grid.add(time_idx, link_idx, chunk['RxLevel'].to_numpy(), chunk['TxLevel'].to_numpy())
+
+    return grid.rx, grid.tx
+
+
+def benchmark_ingest(num_times=200, num_links=100, chunk_size=10000):
+    """
+    Compare rows/second of the per-row iterrows fill and the vectorized chunk scatter.
+
+    Args:
+        num_times (int): Number of timestamps in the synthetic file
+        num_links (int): Number of links in the synthetic file
+        chunk_size (int): CSV chunk size used by both paths
+
+    Returns:
+        dict: Rows per second for each path
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        csv_file = os.path.join(tmp_dir, 'synthetic.csv')
+        num_rows = make_synthetic_csv(csv_file, num_times=num_times, num_links=num_links)
+        times, links = _read_grid_axes(csv_file, chunk_size)
+
+        results = {}
+        outputs = {}
+        for name, fill in [('iterrows', _fill_iterrows), ('vectorized', _fill_vectorized)]:
+            start_time = time.time()
+            outputs[name] = fill(csv_file, times, links, chunk_size)
+            elapsed = time.time() - start_time
+            results[name] = num_rows / elapsed
+            print(f"{name:>10}: {num_rows} rows in {elapsed:.2f} s ({results[name]:,.0f} rows/s)")
+
+        for old, new in zip(outputs['iterrows'], outputs['vectorized']):
+            np.testing.assert_array_equal(old, new)
+
+    print(f"Speed-up: {results['vectorized'] / results['iterrows']:.1f}x")
+    return results
+
+
+def benchmark_link_reads(num_times=43200, num_links=500, num_reads=50, seed=0):
+    """
+    Compare file size and per-link read latency of the storage layouts.
+
+    The same synthetic (time, link) data is written once per layout and
+    num_reads random links are then read back with ds.RxLevel.sel(link=...),
+    the access pattern of LinkDataset and the rainfall scripts.
+
+    Args:
+        num_times (int): Number of timestamps (43200 = 30 days of 1-minute data)
+        num_links (int): Number of links
+        num_reads (int): Number of distinct links read per layout
+        seed (int): Random seed
+
+    Returns:
+        dict: (file size in MB, mean read latency in ms) per layout
+    """
+    rng = np.random.default_rng(seed)
+    rx = np.round(rng.normal(-50, 5, (num_times, num_links)), 1)
+    rx[rng.random(rx.shape) < 0.2] = np.nan
+    ds = xr.Dataset(
+        {'RxLevel': (['time', 'link'], rx)},
+        coords={
+            'time': pd.date_range('2023-01-01', periods=num_times, freq='min'),
+            'link': (1000 + np.arange(num_links)).astype(str)
+        }
+    )
+    read_links = rng.choice(ds.link.values, size=min(num_reads, num_links), replace=False)
+
+    layouts = {
+        'contiguous': {},
+        'balanced': xarray_encoding(ds, variables=('RxLevel',), layout='balanced', compression_level=0),
+        'per_time+zlib': xarray_encoding(ds, variables=('RxLevel',), layout='per_time'),
+        'per_link+zlib': xarray_encoding(ds, variables=('RxLevel',), layout='per_link'),
+    }
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for name, encoding in layouts.items():
+            path = os.path.join(tmp_dir, f"{name.replace('+', '_')}.nc")
+            ds.to_netcdf(path, encoding=encoding)
+            size_mb = os.path.getsize(path) / 1024 ** 2
+
+            with xr.open_dataset(path) as stored:
+                start_time = time.time()
+                for link_id in read_links:
+                    stored.RxLevel.sel(link=link_id).values
+                latency_ms = (time.time() - start_time) / len(read_links) * 1000
+
+            results[name] = (size_mb, latency_ms)
+            print(f"{name:>14}: {size_mb:8.1f} MB, {latency_ms:8.2f} ms per link read")
+
+    return results
+
+
+def benchmark_packing(num_times=43200, num_links=200, seed=0):
+    """
+    Round-trip RxLevel through every packing and report size and precision.
+
+    Readings are generated at the 0.1 dB resolution of the operator data. The
+    float packings must return them unchanged (up to float32 rounding) and int16
+    must stay within half a quantisation step; missing values must stay NaN.
+
+    Args:
+        num_times (int): Number of timestamps
+        num_links (int): Number of links
+        seed (int): Random seed
+
+    Returns:
+        dict: (file size in MB, decoded in-memory size in MB, max abs error in dB) per packing
+    """
+    rng = np.random.default_rng(seed)
+    rx = np.round(rng.normal(-50, 5, (num_times, num_links)), 1)
+    rx[rng.random(rx.shape) < 0.2] = np.nan
+    ds = xr.Dataset(
+        {'RxLevel': (['time', 'link'], rx)},
+        coords={
+            'time': pd.date_range('2023-01-01', periods=num_times, freq='min'),
+            'link': (1000 + np.arange(num_links)).astype(str)
+        }
+    )
+
+    tolerances = {None: 0.0, 'float32': 1e-5, 'int16': INT16_SCALE_FACTOR / 2 + 1e-9}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for packing in PACKINGS:
+            path = os.path.join(tmp_dir, f"{packing}.nc")
+            ds.to_netcdf(path, encoding=xarray_encoding(ds, variables=('RxLevel',), packing=packing))
+
+            with xr.open_dataset(path) as stored:
+                decoded = stored.RxLevel.values
+            stored_mb = np.dtype(stored.RxLevel.encoding['dtype']).itemsize * rx.size / 1024 ** 2
+
+            np.testing.assert_array_equal(np.isnan(decoded), np.isnan(rx))
+            max_error = float(np.nanmax(np.abs(decoded - rx)))
+            assert max_error <= tolerances[packing], f"{packing}: round-trip error {max_error} dB"
+
+            results[packing] = (os.path.getsize(path) / 1024 ** 2, stored_mb, max_error)
+            print(f"{str(packing):>8}: {results[packing][0]:6.1f} MB on disk, {stored_mb:6.1f} MB stored values, "
+                  f"max error {max_error:.2e} dB")
+
+    return results
+
+
+def _merge_links_loop(values, links):
+    """The original per-link, per-timestep nanmean merge of clean_netcdf, kept here only for comparison"""
+    unique_links = pd.unique(links)
+    merged = np.full((values.shape[0], len(unique_links)), np.nan)
+    for idx, link_id in enumerate(unique_links):
+        columns = values[:, links == link_id]
+        if columns.shape[1] > 1:
+            for t in range(values.shape[0]):
+                merged[t, idx] = np.nanmean(columns[t]) if not np.isnan(columns[t]).all() else np.nan
+        else:
+            merged[:, idx] = columns[:, 0]
+    return merged
+
+
+def benchmark_duplicate_merge(num_times=5000, num_links=200, duplicated_fraction=0.2, seed=0):
+    """
+    Compare the per-timestep merge loop of clean_netcdf with the grouped vectorized merge.
+
+    Args:
+        num_times (int): Number of timestamps
+        num_links (int): Number of unique links
+        duplicated_fraction (float): Fraction of links stored in two or three columns
+        seed (int): Random seed
+
+    Returns:
+        dict: Seconds per path for the 'mean' reducer, plus seconds of every vectorized reducer
+    """
+    rng = np.random.default_rng(seed)
+    labels = (1000 + np.arange(num_links)).astype(str)
+    duplicated = rng.choice(labels, size=int(num_links * duplicated_fraction), replace=False)
+    links = np.concatenate([labels, duplicated, duplicated[:len(duplicated) // 2]])
+    values = np.round(rng.normal(-50, 5, (num_times, len(links))), 1)
+    values[rng.random(values.shape) < 0.3] = np.nan
+
+    results = {}
+    start_time = time.time()
+    expected = _merge_links_loop(values, links)
+    results['loop'] = time.time() - start_time
+
+    codes, unique_links = group_links(links)
+    for reducer in ['mean', 'first_valid', 'max', 'median']:
+        start_time = time.time()
+        merged = merge_duplicate_links(values, codes, len(unique_links), reducer)
+        results[reducer] = time.time() - start_time
+        if reducer == 'mean':
+            np.testing.assert_allclose(merged, expected)
+
+    print(f"{len(links)} columns, {len(unique_links)} unique links, {num_times} timestamps")
+    for name, seconds in results.items():
+        print(f"{name:>12}: {seconds:.3f} s")
+    print(f"Speed-up (mean): {results['loop'] / results['mean']:.1f}x")
+    return results
+
+
+if __name__ == "__main__":
+    benchmark_ingest()
+    benchmark_link_reads()
+    benchmark_packing()
+    benchmark_duplicate_merge()
@@ -1,90 +1,1181 @@
 import pandas as pd
-import xarray as xr
 import numpy as np
+from netCDF4 import Dataset, num2date
 from datetime import datetime
 import os
 import time
 import tempfile
+import concurrent.futures
 
+from link_index import LinkIndexBuilder, build_link_index
+from netcdf_layout import TIME_UNITS, create_link_netcdf, data_storage, read_region, write_region
+from sparse_storage import (SPARSE_DENSITY_THRESHOLD, RaggedLinkDataset, append_ragged_links, create_ragged_netcdf,
+                            is_ragged, use_sparse_layout)
 
-def memory_efficient_csv_to_netcdf(csv_file, output_file, chunk_size=10000):
+
+DATETIME_FORMAT = '%d/%m/%Y %I:%M:%S %p'
+DUPLICATE_RULES = ('last', 'first', 'mean', 'first_valid', 'max')
+APPEND_DUPLICATE_RULES = ('last', 'first', 'first_valid', 'max')  # 'mean' needs reading counts the file does not keep
+INTEGER_LINK_PATTERN = r'-?\d+'
+LINK_ID_DTYPE = {'KEY10NEW': str}  # Raw link ids are read as text and normalized, see normalize_link_ids
+BASE_PROCESS_MB = 200  # Interpreter, NumPy/pandas/netCDF4 and a parsed chunk's bookkeeping
+CSV_ROW_BYTES = 500  # pandas memory per CSV row of a chunk, including the parsed timestamps
+AXIS_VALUE_BYTES = 120  # Python set entry per unique timestamp or link during the first pass
+SPILL_DTYPE = np.dtype([('time', 'i8'), ('link', 'i8'), ('rx', 'f8'), ('tx', 'f8')])
+
+
+class GridAccumulator:
+    """
+    Holds the RxLevel/TxLevel (time x link) buffers and scatters whole chunks into them.
+
+    Rows that land on the same (time, link) cell - repeated rows, or rows of
+    link ids that only differ in spelling - are resolved with the `duplicates` rule:
+        'last'        - the last row read wins (the behaviour of the row-by-row loop)
+        'first'       - the first row read wins
+        'mean'        - the mean of all non-NaN readings for the cell
+        'first_valid' - per variable, the first non-NaN reading
+        'max'         - per variable, the largest non-NaN reading
+
+    The buffers are float64 unless a narrower dtype is requested for packed output.
+    """
+
+    def __init__(self, shape, duplicates='last', dtype=np.float64):
+        if duplicates not in DUPLICATE_RULES:
+            raise ValueError(f"Unknown duplicates rule '{duplicates}', expected one of {DUPLICATE_RULES}")
+
+        self.duplicates = duplicates
+        self.rx = np.full(shape, np.nan, dtype=dtype)
+        self.tx = np.full(shape, np.nan, dtype=dtype)
+
+        # Extra state needed to resolve duplicates across chunks
+        self.written = np.zeros(shape, dtype=bool) if duplicates == 'first' else None
+        self.rx_count = np.zeros(shape, dtype=np.int32) if duplicates == 'mean' else None
+        self.tx_count = np.zeros(shape, dtype=np.int32) if duplicates == 'mean' else None
+
+    def add(self, time_idx, link_idx, rx_values, tx_values):
+        """
+        Scatter one chunk of readings given as integer (time, link) index arrays
+        """
+        flat = np.ravel_multi_index((time_idx, link_idx), self.rx.shape)
+        rx_values = np.asarray(rx_values, dtype=self.rx.dtype)
+        tx_values = np.asarray(tx_values, dtype=self.tx.dtype)
+
+        if self.duplicates == 'last':
+            # Position of the last occurrence of every cell in the chunk
+            _, reversed_pos = np.unique(flat[::-1], return_index=True)
+            keep = len(flat) - 1 - reversed_pos
+            self.rx.ravel()[flat[keep]] = rx_values[keep]
+            self.tx.ravel()[flat[keep]] = tx_values[keep]
+
+        elif self.duplicates == 'first':
+            _, keep = np.unique(flat, return_index=True)
+            keep = keep[~self.written.ravel()[flat[keep]]]
+            self.rx.ravel()[flat[keep]] = rx_values[keep]
+            self.tx.ravel()[flat[keep]] = tx_values[keep]
+            self.written.ravel()[flat[keep]] = True
+
+        elif self.duplicates == 'mean':
+            self._add_mean(self.rx, self.rx_count, flat, rx_values)
+            self._add_mean(self.tx, self.tx_count, flat, tx_values)
+
+        elif self.duplicates == 'first_valid':
+            self._add_first_valid(self.rx, flat, rx_values)
+            self._add_first_valid(self.tx, flat, tx_values)
+
+        else:
+            # fmax ignores NaN on either side, so empty cells take the first reading
+            np.fmax.at(self.rx.ravel(), flat, rx_values)
+            np.fmax.at(self.tx.ravel(), flat, tx_values)
+
+    def state(self):
+        """Arrays that fully describe the accumulator, keyed by their NetCDF variable name"""
+        state = {'RxLevel': self.rx, 'TxLevel': self.tx}
+        if self.written is not None:
+            state['_written'] = self.written
+        if self.rx_count is not None:
+            state['_rx_count'] = self.rx_count
+            state['_tx_count'] = self.tx_count
+        return state
+
+    @staticmethod
+    def _add_first_valid(grid, flat, values):
+        """Fill cells that are still NaN with their first non-NaN reading of the chunk"""
+        valid = np.flatnonzero(~np.isnan(values))
+        cells, first = np.unique(flat[valid], return_index=True)
+        grid_flat = grid.ravel()
+        empty = np.isnan(grid_flat[cells])
+        grid_flat[cells[empty]] = values[valid[first[empty]]]
+
+    @staticmethod
+    def _add_mean(grid, counts, flat, values):
+        """Fold a chunk into a running mean, ignoring NaN readings"""
+        valid = ~np.isnan(values)
+        cells, inverse = np.unique(flat[valid], return_inverse=True)
+        chunk_sum = np.bincount(inverse, weights=values[valid])
+        chunk_count = np.bincount(inverse)
+
+        grid_flat = grid.ravel()
+        counts_flat = counts.ravel()
+        old_count = counts_flat[cells]
+        old_sum = np.where(old_count > 0, grid_flat[cells], 0.0) * old_count
+
+        new_count = old_count + chunk_count
+        grid_flat[cells] = (old_sum + chunk_sum) / new_count
+        counts_flat[cells] = new_count
+
+
+def chunk_to_indices(chunk, time_index, link_index):
+    """
+    Map a whole chunk to integer positions on the (time, link) grid
+
+    Args:
+        chunk (pd.DataFrame): Chunk with a parsed DATETIME_ID column and KEY10NEW
+        time_index (pd.Index): Sorted unique timestamps of the output grid
+        link_index (pd.Index): Sorted unique links of the output grid
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: time and link index arrays
+    """
+    time_idx = time_index.get_indexer(chunk['DATETIME_ID'])
+    link_idx = link_index.get_indexer(chunk['KEY10NEW'])
+
+    if (time_idx < 0).any() or (link_idx < 0).any():
+        raise KeyError("Chunk contains timestamps or links that are not on the output grid")
+
+    return time_idx, link_idx
+
+
+def normalize_link_ids(values):
+    """
+    Canonical spelling of raw KEY10NEW values.
+
+    Surrounding whitespace is stripped and integral numbers lose a trailing '.0'
+    (pandas reads an integer column holding blanks as float), so '1234', ' 1234',
+    1234 and 1234.0 all become the link id '1234'.
+
+    Args:
+        values (array-like): Raw link ids of one chunk
+
+    Returns:
+        pd.Series: Normalized link ids as strings
+    """
+    labels = pd.Series(values)
+    if pd.api.types.is_integer_dtype(labels):
+        return labels.astype(str)
+    labels = labels.astype(str).str.strip()
+    return labels.str.replace(rf'^({INTEGER_LINK_PATTERN})\.0*$', r'\1', regex=True)
+
+
+def link_dtype_of(normalized):
+    """np.int64 if every normalized link id is an integer, str otherwise"""
+    return np.int64 if pd.Series(normalized).str.fullmatch(INTEGER_LINK_PATTERN).all() else str
+
+
+def link_labels(normalized, link_dtype):
+    """
+    Normalized link ids as values of the link axis
+
+    Raises:
+        ValueError: If an id is not an integer while the link axis is
+    """
+    normalized = pd.Series(normalized)
+    if link_dtype is str:
+        return normalized.to_numpy(dtype=object)
+    if not normalized.str.fullmatch(INTEGER_LINK_PATTERN).all():
+        bad = normalized[~normalized.str.fullmatch(INTEGER_LINK_PATTERN)].iloc[0]
+        raise ValueError(f"Link id '{bad}' is not an integer but the link axis holds integer ids")
+    return normalized.to_numpy().astype(np.int64)
+
+
+def _record_spellings(spellings, raw, normalized):
+    """Collect the distinct raw spellings of every normalized link id (spellings is updated in place)"""
+    pairs = pd.DataFrame({'raw': pd.Series(raw).astype(str).to_numpy(), 'link': pd.Series(normalized).to_numpy()})
+    for raw_label, link in pairs.drop_duplicates().itertuples(index=False):
+        spellings.setdefault(link, set()).add(raw_label)
+
+
+def duplicate_report(spellings, links, rows_per_link, report_file=None):
+    """
+    Report the link ids that reached the file under more than one spelling.
+
+    Their readings were merged into a single link column with the duplicates rule.
+
+    Args:
+        spellings (dict): Normalized link id -> set of raw spellings
+        links (np.ndarray): Link axis of the file
+        rows_per_link (np.ndarray): Number of CSV rows merged into every link
+        report_file (str, optional): CSV file the report is written to
+
+    Returns:
+        pd.DataFrame: One row per merged link with its raw spellings and row count
+    """
+    positions = {str(link): idx for idx, link in enumerate(links)}
+    records = [(links[positions[link]], ' | '.join(sorted(raw)), len(raw), int(rows_per_link[positions[link]]))
+               for link, raw in spellings.items() if len(raw) > 1 and link in positions]
+    report = pd.DataFrame(records, columns=['link', 'raw_labels', 'n_labels', 'rows'])
+
+    if len(report):
+        print(f"Merged {int(report['n_labels'].sum())} raw link ids into {len(report)} links:")
+        for row in report.head(10).itertuples(index=False):
+            print(f"  {row.link}: {row.raw_labels} ({row.rows} rows)")
+        if len(report) > 10:
+            print(f"  ... and {len(report) - 10} more")
+    else:
+        print("No duplicate link ids found")
+
+    if report_file is not None:
+        report.to_csv(report_file, index=False)
+        print(f"Duplicate report written to {report_file}")
+
+    return report
+
+
+def _tile_shape(n_times, n_links, bytes_per_cell, memory_budget_mb, layout):
+    """
+    Largest (time, link) tile whose accumulator buffers fit in the memory budget
+
+    With the per-link layout tiles span whole link series, so every per-link chunk
+    of the output is written exactly once; otherwise tiles are full-width time slabs.
+    """
+    budget_cells = max(1, int(memory_budget_mb * 1024 ** 2) // bytes_per_cell)
+    if layout == 'per_link':
+        tile_times = max(1, min(n_times, budget_cells))
+        tile_links = max(1, min(n_links, budget_cells // tile_times))
+    else:
+        tile_links = max(1, min(n_links, budget_cells))
+        tile_times = max(1, min(n_times, budget_cells // tile_links))
+    return tile_times, tile_links
+
+
+def _spill_chunk(spill_dir, tile_ids, time_idx, link_idx, rx_values, tx_values):
+    """
+    Append the rows of one chunk to the spill file of the tile they fall in.
+
+    Rows keep their file order inside every tile, so duplicate rules give the
+    same result as scattering the whole file in memory.
+    """
+    records = np.empty(len(tile_ids), dtype=SPILL_DTYPE)
+    records['time'] = time_idx
+    records['link'] = link_idx
+    records['rx'] = rx_values
+    records['tx'] = tx_values
+
+    order = np.argsort(tile_ids, kind='stable')
+    tiles, starts = np.unique(tile_ids[order], return_index=True)
+    for tile_id, rows in zip(tiles, np.split(order, starts[1:])):
+        with open(os.path.join(spill_dir, f"{tile_id}.bin"), 'ab') as spill_file:
+            records[rows].tofile(spill_file)
+
+
+def memory_efficient_csv_to_netcdf(csv_file, output_file, chunk_size=10000, duplicates='last', single_pass=False,
+                                   memory_budget_mb=1024, layout='per_link', compression_level=4, time_chunk=None,
+                                   packing=None, storage_mode='auto', sparse_threshold=SPARSE_DENSITY_THRESHOLD,
+                                   report_file=None):
     """
     A memory-efficient version that processes the CSV file in chunks
+
+    The full time x link matrix is never allocated: the output grid is split into
+    tiles whose buffers fit in memory_budget_mb, rows are spilled to per-tile files
+    next to the output, and each tile is then filled and written as one region of
+    the NetCDF4 file. When the whole grid fits in the budget it is filled in memory
+    and written in one go.
+
+    The density of the grid (rows per time x link cell) is measured in the first
+    pass; below sparse_threshold the file is written in the per-link ragged layout
+    of sparse_storage instead, so its size follows the number of observations.
+
+    Link ids are normalized (see normalize_link_ids) before they reach the link
+    axis, so the file never holds two columns for the same link; readings of
+    ids that collide are merged with the duplicates rule and reported.
+
+    Args:
+        csv_file (str): Path to the tab-separated raw data file
+        output_file (str): Path of the NetCDF file to create
+        chunk_size (int): Number of CSV rows read per chunk
+        duplicates (str): How repeated (time, link) readings are resolved - 'last', 'first', 'mean',
+            'first_valid' or 'max', see GridAccumulator
+        single_pass (bool): Parse the CSV only once, see streaming_csv_to_netcdf
+        memory_budget_mb (float): Upper bound for the grid buffers held in memory
+        layout (str): HDF5 chunk layout of RxLevel/TxLevel, see netcdf_layout.LAYOUTS
+        compression_level (int): zlib level (with shuffle) of RxLevel/TxLevel, 0 disables compression
+        time_chunk (int, optional): Time extent of one HDF5 chunk, overrides the layout default
+        packing (str, optional): On-disk type of RxLevel/TxLevel - None (float64), 'float32' or
+            'int16' (CF scale_factor 0.1), see netcdf_layout.packing_spec
+        storage_mode (str): 'auto' (decide by density), 'dense' or 'sparse'; single-pass output is always dense
+        sparse_threshold (float): Density below which 'auto' writes the ragged layout
+        report_file (str, optional): CSV file for the duplicate link report
+
+    Returns:
+        pd.DataFrame: The duplicate link report, see duplicate_report
     """
+    if duplicates not in DUPLICATE_RULES:
+        raise ValueError(f"Unknown duplicates rule '{duplicates}', expected one of {DUPLICATE_RULES}")
+
+    if single_pass and storage_mode == 'sparse':
+        raise ValueError("The single-pass conversion writes a growable dense file, use the two-pass mode for sparse output")
+
+    if single_pass:
+        return streaming_csv_to_netcdf(csv_file, output_file, chunk_size=chunk_size, duplicates=duplicates,
+                                       memory_budget_mb=memory_budget_mb, layout=layout,
+                                       compression_level=compression_level, time_chunk=time_chunk, packing=packing,
+                                       report_file=report_file)
+
     print(f"\nProcessing file: {os.path.basename(csv_file)}")
     print("First pass: collecting unique values...")
     times_set = set()
     links_set = set()
+    spellings = {}
+    first_pass_rows = 0
 
     # First pass to get unique values - using tab delimiter
-    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t'):
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t', dtype=LINK_ID_DTYPE):
+        first_pass_rows += len(chunk)
         # Convert to datetime using your specific format
-        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format='%d/%m/%Y %I:%M:%S %p')
+        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
         times_set.update(chunk['DATETIME_ID'])
-        links_set.update(chunk['KEY10NEW'])
+        normalized = normalize_link_ids(chunk['KEY10NEW'])
+        links_set.update(normalized)
+        _record_spellings(spellings, chunk['KEY10NEW'], normalized)
 
     times = sorted(times_set)
-    links = sorted(links_set)
+    link_dtype = link_dtype_of(list(links_set))
+    links = sorted(link_labels(list(links_set), link_dtype))
 
     print(f"Found {len(times)} unique timestamps and {len(links)} unique links")
 
-    # Create the dataset with the complete structure
-    ds = xr.Dataset(
-        {
-            'RxLevel': (['time', 'link'], np.full((len(times), len(links)), np.nan)),
-            'TxLevel': (['time', 'link'], np.full((len(times), len(links)), np.nan))
-        },
-        coords={
-            'time': times,
-            'link': links
-        }
-    )
-
-    # Add metadata
-    ds.attrs['description'] = 'Radio link measurements'
-    ds.attrs['created'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    ds.attrs['source_file'] = os.path.basename(csv_file)
-    ds['RxLevel'].attrs['units'] = 'dBm'
-    ds['RxLevel'].attrs['long_name'] = 'Received Signal Level'
-    ds['TxLevel'].attrs['units'] = 'dBm'
-    ds['TxLevel'].attrs['long_name'] = 'Transmitted Signal Level'
-
-    # Create mapping dictionaries for faster lookups
-    times_dict = {time: idx for idx, time in enumerate(times)}
-    link_to_idx = {link: idx for idx, link in enumerate(links)}
-
-    print("Processing chunks...")
+    # Repeated (time, link) rows make this an upper bound of the true density
+    density = min(1.0, first_pass_rows / max(1, len(times) * len(links)))
+    sparse = use_sparse_layout(density, storage_mode, sparse_threshold)
+    print(f"Grid density: {density * 100:.1f}% - writing the {'sparse (ragged)' if sparse else 'dense'} layout")
+
+    # Index objects map whole chunks to grid positions at once
+    time_index = pd.DatetimeIndex(times)
+    link_index = pd.Index(links)
+
+    # Packed output only needs float32 buffers
+    grid_dtype = np.float64 if packing is None else np.float32
+    bytes_per_cell = sum(arr.itemsize for arr in
+                         GridAccumulator((1, 1), duplicates=duplicates, dtype=grid_dtype).state().values())
+    tile_times, tile_links = _tile_shape(len(times), len(links), bytes_per_cell, memory_budget_mb,
+                                         'per_link' if sparse else layout)
+    if sparse:
+        # Ragged output is written link after link, so tiles must span the whole time axis
+        tile_times = len(times)
+    n_link_tiles = -(-len(links) // tile_links)
+    n_tiles = -(-len(times) // tile_times) * n_link_tiles
+    print(f"Filling {n_tiles} tile(s) of up to {tile_times} x {tile_links} cells...")
+
+    # Create the output directory if it doesn't exist
+    output_dir = os.path.dirname(output_file) or '.'
+    os.makedirs(output_dir, exist_ok=True)
+
+    seconds = time_index.values.astype('datetime64[s]').astype(np.int64)
+    if sparse:
+        nc = create_ragged_netcdf(output_file, seconds, links, link_dtype, os.path.basename(csv_file),
+                                  compression_level=compression_level, packing=packing)
+    else:
+        storage = data_storage(len(times), len(links), layout, compression_level, time_chunk, packing)
+        nc = create_link_netcdf(output_file, link_dtype, os.path.basename(csv_file), storage=storage)
+        nc['time'][:] = seconds
+        nc['link'][:] = np.array(links, dtype=object if link_dtype is str else np.int64)
+
+    index_builder = LinkIndexBuilder(time_index.values, links)
+
+    def store(time_start, link_start, rx, tx):
+        """Write one filled tile and return the number of observed cells in it"""
+        index_builder.add(time_start, link_start, rx, tx)
+        if sparse:
+            return append_ragged_links(nc, link_start, rx, tx)
+        region = np.s_[time_start:time_start + rx.shape[0], link_start:link_start + rx.shape[1]]
+        write_region(nc['RxLevel'], region, rx)
+        write_region(nc['TxLevel'], region, tx)
+        return int((~(np.isnan(rx) & np.isnan(tx))).sum())
+
+    rows_per_link = np.zeros(len(links), dtype=np.int64)
+    try:
+        with tempfile.TemporaryDirectory(dir=output_dir) as spill_dir:
+            grid = (GridAccumulator((len(times), len(links)), duplicates=duplicates, dtype=grid_dtype)
+                    if n_tiles == 1 else None)
+
+            print("Processing chunks...")
+            chunk_count = 0
+            total_rows = 0
+
+            # Process the data in chunks
+            for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t', dtype=LINK_ID_DTYPE):
+                chunk_count += 1
+                total_rows += len(chunk)
+                print(f"Processing chunk {chunk_count} (Total rows processed: {total_rows})...")
+
+                chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+                chunk['KEY10NEW'] = link_labels(normalize_link_ids(chunk['KEY10NEW']), link_dtype)
+                time_idx, link_idx = chunk_to_indices(chunk, time_index, link_index)
+                rows_per_link += np.bincount(link_idx, minlength=len(links))
+                rx_values = chunk['RxLevel'].to_numpy(dtype=np.float64)
+                tx_values = chunk['TxLevel'].to_numpy(dtype=np.float64)
+
+                if grid is not None:
+                    # Scatter the whole chunk straight into the NumPy buffers
+                    grid.add(time_idx, link_idx, rx_values, tx_values)
+                else:
+                    tile_ids = (time_idx // tile_times) * n_link_tiles + link_idx // tile_links
+                    _spill_chunk(spill_dir, tile_ids, time_idx, link_idx, rx_values, tx_values)
+
+            print(f"Saving final NetCDF file to {output_file}...")
+            observed = 0
+            if grid is not None:
+                observed += store(0, 0, grid.rx, grid.tx)
+
+            # Tiles without any rows are never written and keep the NaN fill value (or a row_size of 0)
+            for spill_name in sorted(os.listdir(spill_dir), key=lambda name: int(name.split('.')[0])):
+                tile_id = int(spill_name.split('.')[0])
+                time_start = (tile_id // n_link_tiles) * tile_times
+                link_start = (tile_id % n_link_tiles) * tile_links
+                time_stop = min(time_start + tile_times, len(times))
+                link_stop = min(link_start + tile_links, len(links))
+
+                records = np.fromfile(os.path.join(spill_dir, spill_name), dtype=SPILL_DTYPE)
+                tile = GridAccumulator((time_stop - time_start, link_stop - link_start), duplicates=duplicates,
+                                       dtype=grid_dtype)
+                tile.add(records['time'] - time_start, records['link'] - link_start, records['rx'], records['tx'])
+                observed += store(time_start, link_start, tile.rx, tile.tx)
+                del records, tile
+    finally:
+        nc.close()
+
+    print(f"Stored {observed} observed cells ({observed / max(1, len(times) * len(links)) * 100:.1f}% of the grid)")
+    index_builder.write(output_file)
+    report = duplicate_report(spellings, links, rows_per_link, report_file)
+
+    print(f"Completed processing {os.path.basename(csv_file)}!")
+    return report
+
+
+def _assign_positions(values, positions, ordered):
+    """
+    Map values to their position along a growable axis, appending unseen values.
+
+    Unseen values are appended in sorted order, so every block added to the
+    axis is itself sorted.
+
+    Args:
+        values (np.ndarray): Values of one chunk
+        positions (dict): value -> position of everything seen so far (updated in place)
+        ordered (list): Axis values in file order (updated in place)
+
+    Returns:
+        np.ndarray: Position of every input value
+    """
+    uniques, inverse = np.unique(values, return_inverse=True)
+    pos = np.fromiter((positions.get(v, -1) for v in uniques.tolist()), dtype=np.int64, count=len(uniques))
+
+    new = pos < 0
+    pos[new] = len(ordered) + np.arange(new.sum())
+    new_values = uniques[new].tolist()
+    positions.update(zip(new_values, pos[new].tolist()))
+    ordered.extend(new_values)
+
+    return pos[inverse]
+
+
+def _merge_chunk(nc, time_idx, link_idx, rx_values, tx_values, duplicates, n_old_times, n_old_links):
+    """
+    Merge one chunk into the growable file, touching only the rows and links it covers.
+
+    Rows that already exist are read, merged and written back in place; rows for
+    new timestamps are appended as one contiguous block.
+    """
+    rows = np.unique(time_idx)
+    col_start, col_stop = link_idx.min(), link_idx.max() + 1
+    old_rows = rows[rows < n_old_times]
+    old_col_stop = min(col_stop, n_old_links)
+
+    grid = GridAccumulator((len(rows), col_stop - col_start), duplicates=duplicates)
+    if len(old_rows) and old_col_stop > col_start:
+        for name, arr in grid.state().items():
+            arr[:len(old_rows), :old_col_stop - col_start] = read_region(nc[name],
+                                                                          np.s_[old_rows, col_start:old_col_stop])
+
+    grid.add(np.searchsorted(rows, time_idx), link_idx - col_start, rx_values, tx_values)
+
+    for name, arr in grid.state().items():
+        var = nc[name]
+        data = arr.astype(var.dtype)
+        if len(old_rows):
+            var[old_rows, col_start:col_stop] = data[:len(old_rows)]
+        if len(rows) > len(old_rows):
+            var[n_old_times:n_old_times + len(rows) - len(old_rows), col_start:col_stop] = data[len(old_rows):]
+
+
+def _read_sorted(var, index, axis):
+    """Read the given sorted, unique positions along one axis of a (time, link) variable"""
+    if index[-1] - index[0] + 1 == len(index):
+        index = slice(index[0], index[-1] + 1)
+    return read_region(var, np.s_[index, :] if axis == 0 else np.s_[:, index])
+
+
+def _write_sorted_copy(staging_file, output_file, times, links, link_dtype, memory_budget_mb, storage, layout,
+                       sort_links=True):
+    """
+    Final merge step: rewrite a staged file with time and link axes in sorted order.
+
+    Works through the staged NetCDF in blocks bounded by memory_budget_mb, so it
+    never re-reads the CSV. Blocks are whole link columns for the per-link layout
+    and full-width time slabs otherwise, so every output chunk is written once.
+    Times are given in TIME_UNITS; with sort_links=False the link order is kept.
+    """
+    time_order = np.argsort(times, kind='stable')
+    link_order = np.argsort(links, kind='stable') if sort_links else np.arange(len(links))
+
+    # Two variables, each held once as read and once reordered
+    budget_values = max(1, int(memory_budget_mb * 1024 ** 2) // 32)
+
+    with Dataset(staging_file, 'r') as staged:
+        out = create_link_netcdf(output_file, link_dtype, getattr(staged, 'source_file', ''), storage=storage)
+        try:
+            out.setncatts({name: staged.getncattr(name) for name in staged.ncattrs()})
+            out['time'][:] = times[time_order]
+            out['link'][:] = links[link_order]
+
+            if layout == 'per_link':
+                block_links = max(1, budget_values // max(1, len(times)))
+                for start in range(0, len(links), block_links):
+                    src = link_order[start:start + block_links]
+                    src_sorted = np.sort(src)
+                    reorder = np.searchsorted(src_sorted, src)
+                    for name in ('RxLevel', 'TxLevel'):
+                        block = _read_sorted(staged[name], src_sorted, axis=1)
+                        write_region(out[name], np.s_[:, start:start + len(src)], block[time_order][:, reorder])
+            else:
+                slab_rows = max(1, budget_values // max(1, len(links)))
+                for start in range(0, len(times), slab_rows):
+                    src = time_order[start:start + slab_rows]
+                    src_sorted = np.sort(src)
+                    reorder = np.searchsorted(src_sorted, src)
+                    for name in ('RxLevel', 'TxLevel'):
+                        block = _read_sorted(staged[name], src_sorted, axis=0)
+                        write_region(out[name], np.s_[start:start + len(src), :], block[reorder][:, link_order])
+        finally:
+            out.close()
+
+
+def streaming_csv_to_netcdf(csv_file, output_file, chunk_size=10000, duplicates='last', memory_budget_mb=1024,
+                            layout='per_link', compression_level=4, time_chunk=None, packing=None, report_file=None):
+    """
+    Single-pass CSV to NetCDF conversion with unlimited time and link dimensions.
+
+    Every chunk is parsed once. While timestamps arrive in order, rows are held
+    until the buffered time slab reaches memory_budget_mb and are then written
+    straight into the requested layout in whole chunks of its time extent, so a
+    time-sorted CSV is written once and never rewritten. A chunk that goes back
+    to a timestamp already written (or introduces an earlier one) switches to
+    the growable staging layout: timestamps not seen before are appended as a
+    sorted block, readings for timestamps seen in earlier chunks are merged into
+    their existing rows, and a final merge step rewrites the staged NetCDF in
+    sorted order - the CSV is never read twice. The 'first' and 'mean' rules
+    keep per-cell state next to the data, so they always use the staging path.
+    Links that arrive out of sorted order also trigger the final rewrite.
+
+    Link ids are normalized as in memory_efficient_csv_to_netcdf; whether the
+    link axis holds integers is decided by the first chunk.
+
+    Args:
+        csv_file (str): Path to the tab-separated raw data file
+        output_file (str): Path of the NetCDF file to create
+        chunk_size (int): Number of CSV rows read per chunk
+        duplicates (str): How repeated (time, link) readings are resolved, see GridAccumulator
+        memory_budget_mb (float): Upper bound for the time slab buffered in memory and for the
+            slabs held by the final merge
+        layout (str): HDF5 chunk layout of RxLevel/TxLevel, see netcdf_layout.LAYOUTS
+        compression_level (int): zlib level (with shuffle) of RxLevel/TxLevel, 0 disables compression
+        time_chunk (int, optional): Time extent of one HDF5 chunk, overrides the layout default
+        packing (str, optional): On-disk type of RxLevel/TxLevel, see netcdf_layout.packing_spec
+        report_file (str, optional): CSV file for the duplicate link report
+
+    Returns:
+        pd.DataFrame: The duplicate link report, see duplicate_report
+    """
+    aux_dtypes = {'_written': 'u1', '_rx_count': 'i4', '_tx_count': 'i4'}
+    aux_variables = [(name, aux_dtypes[name])
+                     for name in GridAccumulator((0, 0), duplicates=duplicates).state()
+                     if name in aux_dtypes]
+
+    print(f"\nProcessing file: {os.path.basename(csv_file)}")
+    print("Single pass: streaming chunks into the NetCDF file...")
+
+    os.makedirs(os.path.dirname(output_file) or '.', exist_ok=True)
+    staging_file = output_file + '.staging'
+    source_file = os.path.basename(csv_file)
+
+    time_positions, times = {}, []
+    link_positions, links = {}, []
+    link_dtype = None
+    spellings = {}
+    link_rows = []
+    nc = None
     chunk_count = 0
     total_rows = 0
 
-    # Process the data in chunks
-    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t'):
-        chunk_count += 1
-        total_rows += len(chunk)
-        print(f"Processing chunk {chunk_count} (Total rows processed: {total_rows})...")
+    # Time-ordered input is written directly in the final layout (stateless duplicate rules only)
+    direct = not aux_variables
+    storage = None
+    pending = []
+    flushed = 0
+    slab_cell_bytes = 32  # RxLevel/TxLevel buffers of the slab plus their on-disk copies
 
-        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format='%d/%m/%Y %I:%M:%S %p')
+    def flush(stop):
+        """Write the pending rows of time positions [flushed, stop) and keep the later ones pending"""
+        nonlocal nc, storage, pending, flushed
+        if nc is None:
+            storage = data_storage(stop - flushed, len(links), layout, compression_level, time_chunk, packing)
+            nc = create_link_netcdf(staging_file, link_dtype, source_file, storage=storage)
 
-        # Update the data arrays directly
-        for _, row in chunk.iterrows():
-            time_idx = times_dict[row['DATETIME_ID']]
-            link_idx = link_to_idx[row['KEY10NEW']]
-            ds['RxLevel'][time_idx, link_idx] = row['RxLevel']
-            ds['TxLevel'][time_idx, link_idx] = row['TxLevel']
+        records = np.concatenate(pending) if pending else np.empty(0, dtype=SPILL_DTYPE)
+        ready = records['time'] < stop
+        grid = GridAccumulator((stop - flushed, len(links)), duplicates=duplicates)
+        grid.add(records['time'][ready] - flushed, records['link'][ready], records['rx'][ready], records['tx'][ready])
 
-    print(f"Saving final NetCDF file to {output_file}...")
-    # Create the output directory if it doesn't exist
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        region = np.s_[flushed:stop, :len(links)]
+        write_region(nc['RxLevel'], region, grid.rx)
+        write_region(nc['TxLevel'], region, grid.tx)
+        nc['time'][flushed:stop] = np.array(times[flushed:stop], dtype=np.int64)
+        nc['link'][:] = np.array(links, dtype=object if link_dtype is str else np.int64)
+
+        pending = [records[~ready]]
+        flushed = stop
+
+    try:
+        for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t', dtype=LINK_ID_DTYPE):
+            chunk_count += 1
+            total_rows += len(chunk)
+            print(f"Processing chunk {chunk_count} (Total rows processed: {total_rows})...")
+
+            chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+            seconds = chunk['DATETIME_ID'].to_numpy().astype('datetime64[s]').astype(np.int64)
+
+            normalized = normalize_link_ids(chunk['KEY10NEW'])
+            _record_spellings(spellings, chunk['KEY10NEW'], normalized)
+            if link_dtype is None:
+                link_dtype = link_dtype_of(normalized)
+                if not direct:
+                    nc = create_link_netcdf(staging_file, link_dtype, source_file, aux_variables)
+
+            n_old_times, n_old_links = len(times), len(links)
+            time_idx = _assign_positions(seconds, time_positions, times)
+            link_idx = _assign_positions(link_labels(normalized, link_dtype), link_positions, links)
+            link_rows.append(np.bincount(link_idx, minlength=len(links)))
+            rx_values = chunk['RxLevel'].to_numpy(dtype=np.float64)
+            tx_values = chunk['TxLevel'].to_numpy(dtype=np.float64)
+
+            # Rows of a timestamp already written, or new timestamps (appended sorted) before the latest one
+            went_back = direct and len(time_idx) > 0 and (
+                time_idx.min() < flushed or
+                0 < n_old_times < len(times) and times[n_old_times] < times[n_old_times - 1])
+            if went_back:
+                print("Timestamps arrive out of order, staging the rest for a final merge...")
+                if nc is None:
+                    nc = create_link_netcdf(staging_file, link_dtype, source_file)
+                flush(n_old_times)
+                if storage is not None:
+                    # Rows written so far move to the growable layout, which takes in-place merges cheaply
+                    nc.close()
+                    nc = None
+                    growable_file = staging_file + '.growable'
+                    _write_sorted_copy(staging_file, growable_file, np.array(times[:n_old_times], dtype=np.int64),
+                                       np.array(links, dtype=object if link_dtype is str else np.int64), link_dtype,
+                                       memory_budget_mb, None, 'balanced', sort_links=False)
+                    os.replace(growable_file, staging_file)
+                    nc = Dataset(staging_file, 'a')
+                direct = False
+
+            if direct:
+                block = np.empty(len(chunk), dtype=SPILL_DTYPE)
+                block['time'], block['link'], block['rx'], block['tx'] = time_idx, link_idx, rx_values, tx_values
+                pending.append(block)
+
+                # The latest timestamp may continue in the next chunk, so it stays pending
+                ready = len(times) - 1
+                if (ready - flushed) * len(links) * slab_cell_bytes > memory_budget_mb * 1024 ** 2:
+                    # Whole chunks of the output, or the full slab if it is shorter than one
+                    slab = storage['chunksizes'][0] if storage is not None else ready - flushed
+                    flush(flushed + ((ready - flushed) // slab * slab or ready - flushed))
+                continue
+
+            _merge_chunk(nc, time_idx, link_idx, rx_values, tx_values, duplicates, n_old_times, n_old_links)
+
+            if len(times) > n_old_times:
+                nc['time'][n_old_times:] = np.array(times[n_old_times:], dtype=np.int64)
+            if len(links) > n_old_links:
+                nc['link'][n_old_links:] = np.array(links[n_old_links:], dtype=object if link_dtype is str else np.int64)
+
+        if direct and link_dtype is not None:
+            flush(len(times))
+    except BaseException:
+        if nc is not None:
+            nc.close()
+            nc = None
+        for path in (staging_file, staging_file + '.growable'):
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+    finally:
+        if nc is not None:
+            nc.close()
+
+    if link_dtype is None:
+        print(f"No rows found in {os.path.basename(csv_file)}")
+        return
+
+    print(f"Found {len(times)} unique timestamps and {len(links)} unique links")
+
+    times = np.array(times, dtype=np.int64)
+    links = np.array(links, dtype=object if link_dtype is str else np.int64)
+    rows_per_link = np.zeros(len(links), dtype=np.int64)
+    for counts in link_rows:
+        rows_per_link[:len(counts)] += counts
+    in_order = bool(np.all(np.diff(times) > 0)) and bool(np.all(links[:-1] < links[1:]))
+
+    # The staging file already is the final file when it is sorted and uses the requested layout
+    staging_layout = layout == 'balanced' and not compression_level and time_chunk is None and packing is None
+    try:
+        if in_order and (direct or (staging_layout and not aux_variables)):
+            os.replace(staging_file, output_file)
+        else:
+            print("Merging staged blocks into the final NetCDF file...")
+            storage = data_storage(len(times), len(links), layout, compression_level, time_chunk, packing)
+            _write_sorted_copy(staging_file, output_file, times, links, link_dtype, memory_budget_mb, storage, layout)
+    finally:
+        if os.path.exists(staging_file):
+            os.remove(staging_file)
+
+    build_link_index(output_file, memory_budget_mb=memory_budget_mb)
+    report = duplicate_report(spellings, links, rows_per_link, report_file)
 
-    # Save the final dataset
-    ds.to_netcdf(output_file)
-    ds.close()
     print(f"Completed processing {os.path.basename(csv_file)}!")
+    return report
+
+
+def _time_seconds(time_var):
+    """Values of an existing time variable as integer seconds since the epoch (TIME_UNITS)"""
+    values = time_var[:]
+    if getattr(time_var, 'units', None) == TIME_UNITS:
+        return np.asarray(values, dtype=np.int64)
+
+    dates = num2date(values, time_var.units, getattr(time_var, 'calendar', 'standard'),
+                     only_use_cftime_datetimes=False, only_use_python_datetimes=True)
+    return pd.DatetimeIndex(dates).values.astype('datetime64[s]').astype(np.int64)
+
+
+def _make_growable(netcdf_file, memory_budget_mb, layout, compression_level, time_chunk, packing):
+    """
+    One-time rewrite of a file with fixed dimensions (e.g. written by xarray) into
+    the growable layout used by the writers in this module, keeping its link order.
+    """
+    with Dataset(netcdf_file, 'r') as nc:
+        times = _time_seconds(nc['time'])
+        link_dtype = str if nc['link'].dtype == str else np.int64
+        links = np.array(nc['link'][:], dtype=object if link_dtype is str else np.int64)
+
+    growable_file = netcdf_file + '.growable'
+    storage = data_storage(len(times), len(links), layout, compression_level, time_chunk, packing)
+    try:
+        _write_sorted_copy(netcdf_file, growable_file, times, links, link_dtype, memory_budget_mb, storage, layout,
+                           sort_links=False)
+        os.replace(growable_file, netcdf_file)
+    finally:
+        if os.path.exists(growable_file):
+            os.remove(growable_file)
+
+
+def _read_append_records(netcdf_file, csv_file, chunk_size, times, links, link_dtype):
+    """
+    Parse a CSV drop once into compact (time, link, rx, tx) records on the axes of an existing file.
+
+    Timestamps and links the file does not hold yet are added at the end of their
+    axis in sorted order. New link ids are matched against the normalized ids of
+    the file, which must be unique.
+
+    Args:
+        netcdf_file (str): The file appended to, for error messages
+        csv_file (str): Path to the tab-separated raw data file to add
+        chunk_size (int): Number of CSV rows read per chunk
+        times (list): Time axis of the file in TIME_UNITS
+        links (list): Link axis of the file
+        link_dtype (type): str or np.int64, the type of the link labels
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray, dict]: SPILL_DTYPE records, the extended
+            time and link axes, and the raw spellings of the new link ids
+    """
+    times, links = np.asarray(times, dtype=np.int64).tolist(), np.asarray(links).tolist()
+    time_positions = {value: idx for idx, value in enumerate(times)}
+    n_old_times, n_old_links = len(times), len(links)
+
+    # Existing ids are matched by their normalized spelling, which must be unique
+    existing = link_labels(normalize_link_ids(links), link_dtype).tolist() if links else []
+    link_positions = {value: idx for idx, value in enumerate(existing)}
+    if len(link_positions) < len(existing):
+        raise ValueError(f"{os.path.basename(netcdf_file)} holds repeated link ids, run clean_netcdf on it first")
+
+    records = []
+    spellings = {}
+    for chunk in pd.read_csv(csv_file, chunksize=chunk_size, sep='\t', dtype=LINK_ID_DTYPE):
+        chunk['DATETIME_ID'] = pd.to_datetime(chunk['DATETIME_ID'], format=DATETIME_FORMAT)
+        normalized = normalize_link_ids(chunk['KEY10NEW'])
+        _record_spellings(spellings, chunk['KEY10NEW'], normalized)
+        block = np.empty(len(chunk), dtype=SPILL_DTYPE)
+        block['time'] = _assign_positions(chunk['DATETIME_ID'].to_numpy().astype('datetime64[s]').astype(np.int64),
+                                          time_positions, times)
+        block['link'] = _assign_positions(link_labels(normalized, link_dtype), link_positions, links)
+        block['rx'] = chunk['RxLevel'].to_numpy(dtype=np.float64)
+        block['tx'] = chunk['TxLevel'].to_numpy(dtype=np.float64)
+        records.append(block)
+    records = np.concatenate(records) if records else np.empty(0, dtype=SPILL_DTYPE)
+
+    # Appended timestamps and links go to the end of their axis in sorted order
+    times = np.array(times, dtype=np.int64)
+    links = np.array(links, dtype=object if link_dtype is str else np.int64)
+    time_rank = np.arange(len(times))
+    time_rank[n_old_times:] = n_old_times + np.argsort(np.argsort(times[n_old_times:], kind='stable'))
+    link_rank = np.arange(len(links))
+    link_rank[n_old_links:] = n_old_links + np.argsort(np.argsort(links[n_old_links:], kind='stable'))
+    records['time'] = time_rank[records['time']]
+    records['link'] = link_rank[records['link']]
+    times[time_rank] = times.copy()
+    links[link_rank] = links.copy()
+    return records, times, links, spellings
 
 
-def process_directory(input_directory, output_directory):
+def _link_record_blocks(records, col_start, col_stop, block_links):
+    """(first link, last link + 1, records) of consecutive blocks of block_links links, records in file order"""
+    order = np.argsort(records['link'], kind='stable')
+    block_starts = np.searchsorted(records['link'][order], np.arange(col_start, col_stop, block_links))
+    for block_start, record_rows in zip(range(col_start, col_stop, block_links), np.split(order, block_starts[1:])):
+        yield block_start, min(block_start + block_links, col_stop), records[record_rows]
+
+
+def _append_ragged(netcdf_file, csv_file, chunk_size, duplicates, memory_budget_mb, report_file):
+    """
+    append_csv_to_netcdf for files in the ragged layout of sparse_storage.
+
+    Observations are stored link after link, so new readings cannot be added in
+    place: the file is rewritten in blocks of whole links, each block merging the
+    stored observations (moved onto the extended, sorted time axis) with the new
+    records. The rewrite keeps the packing and compression of the file and never
+    holds more than one link block on the dense time axis.
+    """
+    with RaggedLinkDataset(netcdf_file) as ds:
+        old_times = ds.time.values.astype('datetime64[s]').astype(np.int64)
+        link_dtype = np.int64 if np.issubdtype(ds.link.values.dtype, np.integer) else str
+        old_links = ds.link.values
+
+    records, times, links, spellings = _read_append_records(netcdf_file, csv_file, chunk_size, old_times, old_links,
+                                                            link_dtype)
+    if len(records) == 0:
+        print("No rows to append")
+        return duplicate_report({}, links, np.zeros(len(links), dtype=np.int64), report_file)
+
+    n_old_times, n_old_links = len(old_times), len(old_links)
+    print(f"Adding {len(times) - n_old_times} timestamps and {len(links) - n_old_links} links "
+          f"({len(records)} rows)")
+    report = duplicate_report(spellings, links, np.bincount(records['link'], minlength=len(links)), report_file)
+
+    # New timestamps may fall anywhere, the rewritten file keeps the time axis sorted
+    time_order = np.argsort(times, kind='stable')
+    time_position = np.empty(len(times), dtype=np.int64)
+    time_position[time_order] = np.arange(len(times))
+    times = times[time_order]
+
+    print("File uses the ragged layout, rewriting it with the new observations...")
+    rewritten_file = netcdf_file + '.rewrite'
+    bytes_per_cell = sum(arr.itemsize for arr in GridAccumulator((1, 1), duplicates=duplicates).state().values())
+    block_links = max(1, int(memory_budget_mb * 1024 ** 2) // (2 * bytes_per_cell * len(times)))
+    index_builder = LinkIndexBuilder(times.astype('datetime64[s]'), links)
+
+    try:
+        with RaggedLinkDataset(netcdf_file) as ds:
+            spec = ds.storage()
+            out = create_ragged_netcdf(rewritten_file, times, links, link_dtype, **spec)
+            try:
+                out.setncatts({name: value for name, value in ds.attrs.items() if name != 'storage_layout'})
+                history = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: appended {os.path.basename(csv_file)}"
+                out.history = f"{ds.attrs['history']}\n{history}" if 'history' in ds.attrs else history
+
+                for block_start, block_stop, block in _link_record_blocks(records, 0, len(links), block_links):
+                    grid = GridAccumulator((len(times), block_stop - block_start), duplicates=duplicates)
+                    stored = np.arange(block_start, min(block_stop, n_old_links))
+                    if len(stored):
+                        old_rows = time_position[:n_old_times]
+                        grid.rx[old_rows, :len(stored)] = ds.read_window('RxLevel', 0, n_old_times, stored)
+                        grid.tx[old_rows, :len(stored)] = ds.read_window('TxLevel', 0, n_old_times, stored)
+                        if grid.written is not None:
+                            grid.written[:] = ~(np.isnan(grid.rx) & np.isnan(grid.tx))
+
+                    grid.add(time_position[block['time']], block['link'] - block_start, block['rx'], block['tx'])
+                    index_builder.add(0, block_start, grid.rx, grid.tx)
+                    append_ragged_links(out, block_start, grid.rx, grid.tx)
+            finally:
+                out.close()
+        os.replace(rewritten_file, netcdf_file)
+    finally:
+        if os.path.exists(rewritten_file):
+            os.remove(rewritten_file)
+
+    index_builder.write(netcdf_file)
+    print(f"Completed appending {os.path.basename(csv_file)}!")
+    return report
+
+
+def append_csv_to_netcdf(netcdf_file, csv_file, chunk_size=10000, duplicates='last', memory_budget_mb=1024,
+                         layout='per_link', compression_level=4, time_chunk=None, packing=None, report_file=None):
+    """
+    Append a new raw CSV drop to an existing NetCDF file in place.
+
+    New timestamps extend the time axis and new links are added at the end of
+    the link axis; readings for timestamps already in the file are merged into
+    their rows. Only the rows and links touched by the new data are read and
+    rewritten, so the cost follows the size of the CSV, not of the archive.
+    The file is rewritten as a whole only when it has fixed dimensions (once,
+    to make it growable) or when the new timestamps fall between existing ones.
+    Files in the ragged layout (written for low-coverage data, see sparse_storage)
+    are always rewritten link block by link block, keeping that layout.
+
+    New link ids are normalized and matched against the normalized ids of the
+    file, so a different spelling never adds a second column for a link. A file
+    that already holds repeated link ids is refused; run clean_netcdf on it once.
+
+    Args:
+        netcdf_file (str): Existing NetCDF file, updated in place
+        csv_file (str): Path to the tab-separated raw data file to add
+        chunk_size (int): Number of CSV rows read per chunk
+        duplicates (str): Resolution of readings for cells that already hold data -
+            'last' (the new CSV wins), 'first' (the archive wins), 'first_valid' (the archive
+            wins where it holds a reading) or 'max'
+        memory_budget_mb (float): Upper bound for the region buffers held in memory
+        layout (str): Chunk layout used if a dense file has to be rewritten
+        compression_level (int): zlib level used if a dense file has to be rewritten
+        time_chunk (int, optional): Time extent of one HDF5 chunk used if a dense file has to be rewritten
+        packing (str, optional): On-disk type used if a dense file has to be rewritten; in place
+            (and for ragged files) the new values are packed like the existing variables
+        report_file (str, optional): CSV file for the duplicate link report
+
+    Returns:
+        pd.DataFrame: The duplicate link report of the appended rows, see duplicate_report
+    """
+    if duplicates not in APPEND_DUPLICATE_RULES:
+        raise ValueError(f"Unknown duplicates rule '{duplicates}' for appending, expected one of {APPEND_DUPLICATE_RULES}")
+
+    print(f"\nAppending {os.path.basename(csv_file)} to {os.path.basename(netcdf_file)}")
+
+    if is_ragged(netcdf_file):
+        return _append_ragged(netcdf_file, csv_file, chunk_size, duplicates, memory_budget_mb, report_file)
+
+    with Dataset(netcdf_file, 'r') as nc:
+        growable = (nc.dimensions['time'].isunlimited() and nc.dimensions['link'].isunlimited()
+                    and getattr(nc['time'], 'units', None) == TIME_UNITS)
+    if not growable:
+        print("File has fixed dimensions, rewriting it once into the growable layout...")
+        _make_growable(netcdf_file, memory_budget_mb, layout, compression_level, time_chunk, packing)
+
+    nc = Dataset(netcdf_file, 'a')
+    try:
+        link_dtype = str if nc['link'].dtype == str else np.int64
+        n_old_times, n_old_links = len(nc['time']), len(nc['link'])
+        records, times, links, spellings = _read_append_records(
+            netcdf_file, csv_file, chunk_size, _time_seconds(nc['time']),
+            np.array(nc['link'][:], dtype=object if link_dtype is str else np.int64), link_dtype)
+
+        if len(records) == 0:
+            print("No rows to append")
+            return duplicate_report({}, links, np.zeros(len(links), dtype=np.int64), report_file)
+
+        print(f"Adding {len(times) - n_old_times} timestamps and {len(links) - n_old_links} links "
+              f"({len(records)} rows)")
+        report = duplicate_report(spellings, links, np.bincount(records['link'], minlength=len(links)), report_file)
+
+        rows = np.unique(records['time'])
+        old_rows = rows[rows < n_old_times]
+        n_new_rows = len(rows) - len(old_rows)
+        col_start, col_stop = int(records['link'].min()), int(records['link'].max()) + 1
+
+        if n_new_rows:
+            nc['time'][n_old_times:] = times[n_old_times:]
+        if len(links) > n_old_links:
+            nc['link'][n_old_links:] = links[n_old_links:]
+
+        # Work through the affected region in blocks of whole link columns
+        bytes_per_cell = sum(arr.itemsize for arr in GridAccumulator((1, 1), duplicates=duplicates).state().values())
+        block_links = max(1, int(memory_budget_mb * 1024 ** 2) // (bytes_per_cell * len(rows)))
+
+        for block_start, block_stop, block in _link_record_blocks(records, col_start, col_stop, block_links):
+            grid = GridAccumulator((len(rows), block_stop - block_start), duplicates=duplicates)
+
+            old_col_stop = min(block_stop, n_old_links)
+            if len(old_rows) and old_col_stop > block_start:
+                for name, arr in (('RxLevel', grid.rx), ('TxLevel', grid.tx)):
+                    arr[:len(old_rows), :old_col_stop - block_start] = read_region(
+                        nc[name], np.s_[old_rows, block_start:old_col_stop])
+                if grid.written is not None:
+                    grid.written[:] = ~(np.isnan(grid.rx) & np.isnan(grid.tx))
+
+            grid.add(np.searchsorted(rows, block['time']), block['link'] - block_start, block['rx'], block['tx'])
+
+            for name, arr in (('RxLevel', grid.rx), ('TxLevel', grid.tx)):
+                if len(old_rows):
+                    write_region(nc[name], np.s_[old_rows, block_start:block_stop], arr[:len(old_rows)])
+                if n_new_rows:
+                    write_region(nc[name], np.s_[n_old_times:n_old_times + n_new_rows, block_start:block_stop],
+                                  arr[len(old_rows):])
+
+        history = f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}: appended {os.path.basename(csv_file)}"
+        nc.history = f"{nc.history}\n{history}" if 'history' in nc.ncattrs() else history
+    finally:
+        nc.close()
+
+    if n_new_rows and n_old_times and times[n_old_times] <= times[n_old_times - 1]:
+        print("New timestamps fall between existing ones, re-sorting the time axis...")
+        sorted_file = netcdf_file + '.sorted'
+        storage = data_storage(len(times), len(links), layout, compression_level, time_chunk, packing)
+        try:
+            _write_sorted_copy(netcdf_file, sorted_file, times, links, link_dtype, memory_budget_mb, storage, layout,
+                               sort_links=False)
+            os.replace(sorted_file, netcdf_file)
+        finally:
+            if os.path.exists(sorted_file):
+                os.remove(sorted_file)
+
+    # Only the links that received rows need their index entries refreshed
+    build_link_index(netcdf_file, columns=np.arange(col_start, col_stop), memory_budget_mb=memory_budget_mb)
+
+    print(f"Completed appending {os.path.basename(csv_file)}!")
+    return report
+
+
+def estimate_peak_memory_mb(csv_file, chunk_size=10000, duplicates='last', memory_budget_mb=1024, **_):
+    """
+    Estimate the peak memory of converting one file from its unique time/link counts.
+
+    Only the DATETIME_ID and KEY10NEW columns are read and the timestamps are
+    counted as raw strings, which is much cheaper than a conversion pass.
+
+    Args:
+        csv_file (str): Path to the tab-separated raw data file
+        chunk_size (int): CSV chunk size the conversion will use
+        duplicates (str): Duplicates rule the conversion will use
+        memory_budget_mb (float): Grid memory budget the conversion will use
+
+    Returns:
+        float: Estimated peak resident memory in MB
+    """
+    times_set = set()
+    links_set = set()
+    for chunk in pd.read_csv(csv_file, chunksize=max(chunk_size, 100000), sep='\t',
+                             usecols=['DATETIME_ID', 'KEY10NEW']):
+        times_set.update(chunk['DATETIME_ID'].unique())
+        links_set.update(chunk['KEY10NEW'].unique())
+
+    bytes_per_cell = sum(arr.itemsize for arr in GridAccumulator((1, 1), duplicates=duplicates).state().values())
+    grid_mb = len(times_set) * len(links_set) * bytes_per_cell / 1024 ** 2
+    axes_mb = (len(times_set) + len(links_set)) * AXIS_VALUE_BYTES / 1024 ** 2
+    chunk_mb = chunk_size * CSV_ROW_BYTES / 1024 ** 2
+
+    return BASE_PROCESS_MB + min(grid_mb, memory_budget_mb) + axes_mb + chunk_mb
+
+
+def _available_memory_mb():
+    """Currently available physical memory in MB, or None when it cannot be determined"""
+    try:
+        import psutil
+        return psutil.virtual_memory().available / 1024 ** 2
+    except ImportError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def _convert_file(input_path, output_path, convert_kwargs):
+    """Worker entry point: convert one file and return the time it took"""
+    start_time = time.time()
+    memory_efficient_csv_to_netcdf(input_path, output_path, **convert_kwargs)
+    return time.time() - start_time
+
+
+def _process_parallel(jobs, max_workers, memory_limit_mb, convert_kwargs):
+    """
+    Convert files on a process pool, starting a file only when its estimated
+    peak memory fits next to the files already running.
+    """
+    results = {}
+    max_workers = max_workers or max(1, (os.cpu_count() or 1) - 1)
+    if memory_limit_mb is None:
+        memory_limit_mb = _available_memory_mb()
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        print("Estimating peak memory per file...")
+        estimate_futures = {executor.submit(estimate_peak_memory_mb, input_path, **convert_kwargs): csv_file
+                            for csv_file, input_path, _ in jobs}
+        estimates = {}
+        for future in concurrent.futures.as_completed(estimate_futures):
+            csv_file = estimate_futures[future]
+            try:
+                estimates[csv_file] = future.result()
+                print(f"{csv_file}: ~{estimates[csv_file]:.0f} MB peak")
+            except Exception as e:
+                print(f"Error estimating {csv_file}: {str(e)}")
+                results[csv_file] = {'seconds': None, 'error': str(e)}
+
+        # Largest files first, so a big file is not left running alone at the end
+        pending = sorted((job for job in jobs if job[0] in estimates), key=lambda job: estimates[job[0]],
+                         reverse=True)
+        running = {}
+
+        while pending or running:
+            reserved = sum(estimates[csv_file] for csv_file in running.values())
+            for job in list(pending):
+                if len(running) >= max_workers:
+                    break
+                csv_file, input_path, output_path = job
+                fits = memory_limit_mb is None or reserved + estimates[csv_file] <= memory_limit_mb
+                # A file that does not fit even alone still runs, but never next to others
+                if fits or not running:
+                    print(f"Starting {csv_file} ({len(running) + 1} running)")
+                    running[executor.submit(_convert_file, input_path, output_path, convert_kwargs)] = csv_file
+                    reserved += estimates[csv_file]
+                    pending.remove(job)
+
+            done, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                csv_file = running.pop(future)
+                try:
+                    seconds = future.result()
+                    results[csv_file] = {'seconds': seconds, 'error': None}
+                    print(f"Finished {csv_file} in {seconds:.2f} seconds")
+                except Exception as e:
+                    results[csv_file] = {'seconds': None, 'error': str(e)}
+                    print(f"Error processing {csv_file}: {str(e)}")
+
+    return results
+
+
+def process_directory(input_directory, output_directory, parallel=False, max_workers=None, memory_limit_mb=None,
+                      **convert_kwargs):
     """
     Process all CSV files in the input directory and save NetCDF files to the output directory
+
+    Args:
+        input_directory (str): Directory with the raw CSV files
+        output_directory (str): Directory for the NetCDF files
+        parallel (bool): Convert files concurrently on a process pool
+        max_workers (int, optional): Pool size, defaults to one less than the number of cores
+        memory_limit_mb (float, optional): Memory the running conversions may use together,
+            defaults to the currently available physical memory
+        **convert_kwargs: Passed on to memory_efficient_csv_to_netcdf
+
+    Returns:
+        dict: Per file, the processing time in seconds and the error message if it failed
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_directory, exist_ok=True)
@@ -94,29 +1185,40 @@ def process_directory(input_directory, output_directory):
 
     if not csv_files:
         print(f"No CSV files found in {input_directory}")
-        return
+        return {}
 
     print(f"Found {len(csv_files)} CSV files to process")
 
-    # Process each CSV file
-    for idx, csv_file in enumerate(csv_files, 1):
-        try:
-            start_time = time.time()
+    jobs = [(csv_file,
+             os.path.join(input_directory, csv_file),
+             os.path.join(output_directory, os.path.splitext(csv_file)[0] + '.nc'))
+            for csv_file in csv_files]
+
+    if parallel:
+        results = _process_parallel(jobs, max_workers, memory_limit_mb, convert_kwargs)
+    else:
+        results = {}
 
-            input_path = os.path.join(input_directory, csv_file)
-            output_filename = os.path.splitext(csv_file)[0] + '.nc'
-            output_path = os.path.join(output_directory, output_filename)
+        # Process each CSV file
+        for idx, (csv_file, input_path, output_path) in enumerate(jobs, 1):
+            try:
+                print(f"\nProcessing file {idx}/{len(csv_files)}: {csv_file}")
+                processing_time = _convert_file(input_path, output_path, convert_kwargs)
+                results[csv_file] = {'seconds': processing_time, 'error': None}
+                print(f"Processing time: {processing_time:.2f} seconds")
 
-            print(f"\nProcessing file {idx}/{len(csv_files)}: {csv_file}")
-            memory_efficient_csv_to_netcdf(input_path, output_path)
+            except Exception as e:
+                results[csv_file] = {'seconds': None, 'error': str(e)}
+                print(f"Error processing {csv_file}: {str(e)}")
+                continue
 
-            end_time = time.time()
-            processing_time = end_time - start_time
-            print(f"Processing time: {processing_time:.2f} seconds")
+    print("\nPer-file summary:")
+    for csv_file in csv_files:
+        result = results[csv_file]
+        status = f"{result['seconds']:.2f} seconds" if result['error'] is None else f"FAILED ({result['error']})"
+        print(f"{csv_file}: {status}")
 
-        except Exception as e:
-            print(f"Error processing {csv_file}: {str(e)}")
-            continue
+    return results
 
 
 if __name__ == "__main__":
@@ -0,0 +1,217 @@
+import os
+import numpy as np
+import pandas as pd
+from netCDF4 import Dataset
+
+from sparse_storage import open_link_dataset
+
+
+LINK_INDEX_SUFFIX = '.links.csv'
+INDEX_COLUMNS = ['link', 'column', 'first_valid', 'last_valid', 'valid_count', 'rx_min', 'rx_max', 'tx_min', 'tx_max']
+
+
+def link_index_path(netcdf_path):
+    """Path of the sidecar link index of a NetCDF file"""
+    return netcdf_path + LINK_INDEX_SUFFIX
+
+
+class LinkIndexBuilder:
+    """
+    Accumulates the per-link summary of a (time, link) file block by block.
+
+    Blocks may cover any time range and any run of consecutive links, in any
+    order, so the writers can feed the tiles, slabs or link blocks they already
+    hold in memory. A valid sample is a time step where RxLevel or TxLevel holds
+    a reading.
+    """
+
+    def __init__(self, times, links):
+        """
+        Args:
+            times (np.ndarray): Time axis of the file as datetime64 values
+            links (np.ndarray): Link axis of the file
+        """
+        self.times = np.asarray(times).astype('datetime64[ns]')
+        self.links = np.asarray(links)
+        n_links = len(self.links)
+
+        self.first = np.full(n_links, len(self.times), dtype=np.int64)
+        self.last = np.full(n_links, -1, dtype=np.int64)
+        self.count = np.zeros(n_links, dtype=np.int64)
+        self.extremes = {name: np.full(n_links, np.nan) for name in ('rx_min', 'rx_max', 'tx_min', 'tx_max')}
+
+    def add(self, time_start, link_start, rx, tx):
+        """
+        Fold one (time, link) block into the summary
+
+        Args:
+            time_start (int): Position of the first row of the block on the time axis
+            link_start (int): Position of the first column of the block on the link axis
+            rx (np.ndarray): RxLevel block, NaN where missing
+            tx (np.ndarray): TxLevel block with the same shape
+        """
+        if rx.size == 0:
+            return
+        columns = slice(link_start, link_start + rx.shape[1])
+        observed = ~(np.isnan(rx) & np.isnan(tx))
+        any_observed = observed.any(axis=0)
+
+        first = time_start + np.argmax(observed, axis=0)
+        last = time_start + rx.shape[0] - 1 - np.argmax(observed[::-1], axis=0)
+        self.first[columns] = np.where(any_observed, np.minimum(self.first[columns], first), self.first[columns])
+        self.last[columns] = np.where(any_observed, np.maximum(self.last[columns], last), self.last[columns])
+        self.count[columns] += observed.sum(axis=0)
+
+        # fmin/fmax skip NaN, so links without readings keep NaN extremes
+        for name, values, reduce in [('rx_min', rx, np.fmin), ('rx_max', rx, np.fmax),
+                                     ('tx_min', tx, np.fmin), ('tx_max', tx, np.fmax)]:
+            self.extremes[name][columns] = reduce(self.extremes[name][columns], reduce.reduce(values, axis=0))
+
+    def to_frame(self):
+        """The summary as a table with one row per link, in link-axis order"""
+        valid = self.count > 0
+        first = np.full(len(self.links), np.datetime64('NaT'), dtype='datetime64[ns]')
+        last = first.copy()
+        first[valid] = self.times[self.first[valid]]
+        last[valid] = self.times[self.last[valid]]
+
+        return pd.DataFrame({
+            'link': self.links,
+            'column': np.arange(len(self.links)),
+            'first_valid': first,
+            'last_valid': last,
+            'valid_count': self.count,
+            **self.extremes
+        }, columns=INDEX_COLUMNS)
+
+    def write(self, netcdf_path):
+        """Write the summary as the sidecar index of netcdf_path and return it"""
+        return write_link_index(netcdf_path, self.to_frame())
+
+
+def write_link_index(netcdf_path, index):
+    """
+    Write a link index table next to its NetCDF file
+
+    Args:
+        netcdf_path (str): The NetCDF file the index describes
+        index (pd.DataFrame): Table with INDEX_COLUMNS
+
+    Returns:
+        pd.DataFrame: The index
+    """
+    index.to_csv(link_index_path(netcdf_path), index=False, date_format='%Y-%m-%dT%H:%M:%S')
+    print(f"Link index written to {link_index_path(netcdf_path)}")
+    return index
+
+
+def _read_index_file(netcdf_path):
+    """Read the sidecar as written, with link ids typed like the link axis of the NetCDF file"""
+    index = pd.read_csv(link_index_path(netcdf_path), dtype={'link': str}, parse_dates=['first_valid', 'last_valid'])
+    with Dataset(netcdf_path, 'r') as nc:
+        if nc['link'].dtype != str:
+            index['link'] = index['link'].astype(np.int64)
+    return index
+
+
+def load_link_index(netcdf_path):
+    """
+    Load the sidecar link index of a NetCDF file without touching its data variables.
+
+    Args:
+        netcdf_path (str): The NetCDF file
+
+    Returns:
+        pd.DataFrame: Table with INDEX_COLUMNS, or None if there is no index or the
+            NetCDF file changed after the index was written
+    """
+    sidecar = link_index_path(netcdf_path)
+    if not os.path.exists(sidecar) or os.path.getmtime(sidecar) < os.path.getmtime(netcdf_path):
+        return None
+    return _read_index_file(netcdf_path)
+
+
+def file_links(netcdf_path, ds=None):
+    """
+    Link axis of a NetCDF file, from its sidecar index when there is one.
+
+    Args:
+        netcdf_path (str): The NetCDF file
+        ds (xr.Dataset): The file already opened with open_link_dataset, or None to open it
+            only when there is no index
+
+    Returns:
+        np.ndarray: Link ids in link-axis order
+    """
+    link_index = load_link_index(netcdf_path)
+    if link_index is not None:
+        return link_index['link'].values
+    if ds is not None:
+        return ds.link.values
+    with open_link_dataset(netcdf_path) as ds:
+        return ds.link.values
+
+
+def build_link_index(netcdf_path, columns=None, memory_budget_mb=256):
+    """
+    Build (or refresh) the sidecar index by scanning a NetCDF file in blocks of whole links.
+
+    Args:
+        netcdf_path (str): Dense or ragged link NetCDF file
+        columns (array-like, optional): Link positions to refresh in an existing index;
+            the whole file is scanned when there is no index or columns is None
+        memory_budget_mb (float): Upper bound for the link blocks held in memory
+
+    Returns:
+        pd.DataFrame: The written index
+    """
+    existing = _read_index_file(netcdf_path) if os.path.exists(link_index_path(netcdf_path)) else None
+
+    with open_link_dataset(netcdf_path) as ds:
+        links = ds.link.values
+        builder = LinkIndexBuilder(ds.time.values, links)
+
+        if columns is None or existing is None:
+            columns = np.arange(len(links))
+        else:
+            # Links the index does not know yet are always scanned
+            columns = np.union1d(np.asarray(columns, dtype=np.int64), np.arange(len(existing), len(links)))
+
+        block_links = max(1, int(memory_budget_mb * 1024 ** 2) // (16 * max(1, len(ds.time))))
+        for start in range(0, len(columns), block_links):
+            block = columns[start:start + block_links]
+            rx = ds['RxLevel'].isel(link=block).values.astype(np.float64)
+            tx = ds['TxLevel'].isel(link=block).values.astype(np.float64)
+            # Feed the block column by column run so scattered positions land in place
+            runs = np.split(np.arange(len(block)), np.flatnonzero(np.diff(block) != 1) + 1)
+            for run in runs:
+                builder.add(0, int(block[run[0]]), rx[:, run], tx[:, run])
+
+    index = builder.to_frame()
+    if existing is not None and len(columns) < len(links):
+        untouched = np.setdiff1d(np.arange(len(links)), columns)
+        index.loc[untouched, INDEX_COLUMNS[2:]] = existing.loc[untouched, INDEX_COLUMNS[2:]].values
+        index = index.astype({'valid_count': np.int64})
+
+    return write_link_index(netcdf_path, index)
+
+
+def links_covering(index, start=None, end=None, min_count=1):
+    """
+    Links with readings inside a period, answered from the index alone.
+
+    Args:
+        index (pd.DataFrame): Link index, see load_link_index
+        start (str or datetime, optional): Start of the period, open if None
+        end (str or datetime, optional): End of the period, open if None
+        min_count (int): Minimum number of valid samples of the link over the whole file
+
+    Returns:
+        np.ndarray: Link ids whose first/last valid timestamps overlap the period
+    """
+    keep = index['valid_count'] >= min_count
+    if start is not None:
+        keep &= index['last_valid'] >= pd.Timestamp(start)
+    if end is not None:
+        keep &= index['first_valid'] <= pd.Timestamp(end)
+    return index.loc[keep, 'link'].values
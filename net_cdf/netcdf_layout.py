@@ -0,0 +1,205 @@
+import numpy as np
+from datetime import datetime
+from netCDF4 import Dataset
+
+
+LAYOUTS = ('per_link', 'per_time', 'balanced')
+MAX_CHUNK_BYTES = 4 * 1024 ** 2  # Upper bound for one HDF5 chunk of a (time, link) variable
+BALANCED_CHUNKSIZES = (256, 64)
+TIME_UNITS = 'seconds since 1970-01-01 00:00:00'
+
+PACKINGS = (None, 'float32', 'int16')
+INT16_SCALE_FACTOR = 0.1  # RxLevel/TxLevel readings carry at most 0.1 dB resolution
+INT16_FILL_VALUE = -32767
+
+
+def packing_spec(packing=None):
+    """
+    On-disk type of RxLevel/TxLevel.
+
+    Packings:
+        None      - float64, NaN as fill value
+        'float32' - float32, NaN as fill value
+        'int16'   - CF packed int16 with scale_factor 0.1 and an integer _FillValue,
+                    covering -3276.6 to 3276.7 dB in 0.1 dB steps
+
+    Readers going through xarray or netCDF4 unpack the values transparently.
+
+    Args:
+        packing (str, optional): One of PACKINGS
+
+    Returns:
+        dict: 'dtype', 'fill_value' and the CF packing attributes under 'attrs'
+    """
+    if packing not in PACKINGS:
+        raise ValueError(f"Unknown packing '{packing}', expected one of {PACKINGS}")
+
+    if packing == 'int16':
+        return {'dtype': np.dtype('i2'), 'fill_value': np.int16(INT16_FILL_VALUE),
+                'attrs': {'scale_factor': INT16_SCALE_FACTOR, 'add_offset': 0.0}}
+    if packing == 'float32':
+        return {'dtype': np.dtype('f4'), 'fill_value': np.float32(np.nan), 'attrs': {}}
+    return {'dtype': np.dtype('f8'), 'fill_value': np.nan, 'attrs': {}}
+
+
+def chunk_shape(n_times, n_links, layout='per_link', itemsize=8, time_chunk=None):
+    """
+    HDF5 chunk shape of a (time, link) variable for a given read pattern.
+
+    Layouts:
+        'per_link' - a long time extent of a single link, so reading one link's
+                     series decompresses one (or a few) contiguous chunks
+        'per_time' - a short time extent across all links, for network-wide snapshots
+        'balanced' - a fixed square-ish tile, used for growable files
+
+    Args:
+        n_times (int): Length of the time dimension
+        n_links (int): Length of the link dimension
+        layout (str): One of LAYOUTS
+        itemsize (int): Size in bytes of one stored value
+        time_chunk (int, optional): Time extent of a chunk, overrides the layout default
+
+    Returns:
+        Tuple[int, int]: Chunk extent along (time, link)
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+
+    n_times = max(1, n_times)
+    n_links = max(1, n_links)
+
+    if layout == 'per_link':
+        time_chunk = time_chunk or MAX_CHUNK_BYTES // itemsize
+        return min(n_times, time_chunk), 1
+
+    if layout == 'per_time':
+        link_chunk = min(n_links, MAX_CHUNK_BYTES // itemsize)
+        time_chunk = time_chunk or max(1, MAX_CHUNK_BYTES // (itemsize * link_chunk * 16))
+        return min(n_times, time_chunk), link_chunk
+
+    return min(n_times, time_chunk or BALANCED_CHUNKSIZES[0]), min(n_links, BALANCED_CHUNKSIZES[1])
+
+
+def variable_storage(n_times, n_links, layout='per_link', compression_level=4, itemsize=8, time_chunk=None):
+    """
+    Storage settings of a (time, link) variable.
+
+    The returned keys are understood both by netCDF4.Dataset.createVariable and
+    by the netcdf4 engine of xarray's to_netcdf encoding.
+
+    Args:
+        n_times (int): Length of the time dimension
+        n_links (int): Length of the link dimension
+        layout (str): One of LAYOUTS
+        compression_level (int): zlib level 1-9, 0 disables compression
+        itemsize (int): Size in bytes of one stored value
+        time_chunk (int, optional): Time extent of a chunk
+
+    Returns:
+        dict: chunksizes plus zlib/complevel/shuffle when compression is enabled
+    """
+    storage = {'chunksizes': chunk_shape(n_times, n_links, layout, itemsize=itemsize, time_chunk=time_chunk)}
+    if compression_level:
+        storage.update(zlib=True, complevel=int(compression_level), shuffle=True)
+    return storage
+
+
+def xarray_encoding(ds, variables=('RxLevel', 'TxLevel'), layout='per_link', compression_level=4, time_chunk=None,
+                    packing=None):
+    """
+    to_netcdf encoding applying variable_storage and packing_spec to the (time, link) variables of a dataset
+
+    Args:
+        ds (xr.Dataset): Dataset about to be written
+        variables (tuple): Names of the (time, link) variables
+        layout (str): One of LAYOUTS
+        compression_level (int): zlib level 1-9, 0 disables compression
+        time_chunk (int, optional): Time extent of a chunk
+        packing (str, optional): One of PACKINGS, None keeps the in-memory dtype
+
+    Returns:
+        dict: Encoding per variable
+    """
+    encoding = {}
+    for name in variables:
+        if name not in ds:
+            continue
+        if packing is None:
+            itemsize = np.dtype(ds[name].dtype).itemsize
+            packed = {}
+        else:
+            spec = packing_spec(packing)
+            itemsize = spec['dtype'].itemsize
+            packed = {'dtype': spec['dtype'], '_FillValue': spec['fill_value'], **spec['attrs']}
+        encoding[name] = {**variable_storage(ds.sizes['time'], ds.sizes['link'], layout, compression_level,
+                                             itemsize=itemsize, time_chunk=time_chunk), **packed}
+    return encoding
+
+
+def data_storage(n_times, n_links, layout, compression_level, time_chunk=None, packing=None):
+    """
+    createVariable settings of RxLevel/TxLevel: on-disk type, fill value,
+    CF packing attributes and chunking/compression
+    """
+    spec = packing_spec(packing)
+    return {'datatype': spec['dtype'], 'fill_value': spec['fill_value'], 'attrs': spec['attrs'],
+            **variable_storage(n_times, n_links, layout, compression_level, itemsize=spec['dtype'].itemsize,
+                               time_chunk=time_chunk)}
+
+
+def create_link_netcdf(path, link_dtype, source_file, aux_variables=(), storage=None):
+    """
+    Create an empty NetCDF4 file whose time and link dimensions are both unlimited
+
+    Args:
+        path (str): File to create
+        link_dtype (type): str or np.int64, the type of the link labels
+        source_file (str): Name of the raw file, stored as a global attribute
+        aux_variables (iterable): (name, dtype) pairs of extra (time, link) variables
+        storage (dict, optional): Type, packing and chunking of RxLevel/TxLevel, see data_storage
+
+    Returns:
+        Dataset: The open netCDF4 dataset
+    """
+    nc = Dataset(path, 'w', format='NETCDF4')
+    nc.createDimension('time', None)
+    nc.createDimension('link', None)
+
+    time_var = nc.createVariable('time', 'i8', ('time',))
+    time_var.units = TIME_UNITS
+    time_var.calendar = 'proleptic_gregorian'
+    nc.createVariable('link', str if link_dtype is str else 'i8', ('link',))
+
+    storage = dict(storage or {'datatype': 'f8', 'fill_value': np.nan, 'attrs': {}, 'chunksizes': BALANCED_CHUNKSIZES})
+    datatype = storage.pop('datatype')
+    packing_attrs = storage.pop('attrs')
+
+    for name, long_name in [('RxLevel', 'Received Signal Level'), ('TxLevel', 'Transmitted Signal Level')]:
+        var = nc.createVariable(name, datatype, ('time', 'link'), **storage)
+        var.setncatts(packing_attrs)
+        var.units = 'dBm'
+        var.long_name = long_name
+
+    for name, dtype in aux_variables:
+        nc.createVariable(name, dtype, ('time', 'link'), fill_value=0, chunksizes=BALANCED_CHUNKSIZES)
+
+    nc.description = 'Radio link measurements'
+    nc.created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    nc.source_file = source_file
+    return nc
+
+
+def read_region(var, index):
+    """Read a region of a netCDF4 variable with missing values as NaN (data variables) or 0 (bookkeeping variables)"""
+    data = var[index]
+    if np.ma.isMaskedArray(data):
+        data = data.filled(np.nan if data.dtype.kind == 'f' else 0)
+    return data
+
+
+def write_region(var, index, data):
+    """Write a region of a netCDF4 variable, storing NaN as the fill value of packed integer variables"""
+    if var.dtype.kind in 'iu' and data.dtype.kind == 'f':
+        missing = np.isnan(data)
+        data = np.ma.masked_array(np.where(missing, 0, data), mask=missing)
+    var[index] = data
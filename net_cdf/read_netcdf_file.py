@@ -1,39 +1,44 @@
 from netCDF4 import Dataset, num2date
 import pandas as pd
 import numpy as np
+import xarray as xr
+import os
+import concurrent.futures
+
+from link_index import file_links, load_link_index
+from sparse_storage import open_link_dataset
 
 
 def print_link_data(nc_file_path, num_times=10, num_links=10):
     try:
-        nc_file = Dataset(nc_file_path, 'r')
-
-        time_data = nc_file.variables['time'][:num_times]
-        rx_data = nc_file.variables['RxLevel'][:num_times, :num_links]
-        tx_data = nc_file.variables['TxLevel'][:num_times, :num_links]
+        # Dense and ragged files alike; packed storage is unpacked and missing values are NaN
+        with open_link_dataset(nc_file_path) as ds:
+            n_times, n_links = min(num_times, ds.sizes['time']), min(num_links, ds.sizes['link'])
+            window = select_window(ds, 0, n_times, np.arange(n_links)).load()
 
-        # Create a list to store formatted data
-        rows = []
-        for t in range(num_times):
-            for l in range(num_links):
-                rows.append({
-                    'Time': time_data[t],
-                    'Link': l,
-                    'RxLevel': rx_data[t, l],
-                    'TxLevel': tx_data[t, l]
-                })
-
-        df = pd.DataFrame(rows)
+        # One row per (time, link) cell, in time-major order
+        df = pd.DataFrame({
+            'Time': np.repeat(window.time.values, n_links),
+            'Link': np.tile(np.arange(n_links), n_times),
+            'RxLevel': window['RxLevel'].values.ravel(),
+            'TxLevel': window['TxLevel'].values.ravel()
+        })
 
         print("\nFirst few rows of data:")
         print(df)
 
-        nc_file.close()
-
     except Exception as e:
         print(f"Error processing NetCDF file: {str(e)}")
 
 
 def print_link_names(nc_file_path):
+    # The sidecar link index answers this without reading the file
+    link_index = load_link_index(nc_file_path)
+    if link_index is not None:
+        print(f"\nTotal number of links: {len(link_index)}")
+        print(link_index.to_string(index=False))
+        return
+
     try:
         nc_file = Dataset(nc_file_path, 'r')
 
@@ -100,10 +105,230 @@ def get_netcdf_time_range(file_path):
         print(f"Error reading NetCDF file: {str(e)}")
 
 
+def link_positions(links, link_ids):
+    """
+    Positions of the requested link ids on a link axis
+
+    Ids are compared with the type of the axis, so '8394' finds link 8394 on an
+    integer axis. A label repeated on the axis returns all of its positions.
+    """
+    requested = np.atleast_1d(np.asarray(link_ids, dtype=object))
+    if np.issubdtype(np.asarray(links).dtype, np.integer):
+        requested = np.array([int(link) for link in requested], dtype=np.int64)
+    else:
+        requested = requested.astype(str)
+
+    axis = pd.Index(links)
+    positions = axis.get_indexer_for(requested)
+    if (positions < 0).any():
+        missing = [link for link in requested.tolist() if link not in axis]
+        raise KeyError(f"Links not found in the file: {missing}")
+    return positions
+
+
+def time_window(times, t_start=None, t_end=None):
+    """
+    Positions of [t_start, t_end] on a sorted time axis, found by binary search
+
+    Returns:
+        Tuple[int, int]: First position and the position after the last one
+    """
+    time_start = 0 if t_start is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(t_start)), 'left'))
+    time_stop = len(times) if t_end is None else int(np.searchsorted(times, np.datetime64(pd.Timestamp(t_end)), 'right'))
+    return time_start, max(time_start, time_stop)
+
+
+def select_window(ds, time_start, time_stop, positions):
+    """
+    (time range, links) window of an open dataset from open_link_dataset
+
+    Dense datasets return a lazy xarray view; ragged datasets read the
+    observations of the window right away.
+
+    Args:
+        ds: Dataset returned by open_link_dataset
+        time_start (int): First position on the time axis
+        time_stop (int): Position after the last one on the time axis
+        positions (np.ndarray): Positions on the link axis
+
+    Returns:
+        xr.Dataset: RxLevel and TxLevel over the window
+    """
+    if isinstance(ds, xr.Dataset):
+        return ds[['RxLevel', 'TxLevel']].isel(time=slice(time_start, time_stop), link=positions)
+    return xr.Dataset(
+        {name: (['time', 'link'], ds.read_window(name, time_start, time_stop, positions),
+                ds[name].attrs) for name in ('RxLevel', 'TxLevel')},
+        coords={'time': ds.time.values[time_start:time_stop], 'link': ds.link.values[positions]},
+        attrs=ds.attrs
+    )
+
+
+def read_link_window(nc_file_path, t_start=None, t_end=None, link_ids=None):
+    """
+    Read a time window of some links without loading the rest of the file.
+
+    The time coordinate is binary-searched for the window, so only the
+    (time range, links) hyperslab is read: lazily for dense files (xarray reads
+    it on first access to .values), and observation by observation for ragged
+    files. Link positions come from the sidecar link index when there is one.
+
+    Args:
+        nc_file_path (str): Dense or ragged link NetCDF file
+        t_start (str or datetime, optional): First timestamp of the window (inclusive), open if None
+        t_end (str or datetime, optional): Last timestamp of the window (inclusive), open if None
+        link_ids (optional): One link id, a list of ids, or None for all links; a single id
+            drops the link dimension like .sel(link=...)
+
+    Returns:
+        xr.Dataset: RxLevel and TxLevel over the window
+    """
+    ds = open_link_dataset(nc_file_path)
+    time_start, time_stop = time_window(ds.time.values, t_start, t_end)
+
+    links = file_links(nc_file_path, ds)
+    positions = np.arange(len(links)) if link_ids is None else link_positions(links, link_ids)
+
+    window = select_window(ds, time_start, time_stop, positions)
+    if not isinstance(ds, xr.Dataset):
+        ds.close()
+
+    if link_ids is not None and np.ndim(link_ids) == 0 and len(positions) == 1:
+        window = window.isel(link=0)
+    return window
+
+
+def _block_statistics(times, rx, tx):
+    """
+    Per-link statistics of one (time, link) block spanning the whole (non-empty) time axis
+
+    Args:
+        times (np.ndarray): Time axis as datetime64 values
+        rx (np.ndarray): RxLevel block, NaN where missing
+        tx (np.ndarray): TxLevel block with the same shape
+
+    Returns:
+        dict: Column name -> one value per link of the block
+    """
+    n_times, n_links = rx.shape
+    observed = ~(np.isnan(rx) & np.isnan(tx))
+    valid_count = observed.sum(axis=0)
+    stats = {
+        'valid_count': valid_count,
+        'coverage': valid_count / n_times,
+        'rx_nan_fraction': np.isnan(rx).mean(axis=0),
+        'tx_nan_fraction': np.isnan(tx).mean(axis=0),
+    }
+    for prefix, values in [('rx', rx), ('tx', tx)]:
+        count = (~np.isnan(values)).sum(axis=0)
+        stats[f'{prefix}_min'] = np.fmin.reduce(values, axis=0)
+        stats[f'{prefix}_max'] = np.fmax.reduce(values, axis=0)
+        stats[f'{prefix}_mean'] = np.where(count > 0, np.nansum(values, axis=0) / np.maximum(count, 1), np.nan)
+
+    # Gaps: missing steps between two valid samples of the same link
+    link_pos, time_pos = np.nonzero(observed.T)
+    step = np.diff(time_pos)
+    inside = (np.diff(link_pos) == 0) & (step > 1)
+    gap_links = link_pos[1:][inside]
+    gap_duration = (times[time_pos[1:][inside]] - times[time_pos[:-1][inside]]).astype('timedelta64[s]').astype(np.int64)
+
+    stats['n_gaps'] = np.bincount(gap_links, minlength=n_links)
+    longest = np.zeros(n_links, dtype=np.int64)
+    np.maximum.at(longest, gap_links, gap_duration)
+    stats['longest_gap'] = pd.to_timedelta(longest, unit='s')
+
+    has_data = valid_count > 0
+    stats['first_valid'] = np.full(n_links, np.datetime64('NaT'), dtype=times.dtype)
+    stats['last_valid'] = stats['first_valid'].copy()
+    stats['first_valid'][has_data] = times[np.argmax(observed, axis=0)[has_data]]
+    stats['last_valid'][has_data] = times[n_times - 1 - np.argmax(observed[::-1], axis=0)[has_data]]
+    return stats
+
+
+def _inspect_link_block(nc_file_path, start, stop):
+    """Worker entry point: read links [start, stop) of a file and return their statistics"""
+    with open_link_dataset(nc_file_path) as ds:
+        columns = np.arange(start, stop)
+        times = ds.time.values
+        rx = ds['RxLevel'].isel(link=columns).values.astype(np.float64)
+        tx = ds['TxLevel'].isel(link=columns).values.astype(np.float64)
+    return start, _block_statistics(times, rx, tx)
+
+
+def _time_axis_summary(times):
+    """Cadence and gaps of the time axis itself"""
+    summary = {'n_times': len(times), 'start': times[0] if len(times) else None,
+               'end': times[-1] if len(times) else None}
+    steps = np.diff(times).astype('timedelta64[s]').astype(np.int64)
+    if len(steps):
+        cadence = int(np.median(steps))
+        summary['cadence'] = pd.to_timedelta(cadence, unit='s')
+        summary['irregular_steps'] = int((steps != cadence).sum())
+        summary['time_gaps'] = int((steps > cadence).sum())
+        summary['largest_time_gap'] = pd.to_timedelta(int(steps.max()), unit='s')
+    return summary
+
+
+def inspect_netcdf(nc_file_path, memory_budget_mb=256, max_workers=None):
+    """
+    Validate a link NetCDF file: per-link coverage, NaN fractions, value ranges and
+    gaps, plus the cadence and gaps of the time axis.
+
+    The file is reduced in blocks of whole links, so only one block (bounded by
+    memory_budget_mb) is held in memory per worker. Dense and ragged files are
+    both supported.
+
+    Args:
+        nc_file_path (str): Path to the NetCDF file
+        memory_budget_mb (float): Upper bound for one link block
+        max_workers (int, optional): Reduce the link blocks on a process pool of this size;
+            None or 1 reduces them in this process
+
+    Returns:
+        Tuple[dict, pd.DataFrame]: File summary and one row of statistics per link
+    """
+    with open_link_dataset(nc_file_path) as ds:
+        times = ds.time.values
+        links = ds.link.values
+
+    # RxLevel and TxLevel are read as float64, plus the boolean masks
+    block_links = max(1, int(memory_budget_mb * 1024 ** 2) // (20 * max(1, len(times))))
+    blocks = [(start, min(start + block_links, len(links))) for start in range(0, len(links), block_links)
+              if len(times)]
+    print(f"Inspecting {len(links)} links x {len(times)} time steps in {len(blocks)} block(s)...")
+
+    if max_workers and max_workers > 1 and len(blocks) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+            starts, stops = zip(*blocks)
+            results = list(executor.map(_inspect_link_block, [nc_file_path] * len(blocks), starts, stops))
+    else:
+        results = [_inspect_link_block(nc_file_path, start, stop) for start, stop in blocks]
+
+    results.sort(key=lambda result: result[0])
+    link_stats = pd.DataFrame({'link': links, 'valid_count': np.zeros(len(links), dtype=np.int64)})
+    if results:
+        for name in results[0][1]:
+            link_stats[name] = np.concatenate([np.asarray(stats[name]) for _, stats in results])
+
+    summary = _time_axis_summary(times)
+    summary['n_links'] = len(links)
+    summary['coverage'] = float(link_stats['valid_count'].sum() / max(1, len(times) * len(links)))
+    summary['empty_links'] = int((link_stats['valid_count'] == 0).sum())
+
+    print(f"\nFile: {os.path.basename(nc_file_path)}")
+    for name, value in summary.items():
+        print(f"{name}: {value}")
+    if len(links) and len(times):
+        print("\nLeast covered links:")
+        print(link_stats.sort_values('coverage').head(10).to_string(index=False))
+
+    return summary, link_stats
 
-#get_netcdf_time_range(r"D:\final_project\analysis_files\filtered_netcdf.nc")
 
+if __name__ == "__main__":
+    #get_netcdf_time_range(r"D:\final_project\analysis_files\filtered_netcdf.nc")
 
-print_link_names(r"D:\final_project\analysis_files\filtered_netcdf.nc")
-# Usage
-#print_link_data(r"D:\final_project\analysis_files\filtered_netcdf.nc")
+    print_link_names(r"D:\final_project\analysis_files\filtered_netcdf.nc")
+    # Usage
+    #print_link_data(r"D:\final_project\analysis_files\filtered_netcdf.nc")
+    #inspect_netcdf(r"D:\final_project\analysis_files\filtered_netcdf.nc", max_workers=4)
@@ -1,53 +1,279 @@
 import xarray as xr
 import numpy as np
 import pandas as pd
+import warnings
 
+from link_index import LinkIndexBuilder, load_link_index
+from netcdf_layout import create_link_netcdf, data_storage, write_region, xarray_encoding
+from sparse_storage import (SPARSE_DENSITY_THRESHOLD, RaggedLinkDataset, append_ragged_links, create_ragged_netcdf,
+                            open_link_dataset, use_sparse_layout, write_ragged_netcdf)
 
-def clean_netcdf(input_path: str, output_path: str):
+
+def _first_valid(stacked):
+    """First non-NaN value along the last axis (NaN if there is none)"""
+    first = np.argmax(~np.isnan(stacked), axis=-1)
+    return np.take_along_axis(stacked, first[..., np.newaxis], axis=-1)[..., 0]
+
+
+# Reducers of the (time, link, copy) stack of duplicated links, all NaN-ignoring
+LINK_REDUCERS = {
+    'mean': lambda stacked: np.nanmean(stacked, axis=-1),
+    'first_valid': _first_valid,
+    'max': lambda stacked: np.nanmax(stacked, axis=-1),
+    'median': lambda stacked: np.nanmedian(stacked, axis=-1),
+}
+
+
+def group_links(links):
+    """
+    Group the columns of a link axis by label.
+
+    Args:
+        links (np.ndarray): Link labels, possibly repeated
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: Group code of every column, and the unique
+            labels in order of first appearance (stable across runs)
+    """
+    codes, unique_links = pd.factorize(np.asarray(links))
+    return codes, np.asarray(unique_links)
+
+
+def merge_duplicate_links(values, codes, n_groups, reducer='mean'):
+    """
+    Merge the columns of duplicated links in one vectorized pass.
+
+    Columns of links that appear once are copied as they are. The columns of
+    duplicated links are stacked into a (time, group, copy) array padded with
+    NaN and reduced along the copy axis.
+
+    Args:
+        values (np.ndarray): (time, link) values
+        codes (np.ndarray): Group code of every column, see group_links
+        n_groups (int): Number of unique links
+        reducer (str): One of LINK_REDUCERS
+
+    Returns:
+        np.ndarray: (time, n_groups) merged values
+    """
+    if reducer not in LINK_REDUCERS:
+        raise ValueError(f"Unknown reducer '{reducer}', expected one of {tuple(LINK_REDUCERS)}")
+
+    counts = np.bincount(codes, minlength=n_groups)
+    merged = np.full((values.shape[0], n_groups), np.nan, dtype=values.dtype)
+
+    single = counts[codes] == 1
+    merged[:, codes[single]] = values[:, single]
+
+    duplicated_groups = np.flatnonzero(counts > 1)
+    if len(duplicated_groups):
+        # Columns of duplicated links, ordered by group and by position within the group
+        columns = np.flatnonzero(~single)
+        columns = columns[np.argsort(codes[columns], kind='stable')]
+        sorted_codes = codes[columns]
+        copy = np.arange(len(columns)) - np.searchsorted(sorted_codes, sorted_codes)
+        group = np.searchsorted(duplicated_groups, sorted_codes)
+
+        stacked = np.full((values.shape[0], len(duplicated_groups), counts.max()), np.nan, dtype=values.dtype)
+        stacked[:, group, copy] = values[:, columns]
+
+        # Time steps where every copy is NaN stay NaN without a warning
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', RuntimeWarning)
+            merged[:, duplicated_groups] = LINK_REDUCERS[reducer](stacked)
+
+    return merged
+
+
+def _link_blocks(codes, n_groups, max_columns):
+    """Consecutive ranges of link groups whose columns together stay within max_columns (at least one group each)"""
+    ends = np.cumsum(np.bincount(codes, minlength=n_groups))
+    start = 0
+    while start < n_groups:
+        done = ends[start - 1] if start else 0
+        stop = min(n_groups, max(start + 1, int(np.searchsorted(ends, done + max_columns, side='right'))))
+        yield start, stop
+        start = stop
+
+
+def _chunk_passes(chunksizes, n_links, slab_rows, block_columns):
+    """
+    How many times every HDF5 chunk of a (time, link) variable is touched when it
+    is processed in time slabs of slab_rows and in link blocks of block_columns
+
+    Args:
+        chunksizes (tuple): Chunk shape, None for contiguous (row-major) storage
+
+    Returns:
+        Tuple[float, float]: Passes per chunk for time slabs and for link blocks
+    """
+    chunk_times, chunk_links = chunksizes if chunksizes is not None else (1, n_links)
+    return max(1.0, chunk_times / slab_rows), max(1.0, chunk_links / block_columns)
+
+
+def _observed_cells(input_path, ds, chunk_size, block_columns, by_link):
+    """Number of (time, link) cells of a dense input with a reading, from its link index or a counting pass"""
+    link_index = load_link_index(input_path)
+    if link_index is not None and len(link_index) == len(ds.link):
+        return int(link_index['valid_count'].sum())
+
+    print("No link index, counting observed cells...")
+    n_times, n_links = len(ds.time), len(ds.link)
+    if by_link:
+        blocks = [{'link': slice(start, start + block_columns)} for start in range(0, n_links, block_columns)]
+    else:
+        blocks = [{'time': slice(start, start + chunk_size)} for start in range(0, n_times, chunk_size)]
+    return sum(int((~(np.isnan(ds['RxLevel'].isel(block).values) & np.isnan(ds['TxLevel'].isel(block).values))).sum())
+               for block in blocks)
+
+
+def _clean_netcdf_chunked(input_path, ds, output_path, codes, unique_links, chunk_size, layout, compression_level,
+                          packing, storage_mode, sparse_threshold, reducer, index_builder):
+    """
+    Out-of-core body of clean_netcdf, writing the cleaned file one bounded block at a time.
+
+    The file is processed either in time slabs of chunk_size time steps or in
+    blocks of whole links holding about as many cells as a slab, whichever
+    decompresses the input chunks and rewrites the output chunks fewer times:
+    per-link chunks spanning the time axis are read and written in link blocks,
+    per-time chunks in slabs. When either side uses the ragged layout (stored
+    link after link) link blocks are always used. 'auto' decides the output layout
+    by the density of the input: the observation count of a ragged input, or the
+    link index (or a counting pass) of a dense one.
+
+    Returns:
+        Tuple[int, int, int]: RxLevel missing, TxLevel missing and total points of the output
+    """
+    n_times = len(ds.time)
+    n_groups = len(unique_links)
+    ragged_input = isinstance(ds, RaggedLinkDataset)
+    block_columns = max(1, chunk_size * len(codes) // max(1, n_times))
+
+    input_slabs, input_blocks = (None, None) if ragged_input else _chunk_passes(
+        ds['RxLevel'].encoding.get('chunksizes'), len(ds.link), chunk_size, block_columns)
+    if ragged_input:
+        density = ds.n_obs / max(1, n_times * len(ds.link))
+    elif storage_mode == 'auto':
+        observed = _observed_cells(input_path, ds, chunk_size, block_columns, input_blocks < input_slabs)
+        density = observed / max(1, n_times * len(ds.link))
+    else:
+        density = None
+    sparse = use_sparse_layout(density, storage_mode, sparse_threshold)
+    if density is not None:
+        print(f"Input density: {density * 100:.1f}% - writing the {'sparse (ragged)' if sparse else 'dense'} layout")
+
+    seconds = ds.time.values.astype('datetime64[s]').astype(np.int64)
+    link_dtype = np.int64 if np.issubdtype(unique_links.dtype, np.integer) else str
+    if sparse:
+        by_link = True
+        nc = create_ragged_netcdf(output_path, seconds, unique_links, link_dtype,
+                                  compression_level=compression_level, packing=packing)
+    else:
+        storage = data_storage(n_times, n_groups, layout, compression_level, packing=packing)
+        output_slabs, output_blocks = _chunk_passes(storage['chunksizes'], n_groups, chunk_size, block_columns)
+        by_link = ragged_input or input_blocks + output_blocks < input_slabs + output_slabs
+        nc = create_link_netcdf(output_path, link_dtype, ds.attrs.get('source_file', ''), storage=storage)
+        nc['time'][:] = seconds
+        nc['link'][:] = np.array(unique_links, dtype=object if link_dtype is str else np.int64)
+
+    work_dtype = np.float64 if packing is None else np.float32
+    rx_missing = tx_missing = 0
+    try:
+        for name, value in ds.attrs.items():
+            if name != 'storage_layout':
+                nc.setncattr(name, value)
+
+        if by_link:
+            blocks = [(np.s_[:], np.flatnonzero((codes >= start) & (codes < stop)), start, stop)
+                      for start, stop in _link_blocks(codes, n_groups, block_columns)]
+        else:
+            blocks = [(np.s_[start:min(n_times, start + chunk_size)], np.s_[:], 0, n_groups)
+                      for start in range(0, n_times, chunk_size)]
+
+        print(f"Cleaning in {len(blocks)} {'link blocks' if by_link else 'time slabs'}...")
+        for time_slice, columns, group_start, group_stop in blocks:
+            block_codes = codes[columns] - group_start
+            merged = []
+            for name in ['RxLevel', 'TxLevel']:
+                block = ds[name].isel(link=columns) if by_link else ds[name].isel(time=time_slice)
+                merged.append(merge_duplicate_links(block.values.astype(work_dtype), block_codes,
+                                                    group_stop - group_start, reducer))
+            rx, tx = merged
+            index_builder.add(time_slice.start or 0, group_start, rx, tx)
+
+            if sparse:
+                append_ragged_links(nc, group_start, rx, tx)
+            else:
+                write_region(nc['RxLevel'], (time_slice, np.s_[group_start:group_stop]), rx)
+                write_region(nc['TxLevel'], (time_slice, np.s_[group_start:group_stop]), tx)
+
+            # Completeness statistics are accumulated block by block
+            rx_missing += int(np.isnan(rx).sum())
+            tx_missing += int(np.isnan(tx).sum())
+    finally:
+        nc.close()
+
+    return rx_missing, tx_missing, n_times * n_groups
+
+
+def clean_netcdf(input_path: str, output_path: str, layout: str = 'per_link', compression_level: int = 4,
+                 packing: str = None, storage_mode: str = 'auto', sparse_threshold: float = SPARSE_DENSITY_THRESHOLD,
+                 reducer: str = 'mean', chunk_size: int = None):
     """
     Remove duplicate links from NetCDF file and save a cleaned version.
 
+    Columns sharing a link label are merged with the chosen reducer; the output
+    keeps the links in order of first appearance in the input.
+
+    By default the whole file is cleaned in memory. With chunk_size the input is
+    read, merged and written in bounded blocks instead, so peak memory follows
+    chunk_size rather than the file size.
+
     Args:
         input_path (str): Path to input NetCDF file
         output_path (str): Path where cleaned NetCDF will be saved
+        layout (str): HDF5 chunk layout of RxLevel/TxLevel, see netcdf_layout.LAYOUTS
+        compression_level (int): zlib level (with shuffle) of RxLevel/TxLevel, 0 disables compression
+        packing (str, optional): On-disk type of RxLevel/TxLevel - None (float64), 'float32' or
+            'int16' (CF scale_factor 0.1); packed output is also cleaned in float32 buffers
+        storage_mode (str): 'auto' (decide by density), 'dense' or 'sparse', see sparse_storage
+        sparse_threshold (float): Density below which 'auto' writes the ragged layout
+        reducer (str): How duplicated links are merged per time step, ignoring NaN -
+            'mean', 'first_valid', 'max' or 'median', see LINK_REDUCERS
+        chunk_size (int, optional): Time steps per block of the out-of-core mode; link blocks hold
+            about as many cells when the chunking of the files favours them
+
+    Returns:
+        xr.Dataset: The cleaned dataset (opened lazily from output_path in the out-of-core mode)
     """
-    # Load the dataset
+    if reducer not in LINK_REDUCERS:
+        raise ValueError(f"Unknown reducer '{reducer}', expected one of {tuple(LINK_REDUCERS)}")
+
+    # Load the dataset (dense or ragged)
     print("Loading NetCDF file...")
-    ds = xr.open_dataset(input_path)
+    ds = open_link_dataset(input_path)
 
-    # Get unique link IDs
-    unique_links = list(set(ds.link.values))
+    # Get unique link IDs, in order of first appearance
+    codes, unique_links = group_links(ds.link.values)
     print(f"Found {len(unique_links)} unique links out of {len(ds.link)} total")
 
-    # Initialize arrays for cleaned data
-    time_len = len(ds.time)
-    new_rx = np.full((time_len, len(unique_links)), np.nan)
-    new_tx = np.full((time_len, len(unique_links)), np.nan)
+    index_builder = LinkIndexBuilder(ds.time.values, unique_links)
 
-    # Process each unique link
-    for idx, link_id in enumerate(unique_links):
-        print(f"Processing link {link_id}...")
+    if chunk_size is not None:
+        print(f"Saving cleaned dataset to {output_path} in blocks of {chunk_size} time steps...")
+        rx_missing, tx_missing, total_points = _clean_netcdf_chunked(
+            input_path, ds, output_path, codes, unique_links, chunk_size, layout, compression_level, packing, storage_mode,
+            sparse_threshold, reducer, index_builder)
+        ds.close()
+        index_builder.write(output_path)
+        _print_summary(len(ds.link), len(unique_links), rx_missing, tx_missing, total_points)
+        return open_link_dataset(output_path)
 
-        # Get all occurrences of this link
-        link_data_rx = ds.RxLevel.sel(link=link_id)
-        link_data_tx = ds.TxLevel.sel(link=link_id)
-
-        if len(link_data_rx.shape) > 1:  # If there are duplicates
-            # Combine data from duplicates, taking non-NaN values
-            rx_combined = link_data_rx.values
-            tx_combined = link_data_tx.values
-
-            # For each timestep, take the first non-NaN value
-            for t in range(time_len):
-                rx_vals = rx_combined[t]
-                tx_vals = tx_combined[t]
-
-                new_rx[t, idx] = np.nanmean(rx_vals)  # Use mean of non-NaN values
-                new_tx[t, idx] = np.nanmean(tx_vals)  # Use mean of non-NaN values
-        else:
-            # If no duplicates, just copy the data
-            new_rx[:, idx] = link_data_rx.values
-            new_tx[:, idx] = link_data_tx.values
+    # Merge the duplicated links of both variables
+    print(f"Merging duplicate links ({reducer})...")
+    work_dtype = np.float64 if packing is None else np.float32
+    new_rx = merge_duplicate_links(ds.RxLevel.values.astype(work_dtype), codes, len(unique_links), reducer)
+    new_tx = merge_duplicate_links(ds.TxLevel.values.astype(work_dtype), codes, len(unique_links), reducer)
 
     # Create new dataset with cleaned data
     new_ds = xr.Dataset(
@@ -61,35 +287,46 @@ def clean_netcdf(input_path: str, output_path: str):
         }
     )
 
-    # Copy attributes if they exist
+    # Copy attributes if they exist; the layout marker of a ragged input is set by the ragged writer only
     if hasattr(ds, 'attrs'):
-        new_ds.attrs = ds.attrs
+        new_ds.attrs = {name: value for name, value in ds.attrs.items() if name != 'storage_layout'}
     if hasattr(ds.RxLevel, 'attrs'):
         new_ds.RxLevel.attrs = ds.RxLevel.attrs
     if hasattr(ds.TxLevel, 'attrs'):
         new_ds.TxLevel.attrs = ds.TxLevel.attrs
 
     # Save cleaned dataset
-    print(f"Saving cleaned dataset to {output_path}...")
-    new_ds.to_netcdf(output_path)
+    density = (~(np.isnan(new_rx) & np.isnan(new_tx))).mean() if new_rx.size else 0.0
+    if use_sparse_layout(density, storage_mode, sparse_threshold):
+        print(f"Saving cleaned dataset to {output_path} (sparse layout, {density * 100:.1f}% of cells observed)...")
+        write_ragged_netcdf(output_path, new_ds.time.values, new_ds.link.values, new_rx, new_tx, attrs=new_ds.attrs,
+                            compression_level=compression_level, packing=packing)
+    else:
+        print(f"Saving cleaned dataset to {output_path}...")
+        new_ds.to_netcdf(output_path, encoding=xarray_encoding(new_ds, layout=layout,
+                                                               compression_level=compression_level, packing=packing))
 
-    # Print summary
+    index_builder.add(0, 0, new_rx, new_tx)
+    index_builder.write(output_path)
+
+    _print_summary(len(ds.link), len(unique_links), np.isnan(new_rx).sum(), np.isnan(new_tx).sum(), new_rx.size)
+
+    return new_ds
+
+
+def _print_summary(n_links, n_unique, rx_missing, tx_missing, total_points):
+    """Print the cleaning summary and the data completeness of the output"""
     print("\nCleaning Summary:")
-    print(f"Original number of links: {len(ds.link)}")
-    print(f"Number of links after cleaning: {len(unique_links)}")
-    print(f"Number of duplicates removed: {len(ds.link) - len(unique_links)}")
+    print(f"Original number of links: {n_links}")
+    print(f"Number of links after cleaning: {n_unique}")
+    print(f"Number of duplicates removed: {n_links - n_unique}")
 
     # Verify data completeness
-    rx_missing = np.isnan(new_rx).sum()
-    tx_missing = np.isnan(new_tx).sum()
-    total_points = new_rx.size
-
+    total_points = max(1, total_points)
     print(f"\nData Completeness:")
     print(f"RxLevel missing values: {rx_missing} ({rx_missing / total_points * 100:.2f}%)")
     print(f"TxLevel missing values: {tx_missing} ({tx_missing / total_points * 100:.2f}%)")
 
-    return new_ds
-
 
 if __name__ == "__main__":
     input_file = r"D:\final_project\analysis_files\filtered_netcdf.nc"  # Your input file
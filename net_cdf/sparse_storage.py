@@ -0,0 +1,362 @@
+import numpy as np
+import pandas as pd
+import xarray as xr
+from netCDF4 import Dataset, num2date
+from datetime import datetime
+
+from netcdf_layout import TIME_UNITS, packing_spec, read_region, write_region
+
+
+SPARSE_DENSITY_THRESHOLD = 0.3  # Below this fraction of observed cells the ragged layout is smaller
+STORAGE_MODES = ('auto', 'dense', 'sparse')
+OBS_CHUNK = 2 ** 18  # HDF5 chunk length of the observation variables
+
+
+def use_sparse_layout(density, storage_mode='auto', threshold=SPARSE_DENSITY_THRESHOLD):
+    """
+    Decide between the dense (time, link) grid and the ragged layout.
+
+    Args:
+        density (float): Fraction of (time, link) cells holding a reading
+        storage_mode (str): 'auto' (decide by density), 'dense' or 'sparse'
+        threshold (float): Density below which 'auto' picks the ragged layout
+
+    Returns:
+        bool: True for the ragged layout
+    """
+    if storage_mode not in STORAGE_MODES:
+        raise ValueError(f"Unknown storage mode '{storage_mode}', expected one of {STORAGE_MODES}")
+    if storage_mode == 'auto':
+        return density < threshold
+    return storage_mode == 'sparse'
+
+
+def is_ragged(path):
+    """True if the NetCDF file uses the contiguous ragged layout written by this module"""
+    with Dataset(path, 'r') as nc:
+        return 'obs' in nc.dimensions and 'row_size' in nc.variables
+
+
+def create_ragged_netcdf(path, times, links, link_dtype, source_file='', compression_level=4, packing=None):
+    """
+    Create a NetCDF4 file storing (time, link) readings as per-link contiguous ragged arrays.
+
+    Layout:
+        time(time)       - full time axis, in TIME_UNITS
+        link(link)       - link labels
+        row_size(link)   - number of observations of every link (sample_dimension = "obs")
+        time_index(obs)  - position of every observation on the time axis
+        RxLevel(obs), TxLevel(obs)
+
+    Observations are stored link after link, in time order within a link, and
+    are added with append_ragged_links.
+
+    Args:
+        path (str): File to create
+        times (np.ndarray): Time axis as integer seconds since the epoch
+        links (np.ndarray): Link labels
+        link_dtype (type): str or np.int64, the type of the link labels
+        source_file (str): Name of the raw file, stored as a global attribute
+        compression_level (int): zlib level (with shuffle) of the observation variables
+        packing (str, optional): On-disk type of RxLevel/TxLevel, see netcdf_layout.packing_spec
+
+    Returns:
+        Dataset: The open netCDF4 dataset
+    """
+    nc = Dataset(path, 'w', format='NETCDF4')
+    nc.createDimension('time', len(times))
+    nc.createDimension('link', len(links))
+    nc.createDimension('obs', None)
+
+    time_var = nc.createVariable('time', 'i8', ('time',))
+    time_var.units = TIME_UNITS
+    time_var.calendar = 'proleptic_gregorian'
+    time_var[:] = np.asarray(times, dtype=np.int64)
+
+    link_var = nc.createVariable('link', str if link_dtype is str else 'i8', ('link',))
+    link_var.cf_role = 'timeseries_id'
+    link_var[:] = np.array(links, dtype=object if link_dtype is str else np.int64)
+
+    row_size = nc.createVariable('row_size', 'i4', ('link',), fill_value=0)
+    row_size.long_name = 'number of observations for this link'
+    row_size.sample_dimension = 'obs'
+
+    obs_storage = {'chunksizes': (OBS_CHUNK,)}
+    if compression_level:
+        obs_storage.update(zlib=True, complevel=int(compression_level), shuffle=True)
+
+    time_index = nc.createVariable('time_index', 'i4', ('obs',), **obs_storage)
+    time_index.long_name = 'position of the observation on the time axis'
+
+    spec = packing_spec(packing)
+    for name, long_name in [('RxLevel', 'Received Signal Level'), ('TxLevel', 'Transmitted Signal Level')]:
+        var = nc.createVariable(name, spec['dtype'], ('obs',), fill_value=spec['fill_value'], **obs_storage)
+        var.setncatts(spec['attrs'])
+        var.units = 'dBm'
+        var.long_name = long_name
+
+    nc.description = 'Radio link measurements'
+    nc.created = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    nc.source_file = source_file
+    nc.storage_layout = 'contiguous_ragged'
+    return nc
+
+
+def append_ragged_links(nc, link_start, rx, tx):
+    """
+    Append the observations of a block of consecutive links.
+
+    Blocks must be appended in link order. Cells where both RxLevel and TxLevel
+    are NaN are not stored; links never appended keep a row_size of 0.
+
+    Args:
+        nc (Dataset): File created by create_ragged_netcdf, open for writing
+        link_start (int): Position of the first link of the block
+        rx (np.ndarray): RxLevel over the full time axis, shape (time, links in block)
+        tx (np.ndarray): TxLevel with the same shape
+
+    Returns:
+        int: Number of observations appended
+    """
+    observed = ~(np.isnan(rx) & np.isnan(tx))
+    link_pos, time_pos = np.nonzero(observed.T)
+
+    obs_start = len(nc.dimensions['obs'])
+    obs_stop = obs_start + len(time_pos)
+
+    nc['row_size'][link_start:link_start + rx.shape[1]] = observed.sum(axis=0)
+    if len(time_pos):
+        nc['time_index'][obs_start:obs_stop] = time_pos
+        write_region(nc['RxLevel'], slice(obs_start, obs_stop), rx[time_pos, link_pos])
+        write_region(nc['TxLevel'], slice(obs_start, obs_stop), tx[time_pos, link_pos])
+
+    return len(time_pos)
+
+
+def write_ragged_netcdf(path, times, links, rx, tx, attrs=None, compression_level=4, packing=None,
+                        block_links=256):
+    """
+    Write dense (time, link) arrays to a new file in the ragged layout
+
+    Args:
+        path (str): File to create
+        times (np.ndarray): Time axis as datetime64 values
+        links (np.ndarray): Link labels
+        rx (np.ndarray): RxLevel, shape (time, link)
+        tx (np.ndarray): TxLevel, shape (time, link)
+        attrs (dict, optional): Global attributes to store
+        compression_level (int): zlib level of the observation variables
+        packing (str, optional): On-disk type of RxLevel/TxLevel
+        block_links (int): Number of links converted at a time
+
+    Returns:
+        int: Number of stored observations
+    """
+    links = np.asarray(links)
+    link_dtype = np.int64 if np.issubdtype(links.dtype, np.integer) else str
+    seconds = np.asarray(times).astype('datetime64[s]').astype(np.int64)
+
+    nc = create_ragged_netcdf(path, seconds, links, link_dtype, compression_level=compression_level,
+                              packing=packing)
+    try:
+        for name, value in (attrs or {}).items():
+            if name != 'storage_layout':
+                nc.setncattr(name, value)
+
+        n_obs = 0
+        for start in range(0, len(links), block_links):
+            n_obs += append_ragged_links(nc, start, rx[:, start:start + block_links], tx[:, start:start + block_links])
+    finally:
+        nc.close()
+
+    return n_obs
+
+
+class RaggedLinkDataset:
+    """
+    Read-only view of a ragged file with the per-link access of an xarray Dataset.
+
+    ds.link, ds.time, ds.dims, ds.attrs and ds['RxLevel'].sel(link=...) (or
+    ds.RxLevel.sel(link=...)) behave like their xarray counterparts on a dense
+    file: a selected link is expanded onto the full time axis with NaN where it
+    has no observation, and a repeated link label returns a (time, link) array.
+    Only the observations of the requested link are read from disk.
+    """
+
+    def __init__(self, path):
+        self._nc = Dataset(path, 'r')
+        time_var = self._nc['time']
+        raw_times = np.asarray(time_var[:])
+        if getattr(time_var, 'units', None) == TIME_UNITS:
+            times = pd.to_datetime(raw_times, unit='s')
+        else:
+            times = pd.DatetimeIndex(num2date(raw_times, time_var.units, getattr(time_var, 'calendar', 'standard'),
+                                              only_use_cftime_datetimes=False, only_use_python_datetimes=True))
+
+        links = np.asarray(self._nc['link'][:])
+        self.time = xr.DataArray(times.values.astype('datetime64[ns]'), dims='time', name='time')
+        self.link = xr.DataArray(links, dims='link', name='link')
+        self.coords = {'time': self.time, 'link': self.link}
+        self.dims = {'time': len(times), 'link': len(links)}
+        self.sizes = self.dims
+        self.attrs = {name: self._nc.getncattr(name) for name in self._nc.ncattrs()}
+        self.data_vars = ('RxLevel', 'TxLevel')
+        self.variables = ['time', 'link'] + list(self.data_vars)
+
+        row_size = read_region(self._nc['row_size'], slice(None)).astype(np.int64)
+        self._offsets = np.concatenate([[0], np.cumsum(row_size)])
+        self.n_obs = int(self._offsets[-1])
+
+    def __getitem__(self, name):
+        if name in self.coords:
+            return self.coords[name]
+        if name not in self.data_vars:
+            raise KeyError(name)
+        return RaggedVariable(self, name)
+
+    def __getattr__(self, name):
+        if name in ('RxLevel', 'TxLevel'):
+            return self[name]
+        raise AttributeError(name)
+
+    def __contains__(self, name):
+        return name in self.variables
+
+    def link_series(self, name, position):
+        """Values of one variable for the link at the given position, over the full time axis"""
+        series = np.full(self.dims['time'], np.nan)
+        start, stop = self._offsets[position], self._offsets[position + 1]
+        if stop > start:
+            time_index = read_region(self._nc['time_index'], slice(start, stop))
+            series[time_index] = read_region(self._nc[name], slice(start, stop))
+        return series
+
+    def read_window(self, name, time_start, time_stop, positions):
+        """
+        Values of one variable for a time range and a set of links, reading only their observations
+
+        Args:
+            name (str): 'RxLevel' or 'TxLevel'
+            time_start (int): First position on the time axis
+            time_stop (int): Position after the last one on the time axis
+            positions (array-like): Positions on the link axis
+
+        Returns:
+            np.ndarray: (time_stop - time_start, len(positions)) array, NaN where there is no observation
+        """
+        window = np.full((time_stop - time_start, len(positions)), np.nan)
+        for column, position in enumerate(positions):
+            # Observations of a link are in time order, so the window is one contiguous run
+            start = self._search_time_index(self._offsets[position], self._offsets[position + 1], time_start)
+            stop = self._search_time_index(start, self._offsets[position + 1], time_stop)
+            if stop > start:
+                time_index = read_region(self._nc['time_index'], slice(start, stop))
+                window[time_index - time_start, column] = read_region(self._nc[name], slice(start, stop))
+        return window
+
+    def _search_time_index(self, start, stop, time_position):
+        """
+        First observation in start:stop whose time_index is >= time_position
+
+        Bisects on single values of the on-disk time_index until at most OBS_CHUNK
+        observations remain, so a long series is never read whole to find a window.
+        """
+        time_index = self._nc['time_index']
+        while stop - start > OBS_CHUNK:
+            middle = (start + stop) // 2
+            if int(time_index[middle]) < time_position:
+                start = middle + 1
+            else:
+                stop = middle
+        if stop == start:
+            return start
+        return start + int(np.searchsorted(read_region(time_index, slice(start, stop)), time_position))
+
+    def storage(self):
+        """compression_level and packing of the observation variables, as taken by create_ragged_netcdf"""
+        var = self._nc['RxLevel']
+        filters = var.filters() or {}
+        return {'compression_level': filters.get('complevel', 0) if filters.get('zlib') else 0,
+                'packing': {'i2': 'int16', 'f4': 'float32'}.get(var.dtype.str[1:])}
+
+    def close(self):
+        self._nc.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class RaggedVariable:
+    """RxLevel or TxLevel of a RaggedLinkDataset, selectable by link"""
+
+    def __init__(self, dataset, name):
+        self._dataset = dataset
+        self.name = name
+        var = dataset._nc[name]
+        self.attrs = {attr: var.getncattr(attr) for attr in ('units', 'long_name') if attr in var.ncattrs()}
+        self.dims = ('time', 'link')
+
+    @property
+    def values(self):
+        """The full (time, link) array, NaN where a link has no observation"""
+        nc = self._dataset._nc
+        offsets = self._dataset._offsets
+        values = np.full((self._dataset.dims['time'], self._dataset.dims['link']), np.nan)
+        obs_link = np.repeat(np.arange(self._dataset.dims['link']), np.diff(offsets))
+        values[read_region(nc['time_index'], slice(None)), obs_link] = read_region(nc[self.name], slice(None))
+        return values
+
+    def isel(self, link):
+        """
+        Columns of the links at the given positions, expanded onto the full time axis
+
+        Args:
+            link (array-like): Positions on the link axis
+
+        Returns:
+            xr.DataArray: (time, link) array
+        """
+        positions = np.atleast_1d(link)
+        columns = [self._dataset.link_series(self.name, position) for position in positions]
+        values = np.stack(columns, axis=1) if columns else np.empty((self._dataset.dims['time'], 0))
+        return xr.DataArray(values, dims=('time', 'link'),
+                            coords={'time': self._dataset.time.values, 'link': self._dataset.link.values[positions]},
+                            name=self.name, attrs=self.attrs)
+
+    def sel(self, link):
+        """
+        Time series of one link, expanded onto the full time axis
+
+        Args:
+            link: Link label, compared like xarray's sel
+
+        Returns:
+            xr.DataArray: (time,) series, or (time, link) if the label is repeated
+        """
+        positions = np.flatnonzero(self._dataset.link.values == link)
+        if len(positions) == 0:
+            raise KeyError(f"'{link}' not found in link")
+
+        columns = [self._dataset.link_series(self.name, position) for position in positions]
+        time = self._dataset.time.values
+        if len(positions) == 1:
+            return xr.DataArray(columns[0], dims='time', coords={'time': time, 'link': link},
+                                name=self.name, attrs=self.attrs)
+        return xr.DataArray(np.stack(columns, axis=1), dims=('time', 'link'),
+                            coords={'time': time, 'link': self._dataset.link.values[positions]},
+                            name=self.name, attrs=self.attrs)
+
+
+def open_link_dataset(path):
+    """
+    Open a link NetCDF file whatever its layout.
+
+    Dense files are opened with xarray; ragged files return a RaggedLinkDataset
+    with the same per-link access (ds.link, ds.time, ds.RxLevel.sel(link=...)).
+    """
+    if is_ragged(path):
+        return RaggedLinkDataset(path)
+    return xr.open_dataset(path)
@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from netCDF4 import Dataset
+
+from benchmarks import make_synthetic_csv
+from create_netcdf_file import DATETIME_FORMAT, append_csv_to_netcdf, memory_efficient_csv_to_netcdf
+from netcdf_layout import packing_spec
+from remove_duplicates import clean_netcdf
+from sparse_storage import is_ragged, open_link_dataset
+
+
+def _split_drops(tmp_path, coverage):
+    """A synthetic dump split into an archive part and a later drop that overlaps it and adds a link"""
+    full_csv = str(tmp_path / 'full.csv')
+    make_synthetic_csv(full_csv, num_times=120, num_links=20, coverage=coverage)
+    df = pd.read_csv(full_csv, sep='\t')
+
+    extra = df[df['KEY10NEW'] == 1000].tail(30).assign(KEY10NEW=1020)
+    overlap = df.iloc[len(df) // 2 - 50:len(df) // 2].assign(RxLevel=lambda frame: frame['RxLevel'] + 1)
+    archive, drop = df.iloc[:len(df) // 2], pd.concat([df.iloc[len(df) // 2:], extra, overlap])
+
+    paths = {name: str(tmp_path / f'{name}.csv') for name in ('archive', 'drop', 'all')}
+    archive.to_csv(paths['archive'], sep='\t', index=False)
+    drop.to_csv(paths['drop'], sep='\t', index=False)
+    pd.concat([archive, drop]).to_csv(paths['all'], sep='\t', index=False)
+    return paths
+
+
+def _values(path):
+    """Time axis, link axis and readings of a file, links in sorted order (append adds new links at the end)"""
+    with open_link_dataset(path) as ds:
+        order = np.argsort(ds.link.values, kind='stable')
+        return ds.time.values, ds.link.values[order], ds['RxLevel'].values[:, order], ds['TxLevel'].values[:, order]
+
+
+@pytest.mark.parametrize('coverage', [0.1, 0.8])
+def test_append_to_default_archive(tmp_path, coverage):
+    paths = _split_drops(tmp_path, coverage)
+    archive = str(tmp_path / 'archive.nc')
+    reference = str(tmp_path / 'reference.nc')
+
+    memory_efficient_csv_to_netcdf(paths['archive'], archive)
+    assert is_ragged(archive) == (coverage < 0.3)
+
+    append_csv_to_netcdf(archive, paths['drop'])
+    memory_efficient_csv_to_netcdf(paths['all'], reference)
+
+    assert is_ragged(archive) == (coverage < 0.3)
+    for appended, expected in zip(_values(archive), _values(reference)):
+        np.testing.assert_array_equal(appended, expected)
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(path) for path in paths.values()] + ['full.csv'] +
+        [name + suffix for name in ('archive.nc', 'reference.nc') for suffix in ('', '.links.csv')])
+
+
+def test_failed_append_leaves_archive_untouched(tmp_path):
+    paths = _split_drops(tmp_path, 0.1)
+    archive = str(tmp_path / 'archive.nc')
+    memory_efficient_csv_to_netcdf(paths['archive'], archive)
+    before = _values(archive)
+
+    bad_csv = str(tmp_path / 'bad.csv')
+    with open(paths['drop']) as source, open(bad_csv, 'w') as target:
+        target.write(source.read() + 'not a date\t1000\t-50\t10\n')
+    with pytest.raises(ValueError):
+        append_csv_to_netcdf(archive, bad_csv)
+
+    for kept, expected in zip(_values(archive), before):
+        np.testing.assert_array_equal(kept, expected)
+    assert not [name for name in os.listdir(tmp_path) if name.startswith('archive.nc.') and
+                not name.endswith('.links.csv')]
+
+
+def _source_values(csv_file, times, links):
+    """RxLevel and TxLevel of a raw CSV (the last reading of a cell wins) on the axes of a file"""
+    df = pd.read_csv(csv_file, sep='\t').drop_duplicates(['DATETIME_ID', 'KEY10NEW'], keep='last')
+    df['DATETIME_ID'] = pd.to_datetime(df['DATETIME_ID'], format=DATETIME_FORMAT)
+    df['KEY10NEW'] = df['KEY10NEW'].astype(np.int64)
+    grid = df.pivot(index='DATETIME_ID', columns='KEY10NEW')
+    return [grid[name].reindex(index=times, columns=links).values for name in ('RxLevel', 'TxLevel')]
+
+
+def _assert_round_trip(path, csv_file, packing):
+    """Values of a packed file decode to within 0.05 dB of the CSV, with NaN exactly where it has no reading"""
+    with Dataset(path, 'r') as nc:
+        assert nc['RxLevel'].dtype == packing_spec(packing)['dtype']
+    times, links, rx, tx = _values(path)
+    for decoded, source in zip((rx, tx), _source_values(csv_file, times, links)):
+        np.testing.assert_array_equal(np.isnan(decoded), np.isnan(source))
+        assert np.nanmax(np.abs(decoded - source)) <= 0.05
+
+
+@pytest.mark.parametrize('coverage', [0.1, 0.8])
+@pytest.mark.parametrize('packing', ['int16', 'float32'])
+def test_packed_round_trip(tmp_path, packing, coverage):
+    paths = _split_drops(tmp_path, coverage)
+    written, cleaned, appended = (str(tmp_path / f'{name}.nc') for name in ('written', 'cleaned', 'appended'))
+
+    memory_efficient_csv_to_netcdf(paths['all'], written, packing=packing)
+    _assert_round_trip(written, paths['all'], packing)
+
+    clean_netcdf(written, cleaned, packing=packing)
+    _assert_round_trip(cleaned, paths['all'], packing)
+
+    memory_efficient_csv_to_netcdf(paths['archive'], appended, packing=packing)
+    append_csv_to_netcdf(appended, paths['drop'], packing=packing)
+    _assert_round_trip(appended, paths['all'], packing)